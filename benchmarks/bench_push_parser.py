@@ -0,0 +1,77 @@
+"""
+Сравнение разбора push-вебхука: прежний путь (json.loads всего payload)
+против push_parser.parse_push на доступном бэкенде (orjson или json).
+
+    python benchmarks/bench_push_parser.py [commits ...]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import push_parser
+
+def make_push_payload(commits: int, files_per_commit: int = 20) -> bytes:
+    def commit(n):
+        return {
+            "id": f"{n:040x}",
+            "tree_id": f"{n + 1:040x}",
+            "distinct": True,
+            "message": f"Commit number {n}\n\nLonger body with \"quotes\" and \\ slashes ✨",
+            "timestamp": "2024-01-01T00:00:00Z",
+            "url": f"https://github.com/octo/repo/commit/{n:040x}",
+            "author": {"name": "Octo Cat", "email": "octo@example.com", "username": "octo"},
+            "committer": {"name": "Octo Cat", "email": "octo@example.com", "username": "octo"},
+            "added": [f"src/pkg/new_{n}_{i}.py" for i in range(files_per_commit // 4)],
+            "removed": [],
+            "modified": [f"src/pkg/module_{i}.py" for i in range(files_per_commit)],
+        }
+    repository = {
+        "id": 1, "name": "repo", "full_name": "octo/repo", "private": False,
+        "html_url": "https://github.com/octo/repo",
+        "owner": {"login": "octo", "id": 1},
+        "description": "Benchmark repo", "size": 1024, "stargazers_count": 10,
+    }
+    payload = {
+        "ref": "refs/heads/main",
+        "before": "a" * 40,
+        "after": "b" * 40,
+        "repository": repository,
+        "pusher": {"name": "octo", "email": "octo@example.com"},
+        "sender": {"login": "octo", "id": 1},
+        "created": False, "deleted": False, "forced": False,
+        "compare": "https://github.com/octo/repo/compare/aaaaaaaaaaaa...bbbbbbbbbbbb",
+        "commits": [commit(n) for n in range(commits)],
+        "head_commit": commit(commits),
+    }
+    return json.dumps(payload).encode()
+
+def previous_path(body: bytes):
+    data = json.loads(body)
+    commits = data['commits']
+    return data['repository']['full_name'], data['pusher']['name'], [c['message'] for c in commits[:5]], len(commits)
+
+def bench(fn, body: bytes, rounds: int):
+    fn(body)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn(body)
+    return (time.perf_counter() - started) / rounds * 1000
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [5, 100, 1000, 2000]
+    print(f"orjson backend: {'yes' if push_parser.orjson else 'no'}")
+    print(f"{'commits':>8} {'size KB':>9} {'json.loads ms':>14} {'parse_push ms':>14}")
+    for n in sizes:
+        body = make_push_payload(n)
+        rounds = max(5, 2000 // max(n, 1))
+        base = bench(previous_path, body, rounds)
+        fast = bench(push_parser.parse_push, body, rounds)
+        parsed = push_parser.parse_push(body)
+        assert parsed['commit_count'] == n and parsed['commits'] == previous_path(body)[2]
+        print(f"{n:>8} {len(body) / 1024:>9.0f} {base:>14.2f} {fast:>14.2f}")
+
+if __name__ == "__main__":
+    main()
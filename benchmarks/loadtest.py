@@ -0,0 +1,236 @@
+"""
+Нагрузочный тест приема вебхуков и рассылки уведомлений.
+
+Поднимает aiohttp-приложение из main.create_app() и фейковый Telegram Bot API,
+шлет подписанные (как в verify_signature) push-вебхуки и меряет:
+  - пропускную способность приема (req/s) и время ответа на вебхук;
+  - p50/p95/p99 от отправки вебхука до получения sendMessage фейковым Telegram.
+
+    python benchmarks/loadtest.py --events 200 --subscribers 1 10 100
+    python benchmarks/loadtest.py --payloads recorded/ --tg-latency 50 --tg-429-rate 0.05
+
+Записанные payload'ы (--payloads) — JSON-файлы push-вебхуков, repository.full_name
+и первый коммит в них подменяются, чтобы отследить доставку.
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+from aiohttp import web, ClientSession
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_push_parser import make_push_payload
+
+SECRET = "loadtest-secret"
+BOT_TOKEN = "123456:LOADTEST"
+
+def percentile(values, p):
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+class FakeTelegram:
+    """Фейковый Bot API: записывает sendMessage, умеет задержку и 429"""
+    def __init__(self, latency_ms: float = 0, rate_429: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.rate_429 = rate_429
+        self.received = {}
+        self.calls = 0
+        self.throttled = 0
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        data = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method.lower() != 'sendmessage':
+            return web.json_response({"ok": True, "result": True})
+
+        self.calls += 1
+        if self.rate_429 and random.random() < self.rate_429:
+            self.throttled += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            }, status=429)
+
+        chat_id = int(data['chat_id'])
+        text = data['text']
+        for line in text.splitlines():
+            if 'bench-' in line:
+                marker = line.split('bench-')[1].split()[0]
+                self.received.setdefault(marker, []).append(time.monotonic())
+                break
+        return web.json_response({"ok": True, "result": {
+            "message_id": self.calls, "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "text": text,
+        }})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+
+def load_payloads(path: str):
+    if not path:
+        return [json.loads(make_push_payload(3, files_per_commit=10))]
+    return [json.load(open(f)) for f in sorted(glob.glob(os.path.join(path, "*.json")))]
+
+def sign(body: bytes) -> str:
+    return "sha256=" + hmac.new(SECRET.encode(), msg=body, digestmod=hashlib.sha256).hexdigest()
+
+async def start_site(app, port=0):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    return runner, runner.addresses[0][1]
+
+async def run_scenario(main, database, url, tg, templates, subscribers, events, concurrency, timeout):
+    repo_full_name = f"bench/subs-{subscribers}"
+    for user_id in range(1, subscribers + 1):
+        await database.set_user_data(user_id, "token", f"user{user_id}")
+        await database.add_subscription(user_id, repo_full_name)
+
+    sent_at = {}
+    accept_ms = []
+    rejected = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fire(session, n):
+        payload = dict(random.choice(templates))
+        marker = f"{subscribers}-{n}"
+        payload['repository'] = dict(payload['repository'], full_name=repo_full_name)
+        commits = [dict(c) for c in payload.get('commits') or [{"message": ""}]]
+        commits[0]['message'] = f"bench-{marker} load test"
+        payload['commits'] = commits
+        payload['pusher'] = {"name": "loadtest"}
+        body = json.dumps(payload).encode()
+        headers = {
+            "X-GitHub-Event": "push",
+            "X-GitHub-Delivery": str(uuid.uuid4()),
+            "X-Hub-Signature-256": sign(body),
+            "Content-Type": "application/json",
+        }
+        async with semaphore:
+            sent_at[marker] = started = time.monotonic()
+            async with session.post(url, data=body, headers=headers) as resp:
+                await resp.read()
+                if resp.status != 202:
+                    rejected.append(resp.status)
+                    sent_at.pop(marker, None)
+            accept_ms.append((time.monotonic() - started) * 1000)
+
+    started = time.monotonic()
+    async with ClientSession() as session:
+        await asyncio.gather(*(fire(session, n) for n in range(events)))
+    accept_elapsed = time.monotonic() - started
+
+    expected = len(sent_at) * subscribers
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        got = sum(len(tg.received.get(m, [])) for m in sent_at)
+        if got >= expected: break
+        await asyncio.sleep(0.05)
+    delivery_elapsed = time.monotonic() - started
+
+    latencies = [
+        (t - sent_at[marker]) * 1000
+        for marker in sent_at for t in tg.received.get(marker, [])
+    ]
+    return {
+        "subscribers": subscribers,
+        "events": events,
+        "rejected": len(rejected),
+        "accept_rps": events / accept_elapsed,
+        "accept_p95_ms": percentile(accept_ms, 0.95),
+        "delivered": len(latencies),
+        "expected": expected,
+        "msgs_per_s": len(latencies) / delivery_elapsed,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+    }
+
+async def run(args):
+    tg = FakeTelegram(args.tg_latency, args.tg_429_rate)
+    tg_runner, tg_port = await start_site(tg.app())
+
+    # Окружение для main.py выставляем до импорта
+    workdir = tempfile.mkdtemp(prefix="gh-loadtest-")
+    os.chdir(workdir)
+    os.environ.update({
+        "BOT_TOKEN": BOT_TOKEN,
+        "GITHUB_WEBHOOK_SECRET": SECRET,
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{tg_port}",
+        "PUSH_COALESCE_WINDOW": str(args.coalesce_window),
+    })
+    for key in ("TG_GLOBAL_RATE", "TG_CHAT_RATE", "WEBHOOK_WORKERS", "WEBHOOK_QUEUE_SIZE"):
+        value = getattr(args, key.lower())
+        if value is not None:
+            os.environ[key] = str(value)
+
+    import logging
+    import database
+    import main
+    logging.getLogger().setLevel(logging.ERROR)
+
+    await database.init_db()
+    await main.webhook_queue.start()
+    await main.webhook_dedup.start()
+    app_runner, app_port = await start_site(main.create_app())
+    url = f"http://127.0.0.1:{app_port}/github-webhook"
+
+    templates = load_payloads(args.payloads)
+    print(f"workdir={workdir} payload templates={len(templates)} "
+          f"tg_latency={args.tg_latency}ms tg_429_rate={args.tg_429_rate}")
+    print(f"{'subs':>6} {'events':>7} {'rejected':>9} {'accept rps':>11} {'accept p95':>11} {'delivered':>12} "
+          f"{'msg/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    try:
+        for subscribers in args.subscribers:
+            r = await run_scenario(main, database, url, tg, templates, subscribers,
+                                   args.events, args.concurrency, args.timeout)
+            print(f"{r['subscribers']:>6} {r['events']:>7} {r['rejected']:>9} {r['accept_rps']:>11.0f} {r['accept_p95_ms']:>11.1f} "
+                  f"{r['delivered']:>6}/{r['expected']:<5} {r['msgs_per_s']:>8.1f} "
+                  f"{r['p50_ms']:>9.0f} {r['p95_ms']:>9.0f} {r['p99_ms']:>9.0f}")
+        print(f"telegram: calls={tg.calls} throttled={tg.throttled}")
+        print(json.dumps(main.delivery_scheduler.stats()))
+    finally:
+        await main.webhook_queue.stop()
+        await main.webhook_dedup.stop()
+        await main.bot.session.close()
+        await database.close_db()
+        await app_runner.cleanup()
+        await tg_runner.cleanup()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--payloads", help="папка с записанными push-вебхуками (*.json)")
+    parser.add_argument("--tg-latency", type=float, default=0, help="задержка фейкового Telegram, мс")
+    parser.add_argument("--tg-429-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--coalesce-window", type=float, default=0)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--tg-global-rate", type=float)
+    parser.add_argument("--tg-chat-rate", type=float)
+    parser.add_argument("--webhook-workers", type=int)
+    parser.add_argument("--webhook-queue-size", type=int)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -1,86 +1,469 @@
+import asyncio
 import aiosqlite
 import logging
+import os
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 
 DB_NAME = "bot_storage.db"
 
-async def init_db():
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                github_token TEXT,
-                github_username TEXT,
-                ignore_own_pushes BOOLEAN DEFAULT 0,
-                repo_filter TEXT DEFAULT 'all'
-            )
-        """)
-        
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS subscriptions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                repo_full_name TEXT,
-                FOREIGN KEY(user_id) REFERENCES users(user_id),
-                UNIQUE(user_id, repo_full_name)
-            )
-        """)
-        
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS servers (
-                user_id INTEGER PRIMARY KEY,
-                host TEXT,
-                port INTEGER DEFAULT 22,
-                username TEXT,
-                auth_type TEXT,
-                auth_data TEXT,
-                FOREIGN KEY(user_id) REFERENCES users(user_id)
-            )
-        """)
+# Пул соединений: один писатель (запись сериализуется) + несколько читателей.
+# В WAL-режиме читатели не блокируются писателем.
+DB_READERS = int(os.getenv("DB_READERS", 4))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", 16384))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", 128 * 1024 * 1024))
+DB_STATEMENT_CACHE = 256
+# Обслуживание: ANALYZE раз в DB_ANALYZE_INTERVAL сек, VACUUM не чаще DB_VACUUM_INTERVAL
+# и только если свободных страниц не меньше DB_VACUUM_MIN_FREE от размера файла. 0 — выключено.
+DB_ANALYZE_INTERVAL = int(os.getenv("DB_ANALYZE_INTERVAL", 6 * 3600))
+DB_VACUUM_INTERVAL = int(os.getenv("DB_VACUUM_INTERVAL", 7 * 24 * 3600))
+DB_VACUUM_MIN_FREE = float(os.getenv("DB_VACUUM_MIN_FREE", 0.2))
+
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size={DB_MMAP_SIZE}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Group commit: мутации из разных корутин копятся WRITE_BATCH_WINDOW_MS
+# и коммитятся одной транзакцией (не больше WRITE_BATCH_MAX за раз)
+WRITE_BATCH_WINDOW_MS = float(os.getenv("WRITE_BATCH_WINDOW_MS", 2))
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", 256))
+
+_writer = None
+_write_lock = asyncio.Lock()
+_readers = None
+_pool_lock = asyncio.Lock()
+
+_batch = []
+_batch_task = None
+_batch_stats = {'batches': 0, 'jobs': 0, 'failed': 0, 'max_batch': 0}
+
+# Кэш записей users (write-through): почти каждый хендлер начинается с get_user
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 5000))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 300))
+_user_cache = OrderedDict()
+_user_cache_stats = {'hits': 0, 'misses': 0}
+# Счетчик изменений users: get_user не кладет в кэш строку, если пока он читал, ее успели поменять
+_user_cache_generation = 0
+
+# Сессии веб-редактора: срок жизни ссылки, сколько еще помнить истекшую (для 410),
+# период чистки и размер черновика, с которого он хранится сжатым
+EDITOR_SESSION_TTL = int(os.getenv("EDITOR_SESSION_TTL", 24 * 3600))
+EDITOR_SESSION_KEEP_EXPIRED = int(os.getenv("EDITOR_SESSION_KEEP_EXPIRED", 7 * 24 * 3600))
+EDITOR_SWEEP_INTERVAL = int(os.getenv("EDITOR_SWEEP_INTERVAL", 600))
+EDITOR_DRAFT_COMPRESS_MIN = int(os.getenv("EDITOR_DRAFT_COMPRESS_MIN", 4096))
+
+# Индекс repo_full_name -> {user_id}, чтобы не ходить в БД за репо без подписчиков.
+# Загружается в init_db, пополняется в add_subscription.
+_subscribers_index = {}
+_subscribers_index_loaded = False
+
+async def _connect():
+    # sqlite3 кэширует подготовленные запросы на соединении — с долгоживущими
+    # соединениями одинаковые запросы не компилируются заново
+    db = await aiosqlite.connect(DB_NAME, cached_statements=DB_STATEMENT_CACHE)
+    db.row_factory = aiosqlite.Row
+    for pragma in _PRAGMAS:
+        await db.execute(pragma)
+    return db
+
+async def _open_pool():
+    global _writer, _readers
+    async with _pool_lock:
+        if _writer is not None: return
+        _writer = await _connect()
+        readers = asyncio.Queue()
+        for _ in range(DB_READERS):
+            readers.put_nowait(await _connect())
+        _readers = readers
+
+async def close_db():
+    global _writer, _readers
+    if _batch_task is not None:
+        await _batch_task
+    async with _pool_lock:
+        if _writer is None: return
+        async with _write_lock:
+            await _writer.close()
+        while not _readers.empty():
+            await _readers.get_nowait().close()
+        _writer, _readers = None, None
+
+@asynccontextmanager
+async def _read():
+    if _readers is None:
+        await _open_pool()
+    db = await _readers.get()
+    try:
+        yield db
+    finally:
+        _readers.put_nowait(db)
+
+@asynccontextmanager
+async def _write():
+    """Сериализованная запись в транзакции: commit при выходе, rollback при ошибке"""
+    if _writer is None:
+        await _open_pool()
+    async with _write_lock:
+        try:
+            yield _writer
+            await _writer.commit()
+        except BaseException:
+            await _writer.rollback()
+            raise
 
+async def _batched(job):
+    """
+    Выполняет job(db) в общей транзакции группы и возвращает его результат
+    после commit. Каждый job под своим SAVEPOINT: ошибка откатывает только его.
+    """
+    global _batch_task
+    future = asyncio.get_running_loop().create_future()
+    _batch.append((job, future))
+    if _batch_task is None or _batch_task.done():
+        _batch_task = asyncio.create_task(_flush_batches())
+    return await future
+
+async def _flush_batches():
+    await asyncio.sleep(WRITE_BATCH_WINDOW_MS / 1000)
+    # Пока идет commit, новые мутации копятся в следующую группу
+    while _batch:
+        jobs = _batch[:WRITE_BATCH_MAX]
+        del _batch[:WRITE_BATCH_MAX]
+        results = []
+        try:
+            async with _write() as db:
+                await db.execute("BEGIN")
+                for job, future in jobs:
+                    await db.execute("SAVEPOINT job")
+                    try:
+                        results.append((future, await job(db), None))
+                    except Exception as e:
+                        await db.execute("ROLLBACK TO job")
+                        results.append((future, None, e))
+                    await db.execute("RELEASE job")
+        except Exception as e:
+            logging.error(f"DB write batch of {len(jobs)} failed: {e}")
+            _batch_stats['failed'] += len(jobs)
+            results = [(future, None, e) for _, future in jobs]
+
+        _batch_stats['batches'] += 1
+        _batch_stats['jobs'] += len(jobs)
+        _batch_stats['max_batch'] = max(_batch_stats['max_batch'], len(jobs))
+        for future, result, error in results:
+            if future.done(): continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+def write_batch_stats():
+    batches = _batch_stats['batches']
+    return {**_batch_stats, 'avg_batch': round(_batch_stats['jobs'] / batches, 2) if batches else 0.0}
+
+def _cache_user(user_id: int, user):
+    _user_cache[user_id] = (time.monotonic() + USER_CACHE_TTL, dict(user) if user else None)
+    _user_cache.move_to_end(user_id)
+    while len(_user_cache) > USER_CACHE_SIZE:
+        _user_cache.popitem(last=False)
+
+def _bump_user_generation():
+    global _user_cache_generation
+    _user_cache_generation += 1
+
+def _update_cached_user(user_id: int, **fields):
+    _bump_user_generation()
+    entry = _user_cache.get(user_id)
+    if entry and entry[1] is not None:
+        entry[1].update(fields)
+
+def invalidate_user(user_id: int = None):
+    """Сбросить кэш одного пользователя или весь (user_id=None)"""
+    _bump_user_generation()
+    if user_id is None:
+        _user_cache.clear()
+    else:
+        _user_cache.pop(user_id, None)
+
+def user_cache_stats():
+    total = _user_cache_stats['hits'] + _user_cache_stats['misses']
+    return {
+        **_user_cache_stats,
+        'size': len(_user_cache),
+        'hit_rate': round(_user_cache_stats['hits'] / total, 3) if total else 0.0,
+    }
+
+# Миграции схемы: (версия, [SQL]). Применяются по порядку в init_db,
+# номер последней примененной хранится в PRAGMA user_version.
+# Уже выпущенные миграции не меняем — только добавляем новые в конец.
+MIGRATIONS = [
+    # 1: исходная схема (на старых базах таблицы уже есть — IF NOT EXISTS)
+    (1, [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            github_token TEXT,
+            github_username TEXT,
+            ignore_own_pushes BOOLEAN DEFAULT 0,
+            repo_filter TEXT DEFAULT 'all'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            repo_full_name TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(user_id),
+            UNIQUE(user_id, repo_full_name)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS servers (
+            user_id INTEGER PRIMARY KEY,
+            host TEXT,
+            port INTEGER DEFAULT 22,
+            username TEXT,
+            auth_type TEXT,
+            auth_data TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(user_id)
+        )
+        """,
         # NEW: Сессии веб-редактора
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS editor_sessions (
-                uuid TEXT PRIMARY KEY,
-                user_id INTEGER,
-                owner TEXT,
-                repo TEXT,
-                path TEXT,
-                original_sha TEXT,
-                pending_content TEXT, -- Тут храним то, что пришло с веба
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        await db.commit()
+        """
+        CREATE TABLE IF NOT EXISTS editor_sessions (
+            uuid TEXT PRIMARY KEY,
+            user_id INTEGER,
+            owner TEXT,
+            repo TEXT,
+            path TEXT,
+            original_sha TEXT,
+            pending_content TEXT, -- Тут храним то, что пришло с веба
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Очередь входящих вебхуков (переживает рестарт)
+        """
+        CREATE TABLE IF NOT EXISTS webhook_deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            delivery_id TEXT,
+            event_type TEXT,
+            body BLOB,
+            received_at REAL
+        )
+        """,
+        # Уже принятые X-GitHub-Delivery (защита от повторных доставок)
+        """
+        CREATE TABLE IF NOT EXISTS webhook_seen (
+            delivery_id TEXT PRIMARY KEY,
+            seen_at REAL
+        )
+        """,
+        # Уведомления, которые не удалось доставить в Telegram
+        """
+        CREATE TABLE IF NOT EXISTS dead_letters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            payload TEXT,
+            error TEXT,
+            attempts INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    # 2: индексы под горячие запросы
+    (2, [
+        # get_subscribers / get_push_recipients на каждый вебхук: поиск по repo_full_name
+        # без обращения к таблице (UNIQUE(user_id, repo_full_name) для этого не подходит)
+        "CREATE INDEX IF NOT EXISTS idx_subscriptions_repo ON subscriptions(repo_full_name, user_id)",
+        # Поиск сессий редактора по возрасту (uuid уже PRIMARY KEY)
+        "CREATE INDEX IF NOT EXISTS idx_editor_sessions_created ON editor_sessions(created_at)",
+        # purge_seen_deliveries
+        "CREATE INDEX IF NOT EXISTS idx_webhook_seen_at ON webhook_seen(seen_at)",
+    ]),
+    # 3: черновики редактора выносим из editor_sessions (pending_content больше не пишется)
+    (3, [
+        """
+        CREATE TABLE IF NOT EXISTS editor_drafts (
+            uuid TEXT PRIMARY KEY,
+            content BLOB, -- TEXT или zlib, если compressed = 1
+            compressed INTEGER DEFAULT 0
+        )
+        """,
+        """
+        INSERT OR IGNORE INTO editor_drafts (uuid, content)
+        SELECT uuid, pending_content FROM editor_sessions WHERE pending_content IS NOT NULL
+        """,
+        "UPDATE editor_sessions SET pending_content = NULL WHERE pending_content IS NOT NULL",
+    ]),
+    # 4: состояния FSM aiogram (fsm_storage.SQLiteStorage)
+    (4, [
+        """
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data BLOB, -- JSON или zlib(JSON), если compressed = 1
+            compressed INTEGER DEFAULT 0,
+            updated_at REAL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states(updated_at)",
+    ]),
+]
+
+async def init_db():
+    async with _write() as db:
+        await _migrate(db)
+        await _load_subscribers_index(db)
     logging.info("💾 Database initialized.")
 
+async def _migrate(db):
+    # BEGIN IMMEDIATE: при RUN_MODE=web/bot процессы стартуют одновременно,
+    # версию перечитываем уже под блокировкой записи
+    await db.execute("BEGIN IMMEDIATE")
+    async with db.execute("PRAGMA user_version") as cursor:
+        version = (await cursor.fetchone())[0]
+
+    latest = MIGRATIONS[-1][0]
+    if version > latest:
+        logging.warning(f"⚠️ DB schema v{version} is newer than this code (v{latest})")
+        return
+
+    for target, statements in MIGRATIONS:
+        if target <= version: continue
+        for sql in statements:
+            await db.execute(sql)
+        await db.execute(f"PRAGMA user_version = {target}")
+        logging.info(f"💾 Schema migrated to v{target}")
+
+async def run_maintenance(vacuum: bool = False):
+    """ANALYZE обновляет статистику планировщика; VACUUM — только если свободных страниц много"""
+    started = time.monotonic()
+    async with _write() as db:
+        await db.execute("ANALYZE")
+    if vacuum:
+        async with _read() as db:
+            async with db.execute("PRAGMA page_count") as cursor:
+                pages = (await cursor.fetchone())[0]
+            async with db.execute("PRAGMA freelist_count") as cursor:
+                free = (await cursor.fetchone())[0]
+        if pages and free / pages >= DB_VACUUM_MIN_FREE:
+            async with _write() as db:
+                await db.execute("VACUUM")
+                await db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            logging.info(f"🧹 VACUUM: freed {free} of {pages} pages")
+    logging.info(f"🧹 DB maintenance done in {(time.monotonic() - started) * 1000:.0f} ms")
+
+async def maintenance_loop():
+    """Фоновое обслуживание БД (запускается в одном процессе — в процессе бота)"""
+    if DB_ANALYZE_INTERVAL <= 0: return
+    last_vacuum = time.monotonic()
+    while True:
+        await asyncio.sleep(DB_ANALYZE_INTERVAL)
+        vacuum = DB_VACUUM_INTERVAL > 0 and time.monotonic() - last_vacuum >= DB_VACUUM_INTERVAL
+        try:
+            await run_maintenance(vacuum)
+            if vacuum: last_vacuum = time.monotonic()
+        except Exception as e:
+            logging.error(f"DB maintenance failed: {e}")
+
+async def _load_subscribers_index(db):
+    global _subscribers_index_loaded
+    _subscribers_index.clear()
+    async with db.execute("SELECT repo_full_name, user_id FROM subscriptions") as cursor:
+        async for repo_full_name, user_id in cursor:
+            _subscribers_index.setdefault(repo_full_name, set()).add(user_id)
+    _subscribers_index_loaded = True
+
 # ... (Остальные методы set_user_data, get_user и т.д. ОСТАВЛЯЕМ КАК ЕСТЬ)
 # Я добавляю только новые методы для editor_sessions
 
+def _session_cutoff(ttl: int):
+    # created_at хранится как 'YYYY-MM-DD HH:MM:SS' (UTC), сравниваем строками
+    return f"-{ttl} seconds"
+
 async def create_editor_session(uuid: str, user_id: int, owner: str, repo: str, path: str, sha: str):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async def job(db):
         await db.execute("""
             INSERT INTO editor_sessions (uuid, user_id, owner, repo, path, original_sha)
             VALUES (?, ?, ?, ?, ?, ?)
         """, (uuid, user_id, owner, repo, path, sha))
-        await db.commit()
+    await _batched(job)
 
-async def get_editor_session(uuid: str):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM editor_sessions WHERE uuid = ?", (uuid,)) as cursor:
+async def get_editor_session(uuid: str, with_expired: bool = False):
+    """
+    Сессия вместе с черновиком (pending_content). Истекшая сессия -> None,
+    а с with_expired=True возвращается с expired=True (чтобы ответить 410, а не 404).
+    """
+    async with _read() as db:
+        async with db.execute("""
+            SELECT s.uuid, s.user_id, s.owner, s.repo, s.path, s.original_sha, s.created_at,
+                   d.content AS pending_content, d.compressed,
+                   s.created_at < datetime('now', ?) AS expired
+            FROM editor_sessions s
+            LEFT JOIN editor_drafts d ON d.uuid = s.uuid
+            WHERE s.uuid = ?
+        """, (_session_cutoff(EDITOR_SESSION_TTL), uuid)) as cursor:
             row = await cursor.fetchone()
-            return dict(row) if row else None
+    if not row: return None
+
+    session = dict(row)
+    session['expired'] = bool(session['expired'])
+    if session['expired'] and not with_expired:
+        return None
+    if session.pop('compressed'):
+        session['pending_content'] = zlib.decompress(session['pending_content']).decode('utf-8')
+    return session
 
 async def update_editor_content(uuid: str, content: str):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("UPDATE editor_sessions SET pending_content = ? WHERE uuid = ?", (content, uuid))
-        await db.commit()
+    # Черновики хранятся отдельно от editor_sessions, большие — сжатыми
+    compressed = len(content) >= EDITOR_DRAFT_COMPRESS_MIN
+    data = zlib.compress(content.encode('utf-8')) if compressed else content
+    async def job(db):
+        await db.execute("""
+            INSERT INTO editor_drafts (uuid, content, compressed) VALUES (?, ?, ?)
+            ON CONFLICT(uuid) DO UPDATE SET content = excluded.content, compressed = excluded.compressed
+        """, (uuid, data, int(compressed)))
+    await _batched(job)
 
 async def delete_editor_session(uuid: str):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with _write() as db:
+        await db.execute("DELETE FROM editor_drafts WHERE uuid = ?", (uuid,))
         await db.execute("DELETE FROM editor_sessions WHERE uuid = ?", (uuid,))
-        await db.commit()
+
+async def purge_editor_sessions():
+    """
+    Черновики истекших сессий удаляются сразу, сами строки (маленькие) —
+    через EDITOR_SESSION_KEEP_EXPIRED, до этого ссылка отвечает 410.
+    """
+    expired = _session_cutoff(EDITOR_SESSION_TTL)
+    forgotten = _session_cutoff(EDITOR_SESSION_TTL + EDITOR_SESSION_KEEP_EXPIRED)
+    async with _write() as db:
+        drafts = await db.execute("""
+            DELETE FROM editor_drafts WHERE uuid IN (
+                SELECT uuid FROM editor_sessions WHERE created_at < datetime('now', ?)
+            )
+        """, (expired,))
+        sessions = await db.execute(
+            "DELETE FROM editor_sessions WHERE created_at < datetime('now', ?)", (forgotten,)
+        )
+        return drafts.rowcount, sessions.rowcount
+
+async def editor_sweeper_loop():
+    """Фоновая чистка сессий редактора"""
+    while True:
+        try:
+            drafts, sessions = await purge_editor_sessions()
+            if drafts or sessions:
+                logging.info(f"🧹 Editor sweeper: {drafts} drafts, {sessions} sessions removed")
+        except Exception as e:
+            logging.error(f"Editor sweeper failed: {e}")
+        await asyncio.sleep(EDITOR_SWEEP_INTERVAL)
 
 # --- DUPLICATE HELPERS (чтобы файл был рабочим, если ты копируешь целиком) ---
 # Но ты просил NO TRUNCATION. 
@@ -88,59 +471,92 @@ async def delete_editor_session(uuid: str):
 # Чтобы не раздувать ответ до лимита, я вставлю ключевые методы, необходимые для работы.
 
 async def set_user_data(user_id: int, token: str, username: str):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("""
+    async with _write() as db:
+        async with db.execute("""
             INSERT INTO users (user_id, github_token, github_username) 
             VALUES (?, ?, ?) 
             ON CONFLICT(user_id) DO UPDATE SET 
                 github_token=excluded.github_token,
                 github_username=excluded.github_username
-        """, (user_id, token, username))
-        await db.commit()
+            RETURNING *
+        """, (user_id, token, username)) as cursor:
+            row = await cursor.fetchone()
+    _bump_user_generation()
+    _cache_user(user_id, row)
 
 async def get_user(user_id: int):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    entry = _user_cache.get(user_id)
+    if entry and entry[0] > time.monotonic():
+        _user_cache.move_to_end(user_id)
+        _user_cache_stats['hits'] += 1
+        return dict(entry[1]) if entry[1] else None
+
+    _user_cache_stats['misses'] += 1
+    generation = _user_cache_generation
+    async with _read() as db:
         async with db.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)) as cursor:
             row = await cursor.fetchone()
-            return dict(row) if row else None
+    # Запись во время чтения: строка могла устареть, в кэш ее не кладем
+    if generation == _user_cache_generation:
+        _cache_user(user_id, row)
+    return dict(row) if row else None
 
 async def toggle_ignore_own(user_id: int):
-    async with aiosqlite.connect(DB_NAME) as db:
-        async with db.execute("SELECT ignore_own_pushes FROM users WHERE user_id = ?", (user_id,)) as cursor:
-            row = await cursor.fetchone()
-            if not row: return False
-            new_val = not row[0]
-        await db.execute("UPDATE users SET ignore_own_pushes = ? WHERE user_id = ?", (new_val, user_id))
-        await db.commit()
-        return new_val
+    async def job(db):
+        async with db.execute("""
+            UPDATE users SET ignore_own_pushes = NOT COALESCE(ignore_own_pushes, 0)
+            WHERE user_id = ? RETURNING ignore_own_pushes
+        """, (user_id,)) as cursor:
+            return await cursor.fetchone()
+    row = await _batched(job)
+    if not row: return False
+    _update_cached_user(user_id, ignore_own_pushes=row[0])
+    return bool(row[0])
 
 async def toggle_repo_filter(user_id: int):
-    async with aiosqlite.connect(DB_NAME) as db:
-        async with db.execute("SELECT repo_filter FROM users WHERE user_id = ?", (user_id,)) as cursor:
-            row = await cursor.fetchone()
-            current = row[0] if row else 'all'
-        new_val = 'owner' if current == 'all' else 'all'
-        await db.execute("UPDATE users SET repo_filter = ? WHERE user_id = ?", (new_val, user_id))
-        await db.commit()
-        return new_val
+    async def job(db):
+        async with db.execute("""
+            UPDATE users SET repo_filter = CASE WHEN repo_filter = 'all' THEN 'owner' ELSE 'all' END
+            WHERE user_id = ? RETURNING repo_filter
+        """, (user_id,)) as cursor:
+            return await cursor.fetchone()
+    row = await _batched(job)
+    # Нет записи — как раньше: считаем, что был фильтр 'all'
+    new_val = row[0] if row else 'owner'
+    _update_cached_user(user_id, repo_filter=new_val)
+    return new_val
 
 async def add_subscription(user_id: int, repo_full_name: str):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async def job(db):
         await db.execute("""
             INSERT OR IGNORE INTO subscriptions (user_id, repo_full_name)
             VALUES (?, ?)
         """, (user_id, repo_full_name))
-        await db.commit()
+    await _batched(job)
+    _subscribers_index.setdefault(repo_full_name, set()).add(user_id)
 
 async def get_subscribers(repo_full_name: str):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with _read() as db:
         async with db.execute("SELECT user_id FROM subscriptions WHERE repo_full_name = ?", (repo_full_name,)) as cursor:
             rows = await cursor.fetchall()
             return [row[0] for row in rows]
 
+async def get_push_recipients(repo_full_name: str):
+    """Подписчики репо вместе с ignore_own_pushes и github_username одним запросом"""
+    if _subscribers_index_loaded and repo_full_name not in _subscribers_index:
+        return []
+    async with _read() as db:
+        async with db.execute("""
+            SELECT s.user_id, u.ignore_own_pushes, u.github_username
+            FROM subscriptions s
+            JOIN users u ON u.user_id = s.user_id
+            WHERE s.repo_full_name = ?
+        """, (repo_full_name,)) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
 async def set_server(user_id: int, host: str, port: int, username: str, auth_type: str, auth_data: str):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with _write() as db:
         await db.execute("""
             INSERT INTO servers (user_id, host, port, username, auth_type, auth_data) 
             VALUES (?, ?, ?, ?, ?, ?) 
@@ -151,16 +567,109 @@ async def set_server(user_id: int, host: str, port: int, username: str, auth_typ
                 auth_type=excluded.auth_type,
                 auth_data=excluded.auth_data
         """, (user_id, host, port, username, auth_type, auth_data))
-        await db.commit()
 
 async def get_server(user_id: int):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    async with _read() as db:
         async with db.execute("SELECT * FROM servers WHERE user_id = ?", (user_id,)) as cursor:
             row = await cursor.fetchone()
             return dict(row) if row else None
 
 async def delete_server(user_id: int):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with _write() as db:
         await db.execute("DELETE FROM servers WHERE user_id = ?", (user_id,))
-        await db.commit()
\ No newline at end of file
+
+# --- FSM STATES ---
+
+async def load_fsm_state(key: str, expired_before: float):
+    async with _read() as db:
+        async with db.execute(
+            "SELECT state, data, compressed, updated_at FROM fsm_states WHERE key = ? AND updated_at >= ?",
+            (key, expired_before)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+async def save_fsm_states(rows: list, deleted: list):
+    """rows: (key, state, data, compressed, updated_at)"""
+    async def job(db):
+        if rows:
+            await db.executemany("""
+                INSERT INTO fsm_states (key, state, data, compressed, updated_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    state = excluded.state,
+                    data = excluded.data,
+                    compressed = excluded.compressed,
+                    updated_at = excluded.updated_at
+            """, rows)
+        if deleted:
+            await db.executemany("DELETE FROM fsm_states WHERE key = ?", [(k,) for k in deleted])
+    await _batched(job)
+
+async def purge_fsm_states(expired_before: float):
+    async with _write() as db:
+        cursor = await db.execute("DELETE FROM fsm_states WHERE updated_at < ?", (expired_before,))
+        return cursor.rowcount
+
+# --- WEBHOOK QUEUE ---
+
+async def enqueue_delivery(delivery_id: str, event_type: str, body: bytes, received_at: float):
+    async def job(db):
+        cursor = await db.execute("""
+            INSERT INTO webhook_deliveries (delivery_id, event_type, body, received_at)
+            VALUES (?, ?, ?, ?)
+        """, (delivery_id, event_type, body, received_at))
+        return cursor.lastrowid
+    return await _batched(job)
+
+async def get_pending_deliveries(limit: int, after_id: int = 0, up_to_id: int = None):
+    async with _read() as db:
+        async with db.execute(
+            "SELECT * FROM webhook_deliveries WHERE id > ? AND id <= COALESCE(?, id) ORDER BY id LIMIT ?",
+            (after_id, up_to_id, limit)
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+async def last_delivery_id():
+    async with _read() as db:
+        async with db.execute("SELECT MAX(id) FROM webhook_deliveries") as cursor:
+            row = await cursor.fetchone()
+            return row[0] or 0
+
+async def count_pending_deliveries():
+    async with _read() as db:
+        async with db.execute("SELECT COUNT(*) FROM webhook_deliveries") as cursor:
+            row = await cursor.fetchone()
+            return row[0]
+
+async def delete_delivery(row_id: int):
+    async def job(db):
+        await db.execute("DELETE FROM webhook_deliveries WHERE id = ?", (row_id,))
+    await _batched(job)
+
+async def mark_delivery_seen(delivery_id: str, seen_at: float, expired_before: float):
+    """True, если id новый (или прошлая отметка старше TTL)"""
+    async def job(db):
+        cursor = await db.execute("""
+            INSERT INTO webhook_seen (delivery_id, seen_at) VALUES (?, ?)
+            ON CONFLICT(delivery_id) DO UPDATE SET seen_at = excluded.seen_at
+            WHERE webhook_seen.seen_at < ?
+        """, (delivery_id, seen_at, expired_before))
+        return cursor.rowcount > 0
+    return await _batched(job)
+
+async def unmark_delivery_seen(delivery_id: str):
+    async with _write() as db:
+        await db.execute("DELETE FROM webhook_seen WHERE delivery_id = ?", (delivery_id,))
+
+async def purge_seen_deliveries(expired_before: float):
+    async with _write() as db:
+        cursor = await db.execute("DELETE FROM webhook_seen WHERE seen_at < ?", (expired_before,))
+        return cursor.rowcount
+
+async def add_dead_letter(chat_id: int, payload: str, error: str, attempts: int):
+    async with _write() as db:
+        await db.execute("""
+            INSERT INTO dead_letters (chat_id, payload, error, attempts)
+            VALUES (?, ?, ?, ?)
+        """, (chat_id, payload, error, attempts))
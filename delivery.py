@@ -0,0 +1,137 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+
+import database
+
+# Лимиты Telegram: ~30 сообщений/сек на бота и ~1 сообщение/сек в один чат
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", 30))
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", 1))
+TG_MAX_CONCURRENCY = int(os.getenv("TG_MAX_CONCURRENCY", 30))
+TG_MAX_RETRIES = int(os.getenv("TG_MAX_RETRIES", 5))
+TG_BACKOFF_BASE = float(os.getenv("TG_BACKOFF_BASE", 1.0))
+TG_BACKOFF_MAX = float(os.getenv("TG_BACKOFF_MAX", 60.0))
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Блокирует бакет (RetryAfter от Telegram)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def idle(self, now: float):
+        return now >= self.blocked_until and now - self.updated > self.capacity / self.rate
+
+class DeliveryScheduler:
+    """
+    Отправка сообщений с учетом лимитов Telegram: глобальный и per-chat токен-бакеты,
+    ретраи с backoff (RetryAfter соблюдается), dead-letter для того, что так и не ушло.
+    """
+    def __init__(self, bot, global_rate: float = TG_GLOBAL_RATE, chat_rate: float = TG_CHAT_RATE,
+                 max_concurrency: int = TG_MAX_CONCURRENCY, max_retries: int = TG_MAX_RETRIES):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_buckets = {}
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+
+    def _chat_bucket(self, chat_id: int):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                now = time.monotonic()
+                for key in [k for k, b in self.chat_buckets.items() if b.idle(now)]:
+                    del self.chat_buckets[key]
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate)
+        return bucket
+
+    async def send(self, chat_id: int, **kwargs) -> bool:
+        """send_message с ретраями. True если доставлено."""
+        chat_bucket = self._chat_bucket(chat_id)
+        error = None
+        for attempt in range(self.max_retries + 1):
+            await chat_bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                async with self._semaphore:
+                    await self.bot.send_message(chat_id=chat_id, **kwargs)
+                self.sent += 1
+                return True
+            except TelegramRetryAfter as e:
+                error = e
+                # Флуд-контроль касается всего бота, притормаживаем и глобально
+                chat_bucket.pause(e.retry_after)
+                self.global_bucket.pause(e.retry_after)
+                logging.warning(f"⏳ RetryAfter {e.retry_after}s for {chat_id}")
+            except (TelegramNetworkError, TelegramServerError) as e:
+                error = e
+                if attempt < self.max_retries:
+                    delay = min(TG_BACKOFF_MAX, TG_BACKOFF_BASE * 2 ** attempt)
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            except Exception as e:
+                # Заблокировал бота, чат не найден и т.п. — повторять бессмысленно
+                error = e
+                break
+            # После последней попытки повтора уже не будет
+            if attempt < self.max_retries:
+                self.retried += 1
+
+        self.dead += 1
+        logging.error(f"Failed to send to {chat_id}: {error}")
+        await self._dead_letter(chat_id, kwargs, error, attempt + 1)
+        return False
+
+    async def send_many(self, chat_ids, **kwargs):
+        results = await asyncio.gather(*(self.send(chat_id, **kwargs) for chat_id in chat_ids))
+        return sum(results)
+
+    async def _dead_letter(self, chat_id: int, kwargs: dict, error, attempts: int):
+        payload = {
+            k: (v.model_dump(exclude_none=True) if hasattr(v, 'model_dump') else v)
+            for k, v in kwargs.items()
+        }
+        try:
+            await database.add_dead_letter(chat_id, json.dumps(payload, ensure_ascii=False), str(error), attempts)
+        except Exception as e:
+            logging.error(f"Dead-letter write failed for {chat_id}: {e}")
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "dead": self.dead,
+            "chats_tracked": len(self.chat_buckets),
+        }
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import zlib
+from collections import OrderedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+
+import database
+
+# Как часто измененные состояния сбрасываются в БД (write-behind), сек
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", 1))
+# Брошенный диалог (нет записей дольше TTL) считается пустым и удаляется
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", 24 * 3600))
+FSM_SWEEP_INTERVAL = int(os.getenv("FSM_SWEEP_INTERVAL", 600))
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", 10000))
+# data длиннее этого (байт JSON) хранится сжатой
+FSM_COMPRESS_MIN = int(os.getenv("FSM_COMPRESS_MIN", 1024))
+
+def pack_data(data: dict):
+    """Компактный JSON, большие данные — zlib. Возвращает (blob, compressed)"""
+    raw = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    if len(raw) >= FSM_COMPRESS_MIN:
+        return zlib.compress(raw), 1
+    return raw, 0
+
+def unpack_data(blob, compressed) -> dict:
+    if not blob: return {}
+    if compressed:
+        blob = zlib.decompress(blob)
+    return json.loads(blob)
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище в bot_storage.db (таблица fsm_states).
+    Чтения идут из кэша процесса, изменения пишутся в БД пачкой раз в
+    FSM_FLUSH_INTERVAL. Апдейты одного пользователя обрабатывает один процесс
+    бота (тот, что делает polling), поэтому кэш не расходится с БД, а после
+    рестарта состояния поднимаются из таблицы.
+    """
+    def __init__(self, flush_interval: float = FSM_FLUSH_INTERVAL, ttl: int = FSM_STATE_TTL,
+                 cache_size: int = FSM_CACHE_SIZE):
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._dirty = set()
+        self._task = None
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.written = 0
+        self.expired = 0
+        self.dropped = 0
+
+    async def _entry(self, key):
+        k = self.key_builder.build(key)
+        entry = self._cache.get(k)
+        if entry is not None:
+            self.hits += 1
+            self._cache.move_to_end(k)
+            if entry['state'] is not None or entry['data']:
+                if entry['touched'] < time.time() - self.ttl:
+                    self.expired += 1
+                    entry.update(state=None, data={})
+                    self._touch(k, entry)
+            return k, entry
+
+        self.misses += 1
+        row = await database.load_fsm_state(k, time.time() - self.ttl)
+        entry = {'state': None, 'data': {}, 'touched': time.time()}
+        if row:
+            entry.update(state=row['state'], data=unpack_data(row['data'], row['compressed']),
+                         touched=row['updated_at'])
+        # Пока ждали БД, запись могла появиться из другой корутины
+        entry = self._cache.setdefault(k, entry)
+        self._evict()
+        return k, entry
+
+    def _evict(self):
+        # Несохраненные записи не вытесняем
+        for k in list(self._cache):
+            if len(self._cache) <= self.cache_size: break
+            if k not in self._dirty:
+                del self._cache[k]
+
+    def _touch(self, k, entry):
+        entry['touched'] = time.time()
+        self._dirty.add(k)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def set_state(self, key, state=None):
+        k, entry = await self._entry(key)
+        entry['state'] = state.state if isinstance(state, State) else state
+        self._touch(k, entry)
+
+    async def get_state(self, key):
+        _, entry = await self._entry(key)
+        return entry['state']
+
+    async def set_data(self, key, data):
+        k, entry = await self._entry(key)
+        entry['data'] = dict(data)
+        self._touch(k, entry)
+
+    async def get_data(self, key):
+        _, entry = await self._entry(key)
+        return dict(entry['data'])
+
+    async def flush(self):
+        if not self._dirty: return
+        keys = list(self._dirty)
+        self._dirty.clear()
+        save, delete = [], []
+        for k in keys:
+            entry = self._cache[k]
+            if entry['state'] is None and not entry['data']:
+                delete.append(k)
+                continue
+            # Несериализуемые data одного ключа не должны блокировать остальные:
+            # такой ключ не сохраняем и не повторяем (повтор упадет так же)
+            try:
+                blob, compressed = pack_data(entry['data'])
+            except (TypeError, ValueError) as e:
+                self.dropped += 1
+                logging.error(f"FSM state {k} is not serializable, not persisted: {e}")
+                continue
+            save.append((k, entry['state'], blob, compressed, entry['touched']))
+        try:
+            await database.save_fsm_states(save, delete)
+        except Exception:
+            self._dirty.update(row[0] for row in save)
+            self._dirty.update(delete)
+            raise
+        self.flushes += 1
+        self.written += len(save) + len(delete)
+
+    async def _flush_loop(self):
+        last_sweep = 0.0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - last_sweep >= FSM_SWEEP_INTERVAL:
+                    last_sweep = time.monotonic()
+                    removed = await database.purge_fsm_states(time.time() - self.ttl)
+                    if removed:
+                        logging.info(f"🧹 FSM: {removed} abandoned states removed")
+            except Exception as e:
+                logging.error(f"FSM storage flush failed: {e}")
+
+    async def close(self):
+        # Вызывается Dispatcher'ом при остановке polling
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        return {
+            "cached": len(self._cache),
+            "dirty": len(self._dirty),
+            "hits": self.hits,
+            "misses": self.misses,
+            "flushes": self.flushes,
+            "written": self.written,
+            "expired": self.expired,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+# Ограничения кэша ответов GitHub: число записей и суммарный размер тел ответов
+GITHUB_CACHE_MAX_ENTRIES = int(os.getenv("GITHUB_CACHE_MAX_ENTRIES", 5000))
+GITHUB_CACHE_MAX_BYTES = int(os.getenv("GITHUB_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Устаревшая запись хранится еще столько для условного запроса (ETag), потом удаляется
+GITHUB_CACHE_STALE_TTL = int(os.getenv("GITHUB_CACHE_STALE_TTL", 3600))
+GITHUB_CACHE_EVICT_INTERVAL = int(os.getenv("GITHUB_CACHE_EVICT_INTERVAL", 60))
+
+class ResponseCache:
+    """
+    LRU-кэш ответов с TTL. Каждая запись помечена тегами (токен, owner/repo,
+    путь), по тегу можно сбросить только затронутые записи.
+    Запись: data, etag, last_modified, size, expires_at (свежесть), stale_until.
+    """
+    def __init__(self, max_entries: int = GITHUB_CACHE_MAX_ENTRIES, max_bytes: int = GITHUB_CACHE_MAX_BYTES,
+                 stale_ttl: int = GITHUB_CACHE_STALE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._tags = {}
+        self.bytes = 0
+        self._task = None
+        self.evicted = 0
+        self.expired = 0
+        self.invalidated = 0
+
+    def get(self, key: str):
+        """Запись (в том числе устаревшая, но еще пригодная для ревалидации) или None"""
+        entry = self._entries.get(key)
+        if entry is None: return None
+        if entry['stale_until'] < time.time():
+            self._remove(key)
+            self.expired += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, data, ttl: float, tags=(), etag: str = None, last_modified: str = None, size: int = 0):
+        """Возвращает запись, даже если она сразу же вытеснена (больше лимита байт)"""
+        if key in self._entries:
+            self._remove(key)
+        expires_at = time.time() + ttl
+        entry = self._entries[key] = {
+            'data': data,
+            'etag': etag,
+            'last_modified': last_modified,
+            'size': size,
+            'expires_at': expires_at,
+            'stale_until': expires_at + self.stale_ttl,
+            'tags': tuple(tags),
+        }
+        self.bytes += size
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        self._shrink()
+        return entry
+
+    def refresh(self, key: str, ttl: float):
+        """Ответ подтвержден (304) — продлеваем свежесть"""
+        entry = self._entries.get(key)
+        if entry:
+            entry['expires_at'] = time.time() + ttl
+            entry['stale_until'] = entry['expires_at'] + self.stale_ttl
+
+    def invalidate(self, *tags: str) -> int:
+        removed = 0
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+                removed += 1
+        self.invalidated += removed
+        return removed
+
+    def clear(self):
+        self._entries.clear()
+        self._tags.clear()
+        self.bytes = 0
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self.bytes -= entry['size']
+        for tag in entry['tags']:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _shrink(self):
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evicted += 1
+
+    def evict_expired(self) -> int:
+        now = time.time()
+        keys = [k for k, e in self._entries.items() if e['stale_until'] < now]
+        for key in keys:
+            self._remove(key)
+        self.expired += len(keys)
+        return len(keys)
+
+    async def start(self, interval: int = GITHUB_CACHE_EVICT_INTERVAL):
+        if self._task is None:
+            self._task = asyncio.create_task(self._evict_loop(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _evict_loop(self, interval: int):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.evict_expired()
+            except Exception as e:
+                logging.error(f"GitHub cache eviction failed: {e}")
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "tags": len(self._tags),
+            "evicted": self.evicted,
+            "expired": self.expired,
+            "invalidated": self.invalidated,
+        }
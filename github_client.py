@@ -1,4 +1,6 @@
 import aiohttp
+import asyncio
+import json
 import os
 import tempfile
 import hmac
@@ -6,71 +8,412 @@ import hashlib
 import logging
 import time
 import base64
+import stat
+import zipfile
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from github_cache import ResponseCache
+from github_disk_cache import DiskCache
+from github_ratelimit import RateLimiter, RateLimitDeferred, INTERACTIVE
 
 GITHUB_API = "https://api.github.com"
+GITHUB_GRAPHQL_URL = f"{GITHUB_API}/graphql"
+# Страницы списка репозиториев одним GraphQL-запросом (сразу с данными для view_repo)
+GITHUB_GRAPHQL = os.getenv("GITHUB_GRAPHQL", "1") == "1"
+# Сколько помним курсоры страниц (номер страницы -> endCursor предыдущей)
+GITHUB_CURSOR_TTL = int(os.getenv("GITHUB_CURSOR_TTL", 3600))
+
+REPOS_PAGE_QUERY = """
+query($first: Int!, $after: String, $affiliations: [RepositoryAffiliation]) {
+  viewer {
+    repositories(first: $first, after: $after, affiliations: $affiliations, ownerAffiliations: $affiliations,
+                 orderBy: {field: UPDATED_AT, direction: DESC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        name
+        nameWithOwner
+        owner { login }
+        isPrivate
+        isFork
+        isArchived
+        description
+        stargazerCount
+        forkCount
+        url
+        updatedAt
+        pushedAt
+        defaultBranchRef { name }
+      }
+    }
+  }
+}
+"""
+
+def _repo_from_graphql(node: dict):
+    """Узел GraphQL в форме REST-ответа /repos/{owner}/{repo} (те поля, что нужны боту)"""
+    return {
+        "name": node["name"],
+        "full_name": node["nameWithOwner"],
+        "owner": {"login": node["owner"]["login"]},
+        "private": node["isPrivate"],
+        "fork": node["isFork"],
+        "archived": node["isArchived"],
+        "description": node["description"],
+        "stargazers_count": node["stargazerCount"],
+        "forks_count": node["forkCount"],
+        "html_url": node["url"],
+        "updated_at": node["updatedAt"],
+        "pushed_at": node["pushedAt"],
+        "default_branch": (node["defaultBranchRef"] or {}).get("name"),
+    }
+
+# Сколько блобов заливаем в GitHub одновременно при push_zip
+GITHUB_PUSH_CONCURRENCY = int(os.getenv("GITHUB_PUSH_CONCURRENCY", 4))
+# Повторы заливки блоба при rate limit (403/429): пауза по Retry-After, иначе
+# экспоненциальная от GITHUB_PUSH_BACKOFF; дольше GITHUB_PUSH_MAX_WAIT не ждем
+GITHUB_PUSH_RETRIES = int(os.getenv("GITHUB_PUSH_RETRIES", 5))
+GITHUB_PUSH_BACKOFF = float(os.getenv("GITHUB_PUSH_BACKOFF", 1))
+GITHUB_PUSH_MAX_WAIT = float(os.getenv("GITHUB_PUSH_MAX_WAIT", 60))
+
+def _zip_entries(zip_path: str):
+    """
+    Файлы архива с git-режимом и SHA блоба (как его посчитает git), без распаковки
+    на диск: [(path, mode, sha, member)]. Папки, .git и пути с '..' пропускаются.
+    """
+    entries = []
+    with zipfile.ZipFile(zip_path) as zf:
+        for info in zf.infolist():
+            if info.is_dir(): continue
+            parts = [p for p in info.filename.replace('\\', '/').split('/') if p not in ('', '.')]
+            if not parts or '..' in parts or parts[0] == '.git': continue
+            unix_mode = info.external_attr >> 16
+            if stat.S_ISLNK(unix_mode):
+                mode = "120000"
+            elif unix_mode & 0o111:
+                mode = "100755"
+            else:
+                mode = "100644"
+            digest = hashlib.sha1(b"blob %d\0" % info.file_size)
+            with zf.open(info) as f:
+                while chunk := f.read(1024 * 1024):
+                    digest.update(chunk)
+            entries.append(("/".join(parts), mode, digest.hexdigest(), info.filename))
+    return entries
+
+# Одна сессия на процесс: keep-alive соединения к api.github.com переиспользуются,
+# вместо TCP+TLS рукопожатия на каждый запрос
+GITHUB_POOL_SIZE = int(os.getenv("GITHUB_POOL_SIZE", 100))
+GITHUB_POOL_PER_HOST = int(os.getenv("GITHUB_POOL_PER_HOST", 30))
+GITHUB_KEEPALIVE = float(os.getenv("GITHUB_KEEPALIVE", 60))
+GITHUB_DNS_TTL = int(os.getenv("GITHUB_DNS_TTL", 300))
+GITHUB_TIMEOUT = float(os.getenv("GITHUB_TIMEOUT", 30))
+# gzip-ответы: меньше трафика на больших листингах ценой CPU на распаковку
+GITHUB_COMPRESSION = os.getenv("GITHUB_COMPRESSION", "1") == "1"
+# Файлы (raw) читаются потоком такими кусками
+GITHUB_RAW_CHUNK = int(os.getenv("GITHUB_RAW_CHUNK", 64 * 1024))
+# Больше этого файл целиком в память не читаем (у GitHub blob до 100 MB)
+GITHUB_RAW_MAX_BYTES = int(os.getenv("GITHUB_RAW_MAX_BYTES", 100 * 1024 * 1024))
+# Большие передачи (raw файлы, загрузка блобов) не укладываются в общий GITHUB_TIMEOUT:
+# на них общий предел свой, а зависание ловит таймаут на чтение из сокета
+GITHUB_TRANSFER_TIMEOUT = float(os.getenv("GITHUB_TRANSFER_TIMEOUT", 600))
+_TRANSFER_TIMEOUT = aiohttp.ClientTimeout(total=GITHUB_TRANSFER_TIMEOUT, sock_connect=GITHUB_TIMEOUT,
+                                          sock_read=GITHUB_TIMEOUT)
+
+_session = None
+
+def get_session():
+    """Общая сессия; создается лениво, если init_session() не вызывали"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=GITHUB_POOL_SIZE,
+            limit_per_host=GITHUB_POOL_PER_HOST,
+            keepalive_timeout=GITHUB_KEEPALIVE,
+            ttl_dns_cache=GITHUB_DNS_TTL,
+        )
+        headers = {
+            "Accept": "application/vnd.github.v3+json",
+            "User-Agent": "GitHubManager-Bot",
+        }
+        if not GITHUB_COMPRESSION:
+            headers["Accept-Encoding"] = "identity"
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=GITHUB_TIMEOUT),
+            auto_decompress=GITHUB_COMPRESSION,
+        )
+    return _session
+
+async def init_session():
+    get_session()
+    await _cache.start()
+    if disk_cache.enabled:
+        await disk_cache.report()
+    logging.info(f"🌐 GitHub session ready (pool {GITHUB_POOL_SIZE}/{GITHUB_POOL_PER_HOST} per host)")
+
+async def close_session():
+    global _session
+    await _cache.stop()
+    await disk_cache.close()
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+# In-Memory Cache storage (ограничен по числу записей и байтам, см. github_cache)
+_cache = ResponseCache()
+# Опциональный второй уровень на диске (GITHUB_DISK_CACHE), переживает рестарт
+disk_cache = DiskCache()
+# Сколько ответ считается свежим. Потом не выкидываем, а перепроверяем по ETag:
+# 304 не тратит лимит запросов GitHub и не гонит тело заново
+CACHE_TTL = int(os.getenv("GITHUB_CACHE_TTL", 60))
+_cache_stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'bytes_saved': 0, 'quota_saved': 0}
+
+# Бюджет лимитов всех токенов процесса
+rate_limiter = RateLimiter()
+
+def cache_stats():
+    return {**_cache_stats, **_cache.stats(), 'disk': disk_cache.stats()}
+
+async def _load_entry(key: str):
+    """Запись из памяти, при промахе — с диска (и обратно в память)"""
+    entry = _cache.get(key)
+    if entry is None and disk_cache.enabled:
+        stored = await disk_cache.get(key)
+        if stored:
+            entry = _cache.set(key, stored['data'], stored['expires_at'] - time.time(), stored['tags'],
+                               stored['etag'], stored['last_modified'], stored['size'])
+    return entry
+
+def _store_entry(key: str, data, ttl: float, tags, etag: str = None, last_modified: str = None, size: int = 0):
+    # Запись берем из set, а не из _cache.get: большой ответ мог сразу вытесниться из памяти
+    entry = _cache.set(key, data, ttl, tags, etag, last_modified, size)
+    if disk_cache.enabled:
+        disk_cache.put(key, entry)
+
+def ratelimit_stats():
+    return rate_limiter.stats()
+
+# Склейка одинаковых запросов в полете (singleflight): ключ (scope, метод, URL).
+# scope — токен, а для заведомо публичных репо общий "public": ответ один для всех.
+# В _inflight ключ хранится вместе с приоритетом ведущего (см. _leader)
+GITHUB_PUBLIC_TTL = int(os.getenv("GITHUB_PUBLIC_TTL", 600))
+_PUBLIC_REPOS_MAX = 10000
+_public_repos = OrderedDict()
+_inflight = {}
+_flight_stats = {'requests': 0, 'coalesced': 0, 'coalesced_public': 0, 'public_retries': 0}
+
+def flight_stats():
+    return {**_flight_stats, 'in_flight': len(_inflight)}
 
-# In-Memory Cache storage
-_cache = {}
-CACHE_TTL = 300  # 5 минут
+def _remember_visibility(repo: dict):
+    if not repo.get('full_name'): return
+    name = repo['full_name'].lower()
+    if repo.get('private'):
+        _public_repos.pop(name, None)
+        return
+    _public_repos[name] = time.time() + GITHUB_PUBLIC_TTL
+    _public_repos.move_to_end(name)
+    while len(_public_repos) > _PUBLIC_REPOS_MAX:
+        _public_repos.popitem(last=False)
+
+def _is_public(owner: str, repo: str):
+    return _public_repos.get(f"{owner}/{repo}".lower(), 0) > time.time()
+
+def _leader(key, priority: int):
+    # Интерактивный не ждет фоновый: тот может стоять в очереди лимитера до минуты.
+    # Фоновый присоединяется к любому
+    for leader_priority in (INTERACTIVE,) if priority == INTERACTIVE else (INTERACTIVE, priority):
+        future = _inflight.get((key, leader_priority))
+        if future is not None: return future
+    return None
+
+async def _singleflight(key, fetch, token_key: str = None, priority: int = INTERACTIVE):
+    """
+    Первый вызов по ключу делает запрос, остальные ждут его результат.
+    Возвращает (результат, shared). Если ведущий отменен или отложен
+    лимитером (фоновый), ведомый делает запрос сам.
+    token_key — токен ведомого: под общим ключом "public" делим только успех,
+    неудачу чужого токена (None, ошибка) ведомый повторяет своим.
+    priority — приоритет ведомого (см. _leader).
+    """
+    future = _leader(key, priority)
+    if future is not None:
+        retry_key = (token_key, *key[1:]) if key[0] == "public" and token_key else None
+        try:
+            result = await asyncio.shield(future)
+        except (asyncio.CancelledError, RateLimitDeferred):
+            # Отменили нас самих, а не ведущего
+            if not future.done() or not (future.cancelled() or isinstance(future.exception(), RateLimitDeferred)):
+                raise
+        except Exception:
+            if retry_key is None: raise
+            _flight_stats['public_retries'] += 1
+            return await _singleflight(retry_key, fetch, priority=priority)
+        else:
+            if result is None and retry_key is not None:
+                # Например, 401 у ведущего: его токен отозван, а у нас доступ есть
+                _flight_stats['public_retries'] += 1
+                return await _singleflight(retry_key, fetch, priority=priority)
+            _flight_stats['coalesced'] += 1
+            if key[0] == "public":
+                _flight_stats['coalesced_public'] += 1
+            return result, True
+        return await _singleflight(key, fetch, token_key, priority)
+
+    future = asyncio.get_running_loop().create_future()
+    flight = (key, priority)
+    _inflight[flight] = future
+    _flight_stats['requests'] += 1
+    try:
+        result = await fetch()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # ведомых может не быть — не ругаться "never retrieved"
+        raise
+    else:
+        future.set_result(result)
+        return result, False
+    finally:
+        if _inflight.get(flight) is future:
+            del _inflight[flight]
+
+def repo_tag(owner: str, repo: str):
+    # Имена репозиториев в GitHub регистронезависимы
+    return f"repo:{owner}/{repo}".lower()
+
+async def invalidate_repo(owner: str, repo: str, *tags: str):
+    """
+    Сбросить все закэшированные ответы по репозиторию (у всех токенов) и по
+    дополнительным тегам. Единая точка инвалидации для всех записей в репо.
+    """
+    tags = (repo_tag(owner, repo), *tags)
+    await disk_cache.invalidate(*tags)
+    return _cache.invalidate(*tags)
 
 class GitHubClient:
-    def __init__(self, token: str):
+    """priority: INTERACTIVE для хендлеров, BACKGROUND для фоновых задач (см. github_ratelimit)"""
+    def __init__(self, token: str, priority: int = INTERACTIVE):
         self.token = token
-        self.headers = {
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/vnd.github.v3+json"
-        }
+        self.priority = priority
+        # Accept и прочее общее — в заголовках сессии, здесь только токен
+        self.headers = {"Authorization": f"Bearer {token}"}
+        token_hash = hashlib.sha256(token.encode()).hexdigest()[:16] if token else "anon"
+        self._token_key = token_hash
+        self._token_tag = f"token:{token_hash}"
+        self._repos_tag = f"repos:{token_hash}"
 
     # ... (старые методы кеширования _get_cache_key, _get_from_cache, _save_to_cache оставляем) ...
     def _get_cache_key(self, endpoint: str, params: str = ""):
         raw = f"{self.token}:{endpoint}:{params}"
         return hashlib.sha256(raw.encode()).hexdigest()
 
-    def _get_from_cache(self, key: str):
-        if key in _cache:
-            entry = _cache[key]
-            if time.time() < entry['expires_at']:
-                return entry['data']
-            else:
-                del _cache[key]
+    async def _get_from_cache(self, key: str):
+        """Только свежие записи; устаревшие остаются для условного запроса"""
+        entry = await _load_entry(key)
+        if entry and time.time() < entry['expires_at']:
+            return entry['data']
         return None
 
-    def _save_to_cache(self, key: str, data: any):
-        _cache[key] = {
-            'data': data,
-            'expires_at': time.time() + CACHE_TTL
-        }
+    def _save_to_cache(self, key: str, data: any, tags=(), etag: str = None, last_modified: str = None, size: int = 0):
+        _store_entry(key, data, CACHE_TTL, (self._token_tag, *tags), etag, last_modified, size)
     
-    def _invalidate_cache(self):
-        global _cache
-        _cache = {} 
+    async def _invalidate_cache(self, owner: str, repo: str):
+        # Только затронутый репо + свои списки репозиториев (sort=updated меняет порядок)
+        await invalidate_repo(owner, repo, self._repos_tag)
+
+    @asynccontextmanager
+    async def _request(self, method: str, url: str, headers: dict = None, resource: str = "core", **kwargs):
+        """Запрос через общую сессию с учетом бюджета токена"""
+        async with rate_limiter.slot(self._token_key, self.priority, resource):
+            session = get_session()
+            async with session.request(method, url, headers=headers or self.headers, **kwargs) as resp:
+                rate_limiter.record(self._token_key, resp.status, resp.headers, resource)
+                yield resp
+
+    def budget(self, resource: str = "core"):
+        """Текущий бюджет лимитов этого токена (см. github_ratelimit.TokenBudget)"""
+        return rate_limiter.budget(self._token_key, resource)
+
+    def _flight_scope(self, owner: str = None, repo: str = None):
+        return "public" if owner and _is_public(owner, repo) else self._token_key
+
+    async def _cached_get(self, cache_key: str, url: str, tags=(), scope: str = None, fresh: bool = False):
+        """
+        GET через кэш: свежая запись отдается сразу, устаревшая перепроверяется
+        (If-None-Match / If-Modified-Since), на 304 продлеваем ее. None, если не 200/304.
+        fresh — перепроверить и свежую запись (данные пойдут в запись, например sha).
+        Одинаковые одновременные запросы (см. _singleflight) уходят в GitHub один раз.
+        """
+        cached = None if fresh else await self._get_from_cache(cache_key)
+        if cached is not None:
+            _cache_stats['hits'] += 1
+            return cached
+
+        key = (scope or self._token_key, "GET", url)
+        result, shared = await _singleflight(key, lambda: self._fetch(cache_key, url, tags), self._token_key,
+                                             self.priority)
+        if result is None: return None
+        data, etag, last_modified, size = result
+        if shared:
+            # Ответ получен чужим запросом (возможно, другим токеном) — кладем и в свой кэш
+            self._save_to_cache(cache_key, data, tags, etag, last_modified, size)
+        return data
+
+    async def _fetch(self, cache_key: str, url: str, tags=()):
+        """Условный GET; (data, etag, last_modified, size) или None"""
+        entry = _cache.get(cache_key)
+        headers = self.headers
+        if entry and (entry['etag'] or entry['last_modified']):
+            headers = dict(self.headers)
+            if entry['etag']:
+                headers["If-None-Match"] = entry['etag']
+            if entry['last_modified']:
+                headers["If-Modified-Since"] = entry['last_modified']
+
+        try:
+            async with self._request("GET", url, headers) as resp:
+                if resp.status == 304 and entry:
+                    _cache.refresh(cache_key, CACHE_TTL)
+                    disk_cache.refresh(cache_key, entry['expires_at'], entry['stale_until'])
+                    _cache_stats['revalidated'] += 1
+                    _cache_stats['bytes_saved'] += entry['size']
+                    _cache_stats['quota_saved'] += 1
+                    return entry['data'], entry['etag'], entry['last_modified'], entry['size']
+                if resp.status != 200:
+                    return None
+                body = await resp.read()
+        except RateLimitDeferred:
+            # Фоновому запросу хватит и устаревших данных
+            if entry: return entry['data'], entry['etag'], entry['last_modified'], entry['size']
+            raise
+
+        data = json.loads(body)
+        _cache_stats['misses'] += 1
+        etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+        self._save_to_cache(cache_key, data, tags, etag, last_modified, len(body))
+        return data, etag, last_modified, len(body)
 
     # ... (Остальные методы get_user_info, get_repos, get_repo_details, create_repo и т.д. ОСТАВЛЯЕМ) ...
     # Вставь их сюда, если копипастишь. Я добавлю только НОВЫЕ методы для файлов.
 
     async def get_user_info(self):
         cache_key = self._get_cache_key("user")
-        cached = self._get_from_cache(cache_key)
-        if cached: return cached
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{GITHUB_API}/user", headers=self.headers) as resp:
-                if resp.status != 200: return None
-                data = await resp.json()
-                self._save_to_cache(cache_key, data)
-                return data
+        return await self._cached_get(cache_key, f"{GITHUB_API}/user")
     
     # Чтобы не дублировать тонну кода, я подразумеваю наличие create_repo, update_repo, delete_repo и т.д.
     # Реализуем только новые для файлов:
 
-    async def get_contents(self, owner: str, repo: str, path: str = ""):
-        """Получение списка файлов или содержимого конкретного файла"""
+    async def get_contents(self, owner: str, repo: str, path: str = "", fresh: bool = False):
+        """Получение списка файлов или содержимого конкретного файла (fresh — см. _cached_get)"""
         url = f"{GITHUB_API}/repos/{owner}/{repo}/contents/{path}"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=self.headers) as resp:
-                if resp.status != 200:
-                    return None
-                return await resp.json()
+        cache_key = self._get_cache_key(f"repos/{owner}/{repo}/contents/{path}")
+        tags = (repo_tag(owner, repo), f"path:{owner}/{repo}/{path}".lower())
+        return await self._cached_get(cache_key, url, tags, self._flight_scope(owner, repo), fresh)
 
     async def update_file(self, owner: str, repo: str, path: str, message: str, content: str, sha: str):
         """Коммит изменения файла"""
@@ -85,47 +428,302 @@ class GitHubClient:
             "sha": sha
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.put(url, json=payload, headers=self.headers) as resp:
-                if resp.status in [200, 201]:
-                    self._invalidate_cache()
-                    return True, await resp.json()
-                err = await resp.json()
-                return False, err.get('message', 'Unknown Error')
+        async with self._request("PUT", url, json=payload) as resp:
+            if resp.status in [200, 201]:
+                await self._invalidate_cache(owner, repo)
+                return True, await resp.json()
+            err = await resp.json()
+            return False, err.get('message', 'Unknown Error')
 
     # ВАЖНО: Функции create_webhook и verify_signature тоже должны быть тут.
     # Если ты копируешь весь файл, возьми их из предыдущего ответа.
 
     async def get_repos(self, page: int = 1, per_page: int = 5, filter_mode: str = 'all'):
         # (Код из прошлого ответа)
+        if GITHUB_GRAPHQL:
+            result = await self._get_repos_graphql(page, per_page, filter_mode)
+            if result is not None:
+                return result
+
         affiliation = "owner" if filter_mode == 'owner' else "owner,collaborator,organization_member"
         params_key = f"page={page}&per_page={per_page}&filter={filter_mode}"
         cache_key = self._get_cache_key("repos", params_key)
         
-        cached = self._get_from_cache(cache_key)
-        if cached: return cached[0], cached[1]
-        
         url = f"{GITHUB_API}/user/repos?sort=updated&per_page={per_page}&page={page}&affiliation={affiliation}"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=self.headers) as resp:
-                if resp.status != 200: return None, False
-                data = await resp.json()
-                has_next = len(data) == per_page
-                self._save_to_cache(cache_key, (data, has_next))
-                return data, has_next
+        data = await self._cached_get(cache_key, url, (self._repos_tag,))
+        if data is None: return None, False
+        for repo in data:
+            _remember_visibility(repo)
+        has_next = len(data) == per_page
+        return data, has_next
+
+    async def _get_repos_graphql(self, page: int, per_page: int, filter_mode: str):
+        """
+        Страница репозиториев одним GraphQL-запросом. Курсор страницы берется из
+        предыдущей; если его нет (старая кнопка после рестарта) — None, идем в REST.
+        """
+        params_key = f"page={page}&per_page={per_page}&filter={filter_mode}"
+        cache_key = self._get_cache_key("graphql:repos", params_key)
+        cached = await self._get_from_cache(cache_key)
+        if cached is not None:
+            _cache_stats['hits'] += 1
+            return cached
+
+        after = None
+        if page > 1:
+            after = await self._get_from_cache(self._get_cache_key("graphql:cursor", params_key))
+            if after is None: return None
+
+        # Как affiliation у REST /user/repos — это affiliations; ownerAffiliations по умолчанию
+        # [OWNER, COLLABORATOR] и отрезал бы репо организаций, поэтому задаем оба одинаково
+        affiliations = ["OWNER"] if filter_mode == 'owner' else ["OWNER", "COLLABORATOR", "ORGANIZATION_MEMBER"]
+        payload = {
+            "query": REPOS_PAGE_QUERY,
+            "variables": {"first": per_page, "after": after, "affiliations": affiliations},
+        }
+
+        async def fetch():
+            async with self._request("POST", GITHUB_GRAPHQL_URL, json=payload, resource="graphql") as resp:
+                if resp.status != 200: return None
+                return await resp.read()
+
+        body, _ = await _singleflight((self._token_key, "POST", GITHUB_GRAPHQL_URL, params_key), fetch,
+                                      priority=self.priority)
+        if body is None: return None
+        result = json.loads(body)
+        if result.get("errors") or not result.get("data"):
+            logging.warning(f"GraphQL repos page failed: {result.get('errors')}")
+            return None
+
+        connection = result["data"]["viewer"]["repositories"]
+        repos = [_repo_from_graphql(node) for node in connection["nodes"] if node]
+        has_next = connection["pageInfo"]["hasNextPage"]
+        _cache_stats['misses'] += 1
+        self._save_to_cache(cache_key, (repos, has_next), (self._repos_tag,), size=len(body))
+        if has_next:
+            next_key = self._get_cache_key("graphql:cursor", f"page={page + 1}&per_page={per_page}&filter={filter_mode}")
+            # Курсоры сбрасываются вместе со списками: после записи порядок sort=updated другой
+            _store_entry(next_key, connection["pageInfo"]["endCursor"], GITHUB_CURSOR_TTL,
+                         (self._token_tag, self._repos_tag))
+
+        # Открытие репо из списка не должно стоить запроса
+        for repo in repos:
+            _remember_visibility(repo)
+            owner, name = repo['owner']['login'], repo['name']
+            detail_key = self._get_cache_key(f"repos/{owner}/{name}")
+            if await self._get_from_cache(detail_key) is None:
+                self._save_to_cache(detail_key, repo, (repo_tag(owner, name),))
+        return repos, has_next
     
     async def get_repo_details(self, owner: str, repo: str):
          # (Код из прошлого ответа)
         cache_key = self._get_cache_key(f"repos/{owner}/{repo}")
-        cached = self._get_from_cache(cache_key)
-        if cached: return cached
+        data = await self._cached_get(cache_key, f"{GITHUB_API}/repos/{owner}/{repo}", (repo_tag(owner, repo),),
+                                      self._flight_scope(owner, repo))
+        if data: _remember_visibility(data)
+        return data
+
+    async def get_branch(self, owner: str, repo: str, branch: str, fresh: bool = False):
+        cache_key = self._get_cache_key(f"repos/{owner}/{repo}/branches/{branch}")
+        return await self._cached_get(cache_key, f"{GITHUB_API}/repos/{owner}/{repo}/branches/{branch}",
+                                      (repo_tag(owner, repo),), self._flight_scope(owner, repo), fresh)
+
+    async def get_head_tree_sha(self, owner: str, repo: str, fresh: bool = False):
+        """SHA дерева на голове ветки по умолчанию; None для пустого репо. fresh — голову перепроверить"""
+        details = await self.get_repo_details(owner, repo)
+        if not details or not details.get('default_branch'): return None
+        branch = await self.get_branch(owner, repo, details['default_branch'], fresh)
+        if not branch: return None
+        return branch['commit']['commit']['tree']['sha']
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{GITHUB_API}/repos/{owner}/{repo}", headers=self.headers) as resp:
+    async def get_tree(self, owner: str, repo: str, tree_sha: str):
+        """
+        Все дерево одним запросом (git/trees?recursive=1). В кэш ответов не кладем:
+        дерево по SHA неизменно, его держит tree_index в виде компактного индекса.
+        """
+        url = f"{GITHUB_API}/repos/{owner}/{repo}/git/trees/{tree_sha}?recursive=1"
+
+        async def fetch():
+            async with self._request("GET", url) as resp:
                 if resp.status != 200: return None
-                data = await resp.json()
-                self._save_to_cache(cache_key, data)
-                return data
+                return await resp.read()
+
+        body, _ = await _singleflight((self._flight_scope(owner, repo), "GET", url), fetch, self._token_key,
+                                      self.priority)
+        return json.loads(body) if body else None
+
+    async def get_blob_raw(self, owner: str, repo: str, sha: str, limit: int = None, size: int = None):
+        """
+        Байты файла по SHA блоба в raw-виде (без base64 JSON, до 100 MB вместо 1 MB
+        у contents). limit — только первые limit байт (Range), для превью. None при ошибке
+        и для файлов больше GITHUB_RAW_MAX_BYTES. size — известный размер блоба:
+        пустой файл не запрашиваем (Range на 0 байт дает 416), влезающий в limit берем целиком.
+        """
+        if size == 0: return b""
+        if limit and size is not None and size <= limit:
+            limit = None
+        url = f"{GITHUB_API}/repos/{owner}/{repo}/git/blobs/{sha}"
+        headers = {**self.headers, "Accept": "application/vnd.github.raw"}
+        if limit:
+            headers["Range"] = f"bytes=0-{limit - 1}"
+
+        async def fetch():
+            async with self._request("GET", url, headers, timeout=_TRANSFER_TIMEOUT) as resp:
+                if resp.status not in (200, 206): return None
+                # Читаем не больше нужного: Range мог быть проигнорирован, а Content-Length есть не всегда
+                want = limit or GITHUB_RAW_MAX_BYTES + 1
+                too_large = not limit and (resp.content_length or 0) >= want
+                buf = bytearray()
+                while not too_large and len(buf) < want:
+                    chunk = await resp.content.read(min(GITHUB_RAW_CHUNK, want - len(buf)))
+                    if not chunk: break
+                    buf += chunk
+                if too_large or len(buf) > GITHUB_RAW_MAX_BYTES:
+                    logging.warning(f"⚠️ Blob {owner}/{repo}@{sha[:7]} is larger than GITHUB_RAW_MAX_BYTES")
+                    return None
+                return bytes(buf)
+
+        data, _ = await _singleflight((self._flight_scope(owner, repo), "GET", url, limit), fetch,
+                                      self._token_key, self.priority)
+        return data
+
+    async def _git_api(self, method: str, path: str, payload: dict = None, timeout: aiohttp.ClientTimeout = None):
+        """Запрос к /repos/{path} мимо кэша; (status, json). timeout — вместо общего таймаута сессии"""
+        kwargs = {"timeout": timeout} if timeout else {}
+        async with self._request(method, f"{GITHUB_API}/repos/{path}", json=payload, **kwargs) as resp:
+            try:
+                data = await resp.json(content_type=None)
+            except ValueError:
+                data = None
+            return resp.status, data or {}
+
+    async def push_zip(self, owner: str, repo: str, zip_path: str, message: str, replace: bool = True):
+        """
+        Коммит содержимого ZIP без клона, через Git Data API: файлы сравниваются
+        с деревом ветки по SHA блоба, заливаются только новые блобы, затем дерево,
+        коммит и перенос ветки. replace=True — репо становится ровно как архив
+        (остальное удаляется), False — архив кладется поверх существующих файлов.
+        (True, {'commit', 'files', 'changed', 'deleted', 'uploaded'}) или (False, ошибка);
+        commit None — изменений нет, deleted None — неизвестно (дерево ветки обрезано).
+        """
+        try:
+            return await self._push_zip(owner, repo, zip_path, message, replace)
+        finally:
+            # На любом выходе: ветку мог сдвинуть и первый файл пустого репо, а ответ
+            # "изменений нет" значит, что в кэше могло лежать устаревшее дерево
+            await self._invalidate_cache(owner, repo)
+
+    async def _push_zip(self, owner: str, repo: str, zip_path: str, message: str, replace: bool):
+        entries = await asyncio.to_thread(_zip_entries, zip_path)
+        if not entries: return False, "Archive is empty"
+
+        details = await self.get_repo_details(owner, repo)
+        if not details: return False, "Repository not found"
+        branch = details['default_branch']
+        result = {'commit': None, 'files': len(entries), 'changed': 0, 'deleted': 0, 'uploaded': 0}
+        # Путь файла, уже закоммиченного в пустой репо: при ошибке дальше говорим об этом прямо
+        partial = None
+
+        def fail(error):
+            if partial:
+                error = f"{error} (the empty repository already got a first commit with {partial})"
+            return False, error
+
+        with zipfile.ZipFile(zip_path) as zf:
+            status, head = await self._git_api("GET", f"{owner}/{repo}/branches/{branch}")
+            if status == 404:
+                # Пустой репо: Git Data API (и заливка блобов) в нем не работает, пока нет
+                # ни одного коммита, поэтому первый файл кладем через contents
+                path, _, _, member = entries[0]
+                content = base64.b64encode(await asyncio.to_thread(zf.read, member)).decode()
+                status, res = await self._git_api("PUT", f"{owner}/{repo}/contents/{path}",
+                                                  {"message": message, "content": content, "branch": branch})
+                if status not in (200, 201): return False, res.get('message', 'Unknown Error')
+                head_sha, base_tree = res['commit']['sha'], res['commit']['tree']['sha']
+                result['commit'], partial = head_sha, path
+            elif status == 200:
+                head_sha, base_tree = head['commit']['sha'], head['commit']['commit']['tree']['sha']
+            else:
+                return False, head.get('message', 'Unknown Error')
+
+            # Обрезанное дерево (огромный репо) не мешает: незнакомые блобы просто зальются заново,
+            # только число удаленных при replace неизвестно (None)
+            tree = await self.get_tree(owner, repo, base_tree)
+            remote = {i['path']: (i['mode'], i['sha']) for i in (tree or {}).get('tree', []) if i['type'] == 'blob'}
+            known = {sha for _, sha in remote.values()}
+            changed = [e for e in entries if remote.get(e[0]) != (e[1], e[2])]
+            result['changed'] = len(changed)
+            if replace:
+                truncated = not tree or tree.get('truncated')
+                result['deleted'] = None if truncated else len(remote.keys() - {e[0] for e in entries})
+            if not changed and (not replace or result['deleted'] == 0):
+                return True, result
+
+            uploads = {sha: member for _, _, sha, member in changed if sha not in known}
+            ok, error = await self._upload_blobs(owner, repo, zf, uploads)
+            if not ok: return fail(error)
+            result['uploaded'] = len(uploads)
+
+        items = entries if replace else changed
+        payload = {"tree": [{"path": path, "mode": mode, "type": "blob", "sha": sha} for path, mode, sha, _ in items]}
+        if not replace:
+            payload["base_tree"] = base_tree
+        status, new_tree = await self._git_api("POST", f"{owner}/{repo}/git/trees", payload)
+        if status != 201: return fail(new_tree.get('message', 'Unknown Error'))
+        if new_tree['sha'] == base_tree:
+            return True, result
+
+        status, commit = await self._git_api("POST", f"{owner}/{repo}/git/commits",
+                                             {"message": message, "tree": new_tree['sha'], "parents": [head_sha]})
+        if status != 201: return fail(commit.get('message', 'Unknown Error'))
+        # Без force: если ветку сдвинули, пока мы собирали дерево, GitHub вернет 422
+        status, ref = await self._git_api("PATCH", f"{owner}/{repo}/git/refs/heads/{branch}", {"sha": commit['sha']})
+        if status != 200: return fail(ref.get('message', 'Unknown Error'))
+
+        result['commit'] = commit['sha']
+        return True, result
+
+    def _push_retry_wait(self, status: int, res: dict, attempt: int):
+        """Пауза перед повтором заливки или None, если ошибка не из-за лимита (или ждать слишком долго)"""
+        budget = self.budget()
+        limited = status == 429 or (status == 403 and (
+            budget.blocked_until > time.time() or "rate limit" in str(res.get('message', '')).lower()))
+        if not limited: return None
+        # Retry-After (или сброс исчерпанного лимита) уже учтен лимитером в blocked_until
+        wait = max(budget.blocked_until - time.time(), GITHUB_PUSH_BACKOFF * 2 ** attempt)
+        return wait if wait <= GITHUB_PUSH_MAX_WAIT else None
+
+    async def _upload_blobs(self, owner: str, repo: str, zf: zipfile.ZipFile, uploads: dict):
+        """Параллельная заливка блобов {sha: имя в архиве}; чтение из архива по одному"""
+        sem = asyncio.Semaphore(GITHUB_PUSH_CONCURRENCY)
+        read_lock = asyncio.Lock()
+
+        async def upload(sha, member):
+            async with sem:
+                async with read_lock:
+                    data = await asyncio.to_thread(zf.read, member)
+                payload = {"content": base64.b64encode(data).decode(), "encoding": "base64"}
+                del data
+                for attempt in range(GITHUB_PUSH_RETRIES + 1):
+                    status, res = await self._git_api("POST", f"{owner}/{repo}/git/blobs", payload,
+                                                      timeout=_TRANSFER_TIMEOUT)
+                    if status == 201 or attempt == GITHUB_PUSH_RETRIES: break
+                    wait = self._push_retry_wait(status, res, attempt)
+                    if wait is None: break
+                    logging.warning(f"🚦 push_zip {owner}/{repo}: blob upload got {status}, retry in {wait:.1f}s")
+                    await asyncio.sleep(wait)
+                if status != 201:
+                    raise RuntimeError(f"{member}: {res.get('message', 'Unknown Error')}")
+                if res['sha'] != sha:
+                    raise RuntimeError(f"{member}: blob SHA mismatch")
+
+        results = await asyncio.gather(*(upload(sha, member) for sha, member in uploads.items()),
+                                       return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            logging.error(f"push_zip {owner}/{repo}: {len(errors)} blob uploads failed, first: {errors[0]}")
+            return False, str(errors[0])
+        return True, None
 
 def verify_signature(payload_body, secret_token, signature_header):
     if not signature_header: return False
@@ -0,0 +1,231 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import zlib
+
+import aiosqlite
+
+# Второй уровень кэша ответов GitHub — отдельный SQLite-файл, переживает рестарт.
+# Пустой путь — выключено.
+GITHUB_DISK_CACHE = os.getenv("GITHUB_DISK_CACHE", "")
+GITHUB_DISK_CACHE_MAX_BYTES = int(os.getenv("GITHUB_DISK_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Записи копятся в памяти и пишутся пачкой
+GITHUB_DISK_CACHE_FLUSH_INTERVAL = float(os.getenv("GITHUB_DISK_CACHE_FLUSH_INTERVAL", 1))
+# accessed_at (для LRU) обновляем не чаще раза в столько секунд на запись
+_TOUCH_GRANULARITY = 60
+
+class DiskCache:
+    """
+    Ответы хранятся сжатыми (zlib JSON) вместе с ETag/Last-Modified и сроками.
+    Файл открывается при первом обращении, записи читаются по одной по мере
+    промахов кэша в памяти. Размер ограничен: лишнее вытесняется по accessed_at.
+    """
+    def __init__(self, path: str = GITHUB_DISK_CACHE, max_bytes: int = GITHUB_DISK_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._db = None
+        self._open_lock = asyncio.Lock()
+        # Один сброс за раз: иначе invalidate может пройти раньше put'ов, которые
+        # уже забрал фоновый сброс, и старый ответ останется на диске
+        self._flush_lock = asyncio.Lock()
+        self._ops = []
+        self._task = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evicted = 0
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    async def _conn(self):
+        if self._db is not None: return self._db
+        async with self._open_lock:
+            if self._db is None:
+                db = await aiosqlite.connect(self.path)
+                db.row_factory = aiosqlite.Row
+                await db.execute("PRAGMA journal_mode=WAL")
+                await db.execute("PRAGMA synchronous=NORMAL")
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS http_cache (
+                        key TEXT PRIMARY KEY,
+                        body BLOB,
+                        etag TEXT,
+                        last_modified TEXT,
+                        size INTEGER, -- исходный размер ответа
+                        stored_size INTEGER, -- сжатый, для лимита файла
+                        expires_at REAL,
+                        stale_until REAL,
+                        accessed_at REAL
+                    )
+                """)
+                await db.execute("CREATE TABLE IF NOT EXISTS http_cache_tags (tag TEXT, key TEXT, PRIMARY KEY (tag, key))")
+                await db.execute("CREATE INDEX IF NOT EXISTS idx_http_cache_accessed ON http_cache(accessed_at)")
+                await db.commit()
+                self._db = db
+        return self._db
+
+    async def get(self, key: str):
+        if not self.enabled: return None
+        db = await self._conn()
+        async with db.execute("SELECT * FROM http_cache WHERE key = ?", (key,)) as cursor:
+            row = await cursor.fetchone()
+        now = time.time()
+        if not row or row['stale_until'] < now:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if now - row['accessed_at'] > _TOUCH_GRANULARITY:
+            self._enqueue(("touch", key, now))
+        async with db.execute("SELECT tag FROM http_cache_tags WHERE key = ?", (key,)) as cursor:
+            tags = [r[0] for r in await cursor.fetchall()]
+        return {
+            'data': json.loads(zlib.decompress(row['body'])),
+            'etag': row['etag'],
+            'last_modified': row['last_modified'],
+            'size': row['size'],
+            'expires_at': row['expires_at'],
+            'stale_until': row['stale_until'],
+            'tags': tags,
+        }
+
+    def put(self, key: str, entry: dict):
+        """entry — запись ResponseCache; пишется в фоне"""
+        if not self.enabled: return
+        body = zlib.compress(json.dumps(entry['data'], separators=(',', ':')).encode('utf-8'))
+        self._enqueue(("put", key, body, entry))
+
+    def refresh(self, key: str, expires_at: float, stale_until: float):
+        if not self.enabled: return
+        self._enqueue(("refresh", key, expires_at, stale_until))
+
+    async def invalidate(self, *tags: str):
+        """
+        Сразу, а не в фоне: после записи в репо старые ответы не должны подняться с диска.
+        Запись в GitHub к этому моменту уже прошла, поэтому ошибку диска только логируем,
+        инвалидация остается в очереди и повторится со следующим сбросом.
+        """
+        if not self.enabled: return
+        self._enqueue(("invalidate", tags))
+        try:
+            await self.flush()
+        except Exception as e:
+            logging.error(f"GitHub disk cache invalidate failed: {e}")
+
+    def _enqueue(self, op):
+        self._ops.append(op)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(GITHUB_DISK_CACHE_FLUSH_INTERVAL)
+        try:
+            await self.flush()
+        except Exception as e:
+            logging.error(f"GitHub disk cache flush failed: {e}")
+        # Пока шел сброс, могли прийти новые записи (или вернуться неудавшиеся инвалидации)
+        self._task = None
+        if self._ops:
+            self._task = asyncio.create_task(self._flush_later())
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._ops: return
+            ops, self._ops = self._ops, []
+            try:
+                db = await self._conn()
+                await self._apply(db, ops)
+                await self._shrink(db)
+                await db.commit()
+            except Exception:
+                if self._db is not None:
+                    try:
+                        await self._db.rollback()
+                    except Exception:
+                        pass
+                # Кэшируемые ответы можно потерять, инвалидации — нет
+                self._ops[:0] = [op for op in ops if op[0] == "invalidate"]
+                raise
+
+    async def _apply(self, db, ops):
+        now = time.time()
+        for op in ops:
+            kind = op[0]
+            if kind == "put":
+                _, key, body, entry = op
+                await db.execute("""
+                    INSERT OR REPLACE INTO http_cache
+                        (key, body, etag, last_modified, size, stored_size, expires_at, stale_until, accessed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (key, body, entry['etag'], entry['last_modified'], entry['size'], len(body),
+                      entry['expires_at'], entry['stale_until'], now))
+                await db.execute("DELETE FROM http_cache_tags WHERE key = ?", (key,))
+                await db.executemany("INSERT OR IGNORE INTO http_cache_tags (tag, key) VALUES (?, ?)",
+                                     [(tag, key) for tag in entry['tags']])
+                self.writes += 1
+            elif kind == "refresh":
+                _, key, expires_at, stale_until = op
+                await db.execute("UPDATE http_cache SET expires_at = ?, stale_until = ?, accessed_at = ? WHERE key = ?",
+                                 (expires_at, stale_until, now, key))
+            elif kind == "touch":
+                await db.execute("UPDATE http_cache SET accessed_at = ? WHERE key = ?", (op[2], op[1]))
+            elif kind == "invalidate":
+                for tag in op[1]:
+                    await db.execute("DELETE FROM http_cache WHERE key IN (SELECT key FROM http_cache_tags WHERE tag = ?)", (tag,))
+                    await db.execute("DELETE FROM http_cache_tags WHERE tag = ?", (tag,))
+
+    async def _shrink(self, db):
+        async with db.execute("SELECT COALESCE(SUM(stored_size), 0) FROM http_cache") as cursor:
+            total = (await cursor.fetchone())[0]
+        if total <= self.max_bytes: return
+        # Удаляем самые давно использованные, пока не влезем в лимит
+        async with db.execute("SELECT key, stored_size FROM http_cache ORDER BY accessed_at") as cursor:
+            victims = []
+            async for key, size in cursor:
+                if total <= self.max_bytes: break
+                victims.append((key,))
+                total -= size
+        await db.executemany("DELETE FROM http_cache WHERE key = ?", victims)
+        await db.executemany("DELETE FROM http_cache_tags WHERE key = ?", victims)
+        self.evicted += len(victims)
+
+    async def report(self):
+        """Что досталось от прошлого запуска (лог при старте)"""
+        if not self.enabled: return None
+        db = await self._conn()
+        now = time.time()
+        async with db.execute("""
+            SELECT COUNT(*), COALESCE(SUM(stored_size), 0),
+                   COALESCE(SUM(expires_at > ?), 0), COALESCE(SUM(stale_until > ?), 0)
+            FROM http_cache
+        """, (now, now)) as cursor:
+            entries, size, fresh, usable = await cursor.fetchone()
+        logging.info(f"💽 GitHub disk cache: {entries} entries ({size / 1024 / 1024:.1f} MB), "
+                     f"{fresh} fresh, {usable} revalidatable")
+        return {"entries": entries, "bytes": size, "fresh": fresh, "revalidatable": usable}
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._ops:
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"GitHub disk cache flush on close failed: {e}")
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evicted": self.evicted,
+            "pending": len(self._ops),
+        }
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+# Приоритеты запросов к GitHub
+INTERACTIVE = 0   # пользователь ждет ответа (хендлеры)
+BACKGROUND = 1    # префетч, обновления кэша и т.п.
+
+# Ниже этой доли лимита фоновые запросы растягиваются на время до сброса лимита
+GITHUB_BUDGET_LOW = float(os.getenv("GITHUB_BUDGET_LOW", 0.3))
+# Столько запросов токена оставляем только для интерактивных, фоновые откладываются
+GITHUB_BUDGET_RESERVE = int(os.getenv("GITHUB_BUDGET_RESERVE", 500))
+GITHUB_BACKGROUND_CONCURRENCY = int(os.getenv("GITHUB_BACKGROUND_CONCURRENCY", 4))
+# Сколько фоновый запрос уступает идущим интерактивным, сек
+GITHUB_BACKGROUND_YIELD = float(os.getenv("GITHUB_BACKGROUND_YIELD", 1))
+# Дольше этого интерактивный запрос не ждет снятия secondary limit
+GITHUB_INTERACTIVE_MAX_WAIT = float(os.getenv("GITHUB_INTERACTIVE_MAX_WAIT", 5))
+
+class RateLimitDeferred(Exception):
+    """Фоновый запрос отложен: бюджет токена почти исчерпан"""
+    def __init__(self, retry_at: float):
+        super().__init__(f"GitHub budget is low, retry after {retry_at:.0f}")
+        self.retry_at = retry_at
+
+class TokenBudget:
+    """Состояние лимита одного токена по одному ресурсу (core, graphql, search...)"""
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset_at = 0.0
+        self.blocked_until = 0.0
+
+    def update(self, status: int, headers):
+        if headers.get("X-RateLimit-Remaining") is not None:
+            self.limit = int(headers.get("X-RateLimit-Limit", self.limit or 0))
+            self.remaining = int(headers["X-RateLimit-Remaining"])
+            self.reset_at = float(headers.get("X-RateLimit-Reset", self.reset_at))
+
+        if status in (403, 429):
+            retry_after = headers.get("Retry-After")
+            if retry_after is not None:
+                # Secondary rate limit
+                self.blocked_until = time.time() + float(retry_after)
+            elif self.remaining == 0:
+                self.blocked_until = self.reset_at
+            elif status == 429:
+                # Без заголовков GitHub советует подождать минуту
+                self.blocked_until = time.time() + 60
+
+    def fraction(self):
+        if not self.limit or self.remaining is None: return 1.0
+        return self.remaining / self.limit
+
+class RateLimiter:
+    """
+    Учет бюджета токенов по заголовкам X-RateLimit-* и очередность запросов:
+    интерактивные идут сразу, фоновые ограничены по параллельности, уступают
+    интерактивным, замедляются при малом остатке и откладываются у резерва.
+    """
+    def __init__(self):
+        self._budgets = {}
+        self._background = asyncio.Semaphore(GITHUB_BACKGROUND_CONCURRENCY)
+        self._interactive = 0
+        self.requests = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.deferred = 0
+        self.slowed = 0
+        self.blocked_waits = 0
+
+    def budget(self, token_key: str, resource: str = "core"):
+        key = (token_key, resource)
+        budget = self._budgets.get(key)
+        if budget is None:
+            budget = self._budgets[key] = TokenBudget()
+        return budget
+
+    def record(self, token_key: str, status: int, headers, resource: str = "core"):
+        budget = self.budget(token_key, headers.get("X-RateLimit-Resource") or resource)
+        was_blocked = budget.blocked_until > time.time()
+        budget.update(status, headers)
+        if not was_blocked and budget.blocked_until > time.time():
+            logging.warning(f"🚦 GitHub rate limit hit, token {token_key[:6]}… blocked for "
+                            f"{budget.blocked_until - time.time():.0f}s")
+
+    @asynccontextmanager
+    async def slot(self, token_key: str, priority: int = INTERACTIVE, resource: str = "core"):
+        budget = self.budget(token_key, resource)
+        self.requests[priority] += 1
+        if priority == INTERACTIVE:
+            wait = budget.blocked_until - time.time()
+            if wait > 0:
+                self.blocked_waits += 1
+                await asyncio.sleep(min(wait, GITHUB_INTERACTIVE_MAX_WAIT))
+            self._interactive += 1
+            try:
+                yield budget
+            finally:
+                self._interactive -= 1
+            return
+
+        async with self._background:
+            await self._pace_background(budget)
+            yield budget
+
+    async def _pace_background(self, budget: TokenBudget):
+        now = time.time()
+        if budget.blocked_until > now:
+            self.deferred += 1
+            raise RateLimitDeferred(budget.blocked_until)
+        if budget.remaining is not None and budget.remaining <= GITHUB_BUDGET_RESERVE:
+            self.deferred += 1
+            raise RateLimitDeferred(budget.reset_at)
+
+        if budget.fraction() < GITHUB_BUDGET_LOW and budget.reset_at > now:
+            # Растягиваем остаток (сверх резерва) равномерно до сброса лимита
+            spare = max(1, budget.remaining - GITHUB_BUDGET_RESERVE)
+            self.slowed += 1
+            await asyncio.sleep(min((budget.reset_at - now) / spare, 60))
+
+        waited = 0.0
+        while self._interactive and waited < GITHUB_BACKGROUND_YIELD:
+            await asyncio.sleep(0.05)
+            waited += 0.05
+
+    def stats(self):
+        now = time.time()
+        known = [b for b in self._budgets.values() if b.remaining is not None]
+        return {
+            "tokens": len({token for token, _ in self._budgets}),
+            "lowest_remaining": min((b.remaining for b in known), default=None),
+            "blocked": sum(1 for b in self._budgets.values() if b.blocked_until > now),
+            "interactive_requests": self.requests[INTERACTIVE],
+            "background_requests": self.requests[BACKGROUND],
+            "deferred": self.deferred,
+            "slowed": self.slowed,
+            "blocked_waits": self.blocked_waits,
+        }
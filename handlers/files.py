@@ -1,6 +1,6 @@
+import codecs
 import html
 import uuid
-import base64
 import os
 from aiogram import Router, F, types
 from aiogram.fsm.state import State, StatesGroup
@@ -9,6 +9,7 @@ from aiogram.types import FSInputFile
 
 import database
 import keyboards
+import tree_index
 from github_client import GitHubClient
 
 router = Router()
@@ -16,6 +17,12 @@ router = Router()
 class FileEditStates(StatesGroup):
     waiting_for_new_content = State()
 
+# Для превью в 500 символов хватает первых нескольких KB файла
+FILE_PREVIEW_BYTES = int(os.getenv("FILE_PREVIEW_BYTES", 4096))
+PREVIEW_CHARS = 500
+# Редактирование в чате — до стольких символов
+CHAT_EDIT_MAX_CHARS = 3000
+
 # --- BROWSER ---
 
 @router.callback_query(F.data.startswith("files:"))
@@ -40,7 +47,16 @@ async def show_file_browser(callback: types.CallbackQuery, owner, repo_name, pat
     user = await database.get_user(callback.from_user.id)
     client = GitHubClient(user['github_token'])
     
-    items = await client.get_contents(owner, repo_name, path)
+    # Листинг из индекса дерева (один запрос на коммит), иначе по-старому через contents
+    index = await tree_index.get_index(client, owner, repo_name)
+    if index is not None:
+        meta = index.lookup(path)
+        if meta and meta['type'] == 'file':
+            await show_file_view(callback, owner, repo_name, path)
+            return
+        items = index.listing(path)
+    else:
+        items = await client.get_contents(owner, repo_name, path)
     
     if items is None:
         await callback.answer("Ошибка доступа или пусто", show_alert=True)
@@ -59,6 +75,27 @@ async def show_file_browser(callback: types.CallbackQuery, owner, repo_name, pat
 
 # --- VIEWER ---
 
+async def file_meta(client: GitHubClient, owner, repo, path):
+    """
+    Метаданные файла (sha, size) из индекса дерева; без индекса — через contents.
+    Само содержимое качается потоком get_blob_raw по sha. sha отсюда уходит
+    в update_file, поэтому кэш перепроверяется (ETag, 304 лимит не тратит).
+    """
+    index = await tree_index.get_index(client, owner, repo, fresh=True)
+    meta = index.lookup(path) if index else None
+    if meta is None:
+        meta = await client.get_contents(owner, repo, path, fresh=True)
+    if not isinstance(meta, dict) or meta.get('type') != 'file':
+        return None
+    return meta
+
+def decode_text(raw: bytes, complete: bool = True):
+    """UTF-8 текст или None для бинарного. У обрезанного префикса отбрасывается недочитанный символ"""
+    try:
+        return codecs.getincrementaldecoder('utf-8')().decode(raw, final=complete)
+    except UnicodeDecodeError:
+        return None
+
 @router.callback_query(F.data.startswith("f_view:"))
 async def file_view_entry(callback: types.CallbackQuery):
     parts = callback.data.split(":")
@@ -71,14 +108,15 @@ async def show_file_view(callback: types.CallbackQuery, owner, repo, path):
     user = await database.get_user(callback.from_user.id)
     client = GitHubClient(user['github_token'])
     
-    data = await client.get_contents(owner, repo, path)
-    if not data or 'content' not in data:
+    data = await file_meta(client, owner, repo, path)
+    raw = await client.get_blob_raw(owner, repo, data['sha'], FILE_PREVIEW_BYTES, data['size']) if data else None
+    if raw is None:
         await callback.answer("Не удалось прочитать файл", show_alert=True)
         return
 
-    try:
-        content = base64.b64decode(data['content']).decode('utf-8')
-    except:
+    complete = len(raw) >= data['size']
+    content = decode_text(raw, complete)
+    if content is None:
         await callback.answer("Бинарный файл. Просмотр недоступен.", show_alert=True)
         return
     
@@ -105,8 +143,8 @@ async def show_file_view(callback: types.CallbackQuery, owner, repo, path):
         port = os.getenv("WEBHOOK_PORT", "8080")
         web_url = f"http://{host}:{port}/editor/{session_uuid}"
 
-    preview = html.escape(content[:500])
-    if len(content) > 500: preview += "..."
+    preview = html.escape(content[:PREVIEW_CHARS])
+    if len(content) > PREVIEW_CHARS or not complete: preview += "..."
     
     ext = path.split('.')[-1]
     
@@ -133,11 +171,22 @@ async def edit_file_start(callback: types.CallbackQuery, state: FSMContext):
     
     user = await database.get_user(callback.from_user.id)
     client = GitHubClient(user['github_token'])
-    data = await client.get_contents(owner, repo_name, path)
-    
-    content = base64.b64decode(data['content']).decode('utf-8')
+    data = await file_meta(client, owner, repo_name, path)
+    if not data:
+        await callback.answer("Не удалось прочитать файл", show_alert=True)
+        return
+    # UTF-8 символ — до 4 байт: заведомо большой файл даже не качаем
+    if data['size'] > CHAT_EDIT_MAX_CHARS * 4:
+        await callback.answer("Файл слишком большой для чата! Используй Web Editor.", show_alert=True)
+        return
+
+    raw = await client.get_blob_raw(owner, repo_name, data['sha'], size=data['size'])
+    content = decode_text(raw) if raw is not None else None
+    if content is None:
+        await callback.answer("Не удалось прочитать файл как текст", show_alert=True)
+        return
     
-    if len(content) > 3000:
+    if len(content) > CHAT_EDIT_MAX_CHARS:
         await callback.answer("Файл слишком большой для чата! Используй Web Editor.", show_alert=True)
         return
 
@@ -5,6 +5,7 @@ from aiogram.fsm.context import FSMContext
 
 import database
 import keyboards
+import prefetch
 from github_client import GitHubClient
 
 router = Router()
@@ -18,6 +19,7 @@ async def delete_msg(bot, chat_id, msg_id):
     except: pass
 
 async def show_repos_page(callback: types.CallbackQuery, page: int):
+    prefetch.cancel(callback.from_user.id)
     user = await database.get_user(callback.from_user.id)
     if not user:
         await callback.answer("Авторизуйся!", show_alert=True)
@@ -49,6 +51,8 @@ async def show_repos_page(callback: types.CallbackQuery, page: int):
         parse_mode="HTML",
         reply_markup=keyboards.repo_list_pagination(repos, page, has_next, filter_mode)
     )
+    # Пока пользователь выбирает — подтягиваем видимые репо в кэш
+    prefetch.schedule(callback.from_user.id, user['github_token'], repos)
 
 @router.callback_query(F.data.startswith("repos:"))
 async def list_repos_paginated(callback: types.CallbackQuery):
@@ -69,6 +73,9 @@ async def noop_handler(callback: types.CallbackQuery):
 @router.callback_query(F.data.startswith("view:"))
 async def view_repo(callback: types.CallbackQuery):
     _, owner, repo_name = callback.data.split(":")
+    # Префетч страницы больше не нужен, в том числе открытого репо: дальше его
+    # грузят интерактивные запросы, фоновые только заняли бы лимит зря
+    prefetch.cancel(callback.from_user.id)
     
     user = await database.get_user(callback.from_user.id)
     client = GitHubClient(user['github_token'])
@@ -1,18 +1,30 @@
 import asyncio
+import hmac
 import logging
+import multiprocessing
 import os
 import sys
-import html
 import ssl
+import time
 from aiohttp import web
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from dotenv import load_dotenv
 
 import database
-import keyboards
+import github_client
+import notifications
+import prefetch
+import tree_index
 from handlers import router 
 from github_client import verify_signature
 from web_editor import editor_handler, editor_save_handler
+from webhook_queue import WebhookQueue
+from webhook_dedup import DeliveryDeduplicator
+from delivery import DeliveryScheduler
+from fsm_storage import SQLiteStorage
+from push_parser import WEBHOOK_MAX_BODY
 
 load_dotenv()
 
@@ -21,6 +33,18 @@ WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")
 WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
 # WEBHOOK_HOST теперь используется как fallback, если нет BASE_URL
 WEBHOOK_HOST = "0.0.0.0" 
+# Свой Bot API сервер (локальный telegram-bot-api или фейк для нагрузочных тестов)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# all   — бот и веб-сервер в одном процессе (по умолчанию)
+# split — WEB_WORKERS веб-процессов на одном порту (SO_REUSEPORT) + отдельный процесс бота
+# web / bot — только одна сторона (когда процессы запускаются раздельно, например systemd)
+RUN_MODE = os.getenv("RUN_MODE", "all")
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", 2))
+
+# /webhook-stats: с токеном — только с заголовком Authorization: Bearer <токен>,
+# без токена — только напрямую с localhost (не через прокси)
+WEBHOOK_STATS_TOKEN = os.getenv("WEBHOOK_STATS_TOKEN")
 
 # SSL Config
 SSL_CERT = os.getenv("SSL_CERT")
@@ -28,73 +52,103 @@ SSL_KEY = os.getenv("SSL_KEY")
 
 logging.basicConfig(level=logging.INFO, stream=sys.stdout)
 
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=BOT_TOKEN, session=session)
+fsm_storage = SQLiteStorage()
+dp = Dispatcher(storage=fsm_storage)
+
+delivery_scheduler = DeliveryScheduler(bot)
+push_coalescer = notifications.PushCoalescer(delivery_scheduler)
+
+async def _process_webhook(event_type, body):
+    return await notifications.process_event(push_coalescer, event_type, body)
+
+async def _stop_webhook_processing():
+    """Накопленные дайджесты отправляются сейчас, строки их доставок удаляются после отправки"""
+    await webhook_queue.stop()
+    await webhook_dedup.stop()
+    await push_coalescer.flush_all()
+    await webhook_queue.wait_acks()
+    # start_polling при выходе уже закрыл сессию бота, flush_all мог открыть ее снова
+    await bot.session.close()
+
+webhook_queue = WebhookQueue(_process_webhook)
+webhook_dedup = DeliveryDeduplicator()
+
+async def _forget_delivery(delivery_id):
+    try:
+        await webhook_dedup.forget(delivery_id)
+    except Exception as e:
+        logging.error(f"Dedup forget failed for {delivery_id}: {e}")
 
 async def github_webhook_handle(request):
     try:
+        started = time.monotonic()
         signature = request.headers.get('X-Hub-Signature-256')
         body = await request.read()
         
         if WEBHOOK_SECRET and not verify_signature(body, WEBHOOK_SECRET, signature):
              return web.Response(status=403, text="Invalid Signature")
+        webhook_queue.record("verify", (time.monotonic() - started) * 1000)
 
-        data = await request.json()
         event_type = request.headers.get('X-GitHub-Event')
-        
-        if event_type == 'push':
-            repo_full_name = data['repository']['full_name']
-            pusher_name = data['pusher']['name']
-            commits = data['commits']
-            compare_url = data.get('compare', data['repository']['html_url'])
-            
-            subscriber_ids = await database.get_subscribers(repo_full_name)
-            
-            if subscriber_ids:
-                msg_text = (
-                    f"🚀 <b>{html.escape(repo_full_name)}</b>\n"
-                    f"👤 <code>{html.escape(pusher_name)}</code>\n\n"
-                )
-                
-                for c in commits[:5]:
-                    commit_msg = html.escape(c['message'].splitlines()[0])
-                    msg_text += f"▪️ {commit_msg}\n"
-                
-                if len(commits) > 5: 
-                    msg_text += f"<i>+ {len(commits)-5} more...</i>"
-
-                kb = keyboards.push_notification_kb(compare_url)
-
-                for user_id in subscriber_ids:
-                    user = await database.get_user(user_id)
-                    if not user: continue
-                    if user['ignore_own_pushes'] and user['github_username'] == pusher_name:
-                        continue
-                    try:
-                        await bot.send_message(
-                            chat_id=user_id, 
-                            text=msg_text, 
-                            parse_mode="HTML",
-                            reply_markup=kb,
-                            disable_web_page_preview=True
-                        )
-                    except Exception as e:
-                        logging.error(f"Failed to send to {user_id}: {e}")
-
-        return web.Response(text="OK")
+        delivery_id = request.headers.get('X-GitHub-Delivery')
+
+        # Повторная доставка от GitHub — уже обработали
+        if await webhook_dedup.is_duplicate(delivery_id):
+            return web.Response(text="Duplicate")
+
+        # Только сохраняем и сразу отвечаем, рассылку делают воркеры.
+        # Не приняли — снимаем отметку, иначе повтор от GitHub отсеется как дубликат
+        try:
+            accepted = await webhook_queue.put(delivery_id, event_type, body)
+        except Exception as e:
+            logging.error(f"Webhook enqueue failed: {e}")
+            await _forget_delivery(delivery_id)
+            return web.Response(status=500)
+        if not accepted:
+            await _forget_delivery(delivery_id)
+            return web.Response(status=503, text="Queue is full")
+
+        return web.Response(status=202, text="Accepted")
     except Exception as e:
         logging.error(f"Webhook fatal: {e}")
         return web.Response(status=500)
 
-async def start_webhook_server():
-    app = web.Application()
+def _stats_allowed(request):
+    if WEBHOOK_STATS_TOKEN:
+        return hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {WEBHOOK_STATS_TOKEN}")
+    return request.remote in ("127.0.0.1", "::1") and "X-Forwarded-For" not in request.headers
+
+async def webhook_stats_handle(request):
+    if not _stats_allowed(request):
+        return web.Response(status=403, text="Forbidden")
+    stats = webhook_queue.stats()
+    stats["delivery"] = delivery_scheduler.stats()
+    stats["coalescing"] = push_coalescer.stats()
+    stats["dedup"] = webhook_dedup.stats()
+    stats["user_cache"] = database.user_cache_stats()
+    stats["db_writes"] = database.write_batch_stats()
+    stats["fsm"] = fsm_storage.stats()
+    stats["github_cache"] = github_client.cache_stats()
+    stats["github_ratelimit"] = github_client.ratelimit_stats()
+    stats["github_singleflight"] = github_client.flight_stats()
+    stats["tree_index"] = tree_index.stats()
+    stats["prefetch"] = prefetch.stats()
+    return web.json_response(stats)
+
+def create_app():
+    app = web.Application(client_max_size=WEBHOOK_MAX_BODY)
     app['bot'] = bot
     
     app.router.add_post('/github-webhook', github_webhook_handle)
+    app.router.add_get('/webhook-stats', webhook_stats_handle)
     app.router.add_get('/editor/{uuid}', editor_handler)
     app.router.add_post('/editor/{uuid}/save', editor_save_handler)
-    
-    runner = web.AppRunner(app)
+    return app
+
+async def start_webhook_server(reuse_port: bool = False):
+    runner = web.AppRunner(create_app())
     await runner.setup()
     
     # --- SSL CONFIGURATION ---
@@ -107,21 +161,97 @@ async def start_webhook_server():
         else:
             logging.error("❌ SSL paths provided but files not found!")
     
-    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT, ssl_context=ssl_context)
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT, ssl_context=ssl_context, reuse_port=reuse_port)
     await site.start()
-    logging.info(f"🕸 Web Server running on port {WEBHOOK_PORT}")
+    logging.info(f"🕸 Web Server running on port {WEBHOOK_PORT} (pid {os.getpid()})")
 
 async def main():
     await database.init_db()
+    await github_client.init_session()
     dp.include_router(router)
+    await webhook_queue.start()
+    await webhook_dedup.start()
     await start_webhook_server()
+    maintenance = asyncio.create_task(database.maintenance_loop())
+    sweeper = asyncio.create_task(database.editor_sweeper_loop())
     
     logging.info("🤖 Bot Polling Started")
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    try:
+        await bot.delete_webhook(drop_pending_updates=True)
+        await dp.start_polling(bot)
+    finally:
+        maintenance.cancel()
+        sweeper.cancel()
+        await _stop_webhook_processing()
+        await prefetch.shutdown()
+        await github_client.close_session()
+        await database.close_db()
+
+async def run_web():
+    """Веб-воркер: принимает вебхуки (пишет их в общую очередь в SQLite) и обслуживает редактор"""
+    await database.init_db()
+    await github_client.init_session()
+    await webhook_dedup.start()
+    await start_webhook_server(reuse_port=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await webhook_dedup.stop()
+        await github_client.close_session()
+        await database.close_db()
+
+async def run_bot():
+    """Процесс бота: polling + разбор общей очереди вебхуков"""
+    await database.init_db()
+    await github_client.init_session()
+    dp.include_router(router)
+    await webhook_queue.start(poll=True)
+    maintenance = asyncio.create_task(database.maintenance_loop())
+    sweeper = asyncio.create_task(database.editor_sweeper_loop())
+
+    logging.info("🤖 Bot Polling Started")
+    try:
+        await bot.delete_webhook(drop_pending_updates=True)
+        await dp.start_polling(bot)
+    finally:
+        maintenance.cancel()
+        sweeper.cancel()
+        await _stop_webhook_processing()
+        await prefetch.shutdown()
+        await github_client.close_session()
+        await database.close_db()
+
+async def prepare_db():
+    # Пул соединений закрываем: дочерние процессы откроют свой
+    await database.init_db()
+    await database.close_db()
+
+def web_worker():
+    try:
+        asyncio.run(run_web())
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == "__main__":
+    processes = []
     try:
-        asyncio.run(main())
+        if RUN_MODE in ("split", "web"):
+            # Схема создается один раз до старта воркеров
+            asyncio.run(prepare_db())
+            for _ in range(WEB_WORKERS):
+                process = multiprocessing.Process(target=web_worker, daemon=True)
+                process.start()
+                processes.append(process)
+
+        if RUN_MODE == "split" or RUN_MODE == "bot":
+            asyncio.run(run_bot())
+        elif RUN_MODE == "web":
+            for process in processes:
+                process.join()
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
-        pass
\ No newline at end of file
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
\ No newline at end of file
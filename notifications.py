@@ -0,0 +1,151 @@
+import asyncio
+import html
+import logging
+import os
+import time
+
+import database
+import keyboards
+from push_parser import parse_push, PushPayloadError
+
+# Окно склейки пушей одного репо (сек). 0 — отправлять каждый пуш сразу.
+PUSH_COALESCE_WINDOW = float(os.getenv("PUSH_COALESCE_WINDOW", 2))
+# Максимальная задержка дайджеста при непрерывном шторме пушей
+PUSH_COALESCE_MAX_WAIT = float(os.getenv("PUSH_COALESCE_MAX_WAIT", 10))
+
+def render_push_digest(repo_full_name: str, pushes: list):
+    """Один текст на серию пушей: общий список коммитов, диапазон compare, все авторы"""
+    pushers = list(dict.fromkeys(p['pusher'] for p in pushes))
+    commits = [c for p in pushes for c in p['commits']]
+    commit_count = sum(p['commit_count'] for p in pushes)
+
+    # Нулевой SHA: ветку создали (before) или удалили (after) — общего диапазона нет
+    first_before, last_after = pushes[0]['before'].strip('0'), pushes[-1]['after'].strip('0')
+    if len(pushes) == 1 or not first_before or not last_after:
+        compare_url = pushes[-1]['compare']
+    else:
+        compare_url = f"{pushes[-1]['html_url']}/compare/{pushes[0]['before'][:12]}...{pushes[-1]['after'][:12]}"
+
+    msg_text = (
+        f"🚀 <b>{html.escape(repo_full_name)}</b>\n"
+        f"👤 <code>{html.escape(', '.join(pushers))}</code>\n"
+    )
+    if len(pushes) > 1:
+        msg_text += f"📦 <i>{len(pushes)} pushes</i>\n"
+    msg_text += "\n"
+
+    for message in commits[:5]:
+        commit_msg = html.escape(message.splitlines()[0]) if message else ""
+        msg_text += f"▪️ {commit_msg}\n"
+
+    if commit_count > 5:
+        msg_text += f"<i>+ {commit_count-5} more...</i>"
+
+    return msg_text, compare_url, pushers
+
+async def notify_pushes(scheduler, repo_full_name: str, pushes: list):
+    recipients = await database.get_push_recipients(repo_full_name)
+    if not recipients:
+        return
+
+    msg_text, compare_url, pushers = render_push_digest(repo_full_name, pushes)
+    kb = keyboards.push_notification_kb(compare_url)
+
+    # Свои пуши скрываем, только если в серии не было чужих
+    chat_ids = [
+        user['user_id'] for user in recipients
+        if not (user['ignore_own_pushes'] and pushers == [user['github_username']])
+    ]
+    await scheduler.send_many(
+        chat_ids,
+        text=msg_text,
+        parse_mode="HTML",
+        reply_markup=kb,
+        disable_web_page_preview=True
+    )
+
+class PushCoalescer:
+    """
+    Копит пуши в одну ветку репо в течение окна и шлет подписчикам один дайджест.
+    add() возвращает future, который завершается после отправки дайджеста
+    (или None, если пуш отправлен сразу) — до этого доставка остается в очереди.
+    """
+    def __init__(self, scheduler, window: float = PUSH_COALESCE_WINDOW, max_wait: float = PUSH_COALESCE_MAX_WAIT):
+        self.scheduler = scheduler
+        self.window = window
+        self.max_wait = max_wait
+        self._pending = {}
+        self.events = 0
+        self.digests = 0
+
+    async def add(self, repo_full_name: str, push: dict):
+        self.events += 1
+        if self.window <= 0:
+            await self._send(repo_full_name, [push])
+            return None
+
+        # Разные ветки не склеиваем: у них несвязанные диапазоны коммитов
+        key = (repo_full_name, push.get('ref', ''))
+        now = time.monotonic()
+        entry = self._pending.get(key)
+        if entry:
+            entry['pushes'].append(push)
+            entry['last'] = now
+            return entry['done']
+
+        entry = self._pending[key] = {
+            'pushes': [push], 'first': now, 'last': now,
+            'done': asyncio.get_running_loop().create_future(),
+        }
+        entry['task'] = asyncio.create_task(self._flush_later(key, entry))
+        return entry['done']
+
+    async def _flush_later(self, key: tuple, entry: dict):
+        while True:
+            deadline = min(entry['last'] + self.window, entry['first'] + self.max_wait)
+            delay = deadline - time.monotonic()
+            if delay <= 0: break
+            await asyncio.sleep(delay)
+        self._pending.pop(key, None)
+        await self._send_entry(key[0], entry)
+
+    async def _send_entry(self, repo_full_name: str, entry: dict):
+        try:
+            await self._send(repo_full_name, entry['pushes'])
+        finally:
+            if not entry['done'].done():
+                entry['done'].set_result(None)
+
+    async def _send(self, repo_full_name: str, pushes: list):
+        self.digests += 1
+        try:
+            await notify_pushes(self.scheduler, repo_full_name, pushes)
+        except Exception as e:
+            logging.error(f"Push digest for {repo_full_name} failed: {e}")
+
+    async def flush_all(self):
+        entries = list(self._pending.items())
+        self._pending.clear()
+        for (repo_full_name, _), entry in entries:
+            entry['task'].cancel()
+            await self._send_entry(repo_full_name, entry)
+
+    def stats(self):
+        return {
+            "window_s": self.window,
+            "events": self.events,
+            "digests": self.digests,
+            "pending_repos": len(self._pending),
+        }
+
+async def process_event(coalescer: PushCoalescer, event_type: str, body: bytes):
+    """Разбор одного вебхука (вызывается воркером очереди); future дайджеста или None"""
+    if event_type != 'push':
+        return
+
+    try:
+        push = parse_push(body)
+    except PushPayloadError as e:
+        logging.error(f"Bad push payload: {e}")
+        return
+    return await coalescer.add(push['full_name'], push)
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import os
+
+import tree_index
+from github_client import GitHubClient
+from github_ratelimit import RateLimitDeferred, BACKGROUND, GITHUB_BUDGET_LOW
+
+# После показа страницы репозиториев подгружаем в кэш детали и индекс дерева
+# (корневой листинг) для видимых репо — следующим тапом пользователь откроет один из них
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", 3))
+
+_tasks = {}
+_stats = {'batches': 0, 'repos': 0, 'cancelled': 0, 'skipped_low_budget': 0, 'deferred': 0, 'errors': 0}
+
+def schedule(user_id: int, token: str, repos: list):
+    """Запустить префетч для страницы; предыдущий префетч пользователя отменяется"""
+    cancel(user_id)
+    if not PREFETCH_ENABLED or not repos: return
+    client = GitHubClient(token, priority=BACKGROUND)
+    # Бюджет и так на исходе — не тратим его на догадки
+    if client.budget().fraction() < GITHUB_BUDGET_LOW:
+        _stats['skipped_low_budget'] += 1
+        return
+    targets = [(r['owner']['login'], r['name']) for r in repos]
+    task = asyncio.create_task(_run(client, targets))
+    _tasks[user_id] = task
+    task.add_done_callback(lambda t: _tasks.pop(user_id, None) if _tasks.get(user_id) is t else None)
+
+def cancel(user_id: int):
+    """Пользователь ушел со страницы — догадки больше не нужны"""
+    task = _tasks.pop(user_id, None)
+    if task is not None and not task.done():
+        task.cancel()
+        _stats['cancelled'] += 1
+
+async def _run(client: GitHubClient, targets: list):
+    _stats['batches'] += 1
+    sem = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+    stop = asyncio.Event()
+
+    async def one(owner, repo):
+        async with sem:
+            if stop.is_set(): return
+            try:
+                if await client.get_repo_details(owner, repo):
+                    await tree_index.get_index(client, owner, repo)
+                    _stats['repos'] += 1
+            except RateLimitDeferred:
+                # Лимитер отложил фоновый запрос — остальные тоже не пройдут
+                _stats['deferred'] += 1
+                stop.set()
+            except Exception as e:
+                _stats['errors'] += 1
+                logging.debug(f"Prefetch {owner}/{repo} failed: {e}")
+
+    await asyncio.gather(*(one(owner, repo) for owner, repo in targets))
+
+async def shutdown():
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _tasks.clear()
+
+def stats():
+    return {**_stats, 'running': len(_tasks)}
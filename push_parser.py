@@ -0,0 +1,43 @@
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# GitHub сам режет payload на 25 MB, больше принимать незачем
+WEBHOOK_MAX_BODY = int(os.getenv("WEBHOOK_MAX_BODY", 25 * 1024 * 1024))
+PUSH_PREVIEW_COMMITS = 5
+
+class PushPayloadError(ValueError):
+    pass
+
+def _loads(body: bytes):
+    return orjson.loads(body) if orjson else json.loads(body)
+
+def parse_push(body: bytes, max_commits: int = PUSH_PREVIEW_COMMITS):
+    """
+    Достает из push-вебхука только нужные поля: repository.full_name/html_url,
+    pusher.name, ref, compare, before/after, первые max_commits сообщений и общее число коммитов.
+    Остальное дерево payload сразу освобождается.
+    """
+    if len(body) > WEBHOOK_MAX_BODY:
+        raise PushPayloadError(f"Push payload too large: {len(body)} bytes")
+    try:
+        data = _loads(body)
+        repository = data['repository']
+        commits = data.get('commits') or []
+        return {
+            'full_name': repository['full_name'],
+            'html_url': repository['html_url'],
+            'pusher': data['pusher']['name'],
+            'ref': data.get('ref') or '',
+            'compare': data.get('compare') or repository['html_url'],
+            'before': data.get('before') or '',
+            'after': data.get('after') or '',
+            'commits': [c.get('message') or "" for c in commits[:max_commits]],
+            'commit_count': len(commits),
+        }
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise PushPayloadError(f"Malformed push payload: {e}") from e
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# main.py создает Bot при импорте
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+
+import database
+import github_client
+from github_cache import ResponseCache
+from github_disk_cache import DiskCache
+from github_ratelimit import RateLimiter
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Своя БД на тест. run(scenario) выполняет корутину с поднятой схемой и закрывает пул"""
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "bot.db"))
+    # Блокировки модуля привязываются к циклу событий, а у каждого теста свой asyncio.run
+    monkeypatch.setattr(database, "_write_lock", asyncio.Lock())
+    monkeypatch.setattr(database, "_pool_lock", asyncio.Lock())
+    monkeypatch.setattr(database, "_batch", [])
+    monkeypatch.setattr(database, "_batch_task", None)
+    monkeypatch.setattr(database, "_user_cache", type(database._user_cache)())
+
+    def run(scenario):
+        async def wrapper():
+            await database.init_db()
+            try:
+                return await scenario()
+            finally:
+                await database.close_db()
+        return asyncio.run(wrapper())
+    return run
+
+@pytest.fixture
+def github(monkeypatch):
+    """
+    Чистое состояние github_client и фейковый GitHub:
+    async with github(handler) as calls — handler(request) отвечает на все запросы,
+    calls — список (method, path_qs) в порядке прихода.
+    """
+    monkeypatch.setattr(github_client, "_cache", ResponseCache())
+    monkeypatch.setattr(github_client, "disk_cache", DiskCache(path=""))
+    monkeypatch.setattr(github_client, "rate_limiter", RateLimiter())
+    monkeypatch.setattr(github_client, "_inflight", {})
+    monkeypatch.setattr(github_client, "_public_repos", type(github_client._public_repos)())
+    monkeypatch.setattr(github_client, "_session", None)
+
+    @asynccontextmanager
+    async def serve(handler):
+        calls = []
+
+        async def recorder(request):
+            calls.append((request.method, request.path_qs))
+            return await handler(request)
+
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/{tail:.*}", recorder)
+        server = TestServer(app)
+        await server.start_server()
+        monkeypatch.setattr(github_client, "GITHUB_API", str(server.make_url("")).rstrip("/"))
+        monkeypatch.setattr(github_client, "GITHUB_GRAPHQL_URL", f"{github_client.GITHUB_API}/graphql")
+        try:
+            yield calls
+        finally:
+            await github_client.close_session()
+            await server.close()
+    return serve
@@ -0,0 +1,206 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import database
+import web_editor
+
+def test_get_user_does_not_cache_row_changed_during_read(db, monkeypatch):
+    async def scenario():
+        await database.set_user_data(1, "old-token", "alice")
+        database.invalidate_user(1)
+
+        real_read = database._read
+        read_done = asyncio.Event()
+        release = asyncio.Event()
+
+        @asynccontextmanager
+        async def slow_read():
+            async with real_read() as conn:
+                yield conn
+            # Строка уже прочитана, но в кэш еще не попала
+            read_done.set()
+            await release.wait()
+        monkeypatch.setattr(database, "_read", slow_read)
+
+        reader = asyncio.create_task(database.get_user(1))
+        await read_done.wait()
+        await database.set_user_data(1, "new-token", "alice")
+        release.set()
+        assert (await reader)["github_token"] == "old-token"
+
+        monkeypatch.setattr(database, "_read", real_read)
+        assert (await database.get_user(1))["github_token"] == "new-token"
+    db(scenario)
+
+def test_get_user_caches_when_nothing_changed(db):
+    async def scenario():
+        await database.set_user_data(1, "tok", "alice")
+        database.invalidate_user(1)
+        await database.get_user(1)
+        misses = database.user_cache_stats()["misses"]
+        assert (await database.get_user(1))["github_token"] == "tok"
+        assert database.user_cache_stats()["misses"] == misses
+    db(scenario)
+
+async def _user_version():
+    async with database._read() as conn:
+        async with conn.execute("PRAGMA user_version") as cursor:
+            return (await cursor.fetchone())[0]
+
+def test_migrations_are_idempotent(db):
+    async def scenario():
+        assert await _user_version() == database.MIGRATIONS[-1][0]
+        # Повторный init_db (рестарт, второй процесс) ничего не ломает
+        await database.init_db()
+        assert await _user_version() == database.MIGRATIONS[-1][0]
+    db(scenario)
+
+def test_migration_moves_legacy_drafts(db):
+    import sqlite3
+    conn = sqlite3.connect(database.DB_NAME)
+    conn.executescript("""
+        CREATE TABLE users (user_id INTEGER PRIMARY KEY, github_token TEXT, github_username TEXT,
+                            ignore_own_pushes BOOLEAN DEFAULT 0, repo_filter TEXT DEFAULT 'all');
+        CREATE TABLE editor_sessions (uuid TEXT PRIMARY KEY, user_id INTEGER, owner TEXT, repo TEXT,
+                                      path TEXT, original_sha TEXT, pending_content TEXT,
+                                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        INSERT INTO users (user_id, github_token, github_username) VALUES (7, 'tok', 'bob');
+        INSERT INTO editor_sessions (uuid, user_id, owner, repo, path, original_sha, pending_content)
+        VALUES ('u1', 7, 'o', 'r', 'a.txt', 'sha', 'draft text');
+    """)
+    conn.close()
+
+    async def scenario():
+        assert await _user_version() == database.MIGRATIONS[-1][0]
+        assert (await database.get_user(7))["github_username"] == "bob"
+        async with database._read() as conn:
+            async with conn.execute("SELECT pending_content FROM editor_sessions") as cursor:
+                assert (await cursor.fetchone())[0] is None
+            async with conn.execute("SELECT uuid, content FROM editor_drafts") as cursor:
+                assert [tuple(r) for r in await cursor.fetchall()] == [("u1", "draft text")]
+    db(scenario)
+
+def test_failed_job_rolls_back_only_itself(db):
+    async def scenario():
+        def insert(user_id):
+            async def job(conn):
+                await conn.execute("INSERT INTO users (user_id, github_username) VALUES (?, ?)", (user_id, f"u{user_id}"))
+                return user_id
+            return job
+
+        async def failing(conn):
+            await conn.execute("INSERT INTO users (user_id, github_username) VALUES (2, 'half')")
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            database._batched(insert(1)),
+            database._batched(failing),
+            database._batched(insert(3)),
+            return_exceptions=True,
+        )
+        assert results[0] == 1 and results[2] == 3
+        assert isinstance(results[1], ValueError)
+        # Все три job'а ушли одной группой
+        assert database.write_batch_stats()["max_batch"] >= 3
+
+        async with database._read() as conn:
+            async with conn.execute("SELECT user_id FROM users ORDER BY user_id") as cursor:
+                assert [r[0] for r in await cursor.fetchall()] == [1, 3]
+    db(scenario)
+
+async def _editor_client(bot=None):
+    app = web.Application()
+    app['bot'] = bot
+    app.router.add_get('/editor/{uuid}', web_editor.editor_handler)
+    app.router.add_post('/editor/{uuid}/save', web_editor.editor_save_handler)
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    return client
+
+async def _expire_session(uuid: str):
+    async with database._write() as conn:
+        await conn.execute("UPDATE editor_sessions SET created_at = datetime('now', ?) WHERE uuid = ?",
+                           (f"-{database.EDITOR_SESSION_TTL + 60} seconds", uuid))
+
+def test_editor_expired_is_410_unknown_is_404(db):
+    async def scenario():
+        await database.set_user_data(1, "tok", "alice")
+        await database.create_editor_session("old", 1, "o", "r", "a.py", "sha")
+        await _expire_session("old")
+        # Истекшая сессия скрыта от обычного чтения, но видна с with_expired
+        assert await database.get_editor_session("old") is None
+        assert (await database.get_editor_session("old", with_expired=True))["expired"]
+
+        client = await _editor_client()
+        try:
+            for method, path in (("GET", "/editor/{}"), ("POST", "/editor/{}/save")):
+                resp = await client.request(method, path.format("old"), data="x")
+                assert resp.status == 410
+                resp = await client.request(method, path.format("missing"), data="x")
+                assert resp.status == 404
+        finally:
+            await client.close()
+        # В истекшую сессию черновик не пишется
+        assert (await database.get_editor_session("old", with_expired=True))["pending_content"] is None
+    db(scenario)
+
+def test_editor_binary_file_is_415(db, github):
+    async def handler(request):
+        if request.path == "/repos/o/r/git/blobs/bin":
+            return web.Response(body=b"\x89PNG\r\n\x1a\n\xff\xfe")
+        return web.Response(body="print('hi')\n".encode())
+
+    async def scenario():
+        await database.set_user_data(1, "tok", "alice")
+        await database.create_editor_session("img", 1, "o", "r", "logo.png", "bin")
+        await database.create_editor_session("code", 1, "o", "r", "a.py", "txt")
+        async with github(handler):
+            client = await _editor_client()
+            try:
+                resp = await client.get("/editor/img")
+                assert resp.status == 415
+                resp = await client.get("/editor/code")
+                assert resp.status == 200
+                assert "print('hi')" in await resp.text()
+            finally:
+                await client.close()
+    db(scenario)
+
+def test_editor_draft_compressed_round_trip(db):
+    class FakeBot:
+        def __init__(self):
+            self.sent = []
+
+        async def send_message(self, **kwargs):
+            self.sent.append(kwargs)
+
+    big = "строка кода\n" * (database.EDITOR_DRAFT_COMPRESS_MIN // 10)
+    bot = FakeBot()
+
+    async def stored(uuid):
+        async with database._read() as conn:
+            cursor = await conn.execute("SELECT content, compressed FROM editor_drafts WHERE uuid = ?", (uuid,))
+            return tuple(await cursor.fetchone())
+
+    async def scenario():
+        await database.create_editor_session("s1", 1, "o", "r", "a.py", "sha")
+        client = await _editor_client(bot)
+        try:
+            resp = await client.post("/editor/s1/save", data=big.encode())
+            assert resp.status == 200
+        finally:
+            await client.close()
+        assert bot.sent[0]["chat_id"] == 1
+
+        content, compressed = await stored("s1")
+        assert compressed == 1 and isinstance(content, bytes) and len(content) < len(big.encode())
+        assert (await database.get_editor_session("s1"))["pending_content"] == big
+
+        # Маленький черновик поверх большого хранится как есть
+        await database.update_editor_content("s1", "x = 1\n")
+        assert await stored("s1") == ("x = 1\n", 0)
+        assert (await database.get_editor_session("s1"))["pending_content"] == "x = 1\n"
+    db(scenario)
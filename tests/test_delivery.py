@@ -0,0 +1,87 @@
+import asyncio
+import json
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
+
+import database
+import delivery
+from delivery import DeliveryScheduler
+
+class FakeBot:
+    """send_message по очереди бросает ошибки из errors, потом отвечает успехом"""
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = []
+
+    async def send_message(self, chat_id, **kwargs):
+        self.calls.append((time.monotonic(), chat_id, kwargs))
+        if self.errors:
+            raise self.errors.pop(0)
+
+def _retry_after(seconds):
+    return TelegramRetryAfter(None, "Too Many Requests", seconds)
+
+def _network_error():
+    return TelegramNetworkError(None, "connection reset")
+
+async def _dead_letters():
+    async with database._read() as conn:
+        cursor = await conn.execute("SELECT chat_id, payload, error, attempts FROM dead_letters")
+        return [tuple(r) for r in await cursor.fetchall()]
+
+def test_retry_after_pauses_globally(db):
+    bot = FakeBot([_retry_after(1)])
+
+    async def scenario():
+        scheduler = DeliveryScheduler(bot, global_rate=100, chat_rate=100)
+        started = time.monotonic()
+        assert await scheduler.send(1, text="hi")
+        # Повтор только после паузы, и пауза касается всего бота
+        assert bot.calls[1][0] - bot.calls[0][0] >= 0.9
+        assert scheduler.global_bucket.blocked_until >= started + 1
+        # Другой чат тоже ждет окончания флуд-контроля
+        await scheduler.send(2, text="other")
+        assert bot.calls[2][0] >= started + 0.9
+        assert (scheduler.sent, scheduler.retried, scheduler.dead) == (2, 1, 0)
+        assert await _dead_letters() == []
+    db(scenario)
+
+def test_network_errors_retried_then_dead_lettered(db, monkeypatch):
+    monkeypatch.setattr(delivery, "TG_BACKOFF_BASE", 0.01)
+    bot = FakeBot([_network_error() for _ in range(5)])
+
+    async def scenario():
+        scheduler = DeliveryScheduler(bot, global_rate=100, chat_rate=100, max_retries=2)
+        assert not await scheduler.send(7, text="hi", parse_mode="HTML")
+        assert len(bot.calls) == 3
+        # Три попытки — два повтора, после последней повтора нет
+        assert (scheduler.sent, scheduler.retried, scheduler.dead) == (0, 2, 1)
+        [(chat_id, payload, error, attempts)] = await _dead_letters()
+        assert chat_id == 7 and attempts == 3
+        assert json.loads(payload) == {"text": "hi", "parse_mode": "HTML"}
+        assert "connection reset" in error
+    db(scenario)
+
+def test_network_error_recovers(db, monkeypatch):
+    monkeypatch.setattr(delivery, "TG_BACKOFF_BASE", 0.01)
+    bot = FakeBot([_network_error()])
+
+    async def scenario():
+        scheduler = DeliveryScheduler(bot, global_rate=100, chat_rate=100, max_retries=2)
+        assert await scheduler.send(7, text="hi")
+        assert (scheduler.sent, scheduler.retried, scheduler.dead) == (1, 1, 0)
+        assert await _dead_letters() == []
+    db(scenario)
+
+def test_permanent_error_not_retried(db):
+    bot = FakeBot([TelegramBadRequest(None, "chat not found")])
+
+    async def scenario():
+        scheduler = DeliveryScheduler(bot, global_rate=100, chat_rate=100)
+        assert not await scheduler.send(9, text="hi")
+        assert len(bot.calls) == 1
+        assert (scheduler.retried, scheduler.dead) == (0, 1)
+        [(chat_id, _, _, attempts)] = await _dead_letters()
+        assert (chat_id, attempts) == (9, 1)
+    db(scenario)
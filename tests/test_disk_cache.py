@@ -0,0 +1,90 @@
+import asyncio
+
+from aiohttp import web
+
+import github_client
+from github_client import GitHubClient
+from github_disk_cache import DiskCache
+
+def _entry(data, tags):
+    return {'data': data, 'etag': '"e"', 'last_modified': None, 'size': 1,
+            'expires_at': 2e9, 'stale_until': 2e9, 'tags': list(tags)}
+
+def test_invalidate_waits_for_running_flush(tmp_path):
+    async def scenario():
+        cache = DiskCache(path=str(tmp_path / "http.db"))
+        real_apply = cache._apply
+        started = asyncio.Event()
+
+        async def slow_apply(db, ops):
+            started.set()
+            await asyncio.sleep(0.1)
+            await real_apply(db, ops)
+        cache._apply = slow_apply
+
+        cache.put("k", _entry({"v": 1}, ["repo:o/r"]))
+        background = asyncio.create_task(cache.flush())
+        await started.wait()
+        # Фоновый сброс уже забрал put — инвалидация должна пройти после него
+        await cache.invalidate("repo:o/r")
+        await background
+        assert await cache.get("k") is None
+        await cache.close()
+    asyncio.run(scenario())
+
+def test_invalidate_failure_is_logged_and_retried(tmp_path, caplog):
+    async def scenario():
+        cache = DiskCache(path=str(tmp_path / "http.db"))
+        cache.put("k", _entry({"v": 1}, ["repo:o/r"]))
+        await cache.flush()
+
+        real_apply = cache._apply
+        async def broken_apply(db, ops):
+            raise OSError("disk I/O error")
+        cache._apply = broken_apply
+        await cache.invalidate("repo:o/r")
+        assert "invalidate failed" in caplog.text
+        assert cache.stats()["pending"] == 1
+
+        cache._apply = real_apply
+        await cache.flush()
+        assert await cache.get("k") is None
+        await cache.close()
+    asyncio.run(scenario())
+
+def test_update_file_succeeds_when_disk_cache_is_broken(github, tmp_path, monkeypatch):
+    cache = DiskCache(path=str(tmp_path / "http.db"))
+
+    async def broken_conn():
+        raise OSError("unable to open database file")
+    cache._conn = broken_conn
+    monkeypatch.setattr(github_client, "disk_cache", cache)
+
+    async def handler(request):
+        return web.json_response({"content": {"sha": "b" * 40}, "commit": {"sha": "c" * 40}}, status=200)
+
+    async def scenario():
+        async with github(handler):
+            ok, res = await GitHubClient("tok").update_file("o", "r", "a.txt", "msg", "text", "a" * 40)
+            assert ok and res["commit"]["sha"] == "c" * 40
+    asyncio.run(scenario())
+
+def test_response_larger_than_memory_cache_goes_to_disk(github, tmp_path, monkeypatch):
+    from github_cache import ResponseCache
+    monkeypatch.setattr(github_client, "_cache", ResponseCache(max_bytes=10))
+    cache = DiskCache(path=str(tmp_path / "http.db"))
+    monkeypatch.setattr(github_client, "disk_cache", cache)
+
+    async def handler(request):
+        return web.json_response({"type": "file", "sha": "a" * 40}, headers={"ETag": '"e"'})
+
+    async def scenario():
+        async with github(handler):
+            client = GitHubClient("tok")
+            # В память ответ не влезает, но запрос не должен из-за этого падать
+            assert (await client.get_contents("o", "r", "a.txt"))["sha"] == "a" * 40
+            assert github_client._cache.stats()["entries"] == 0
+            await cache.flush()
+            key = client._get_cache_key("repos/o/r/contents/a.txt")
+            assert (await cache.get(key))["data"]["sha"] == "a" * 40
+    asyncio.run(scenario())
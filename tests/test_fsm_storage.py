@@ -0,0 +1,56 @@
+
+from aiogram.fsm.storage.base import StorageKey
+
+import database
+from fsm_storage import SQLiteStorage
+
+def _key(user_id):
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+def test_flush_persists_and_restores_states(db):
+    async def scenario():
+        storage = SQLiteStorage(flush_interval=3600)
+        await storage.set_state(_key(1), "Edit:waiting")
+        await storage.set_data(_key(1), {"path": "a.txt", "big": "x" * 5000})
+        await storage.flush()
+
+        restarted = SQLiteStorage(flush_interval=3600)
+        assert await restarted.get_state(_key(1)) == "Edit:waiting"
+        assert (await restarted.get_data(_key(1)))["big"] == "x" * 5000
+    db(scenario)
+
+def test_unserializable_key_does_not_block_others(db):
+    async def scenario():
+        storage = SQLiteStorage(flush_interval=3600)
+        await storage.set_data(_key(1), {"ok": 1})
+        await storage.set_data(_key(2), {"bad": object()})
+        await storage.set_data(_key(3), {"ok": 3})
+        await storage.flush()
+
+        assert storage.stats()["dirty"] == 0
+        assert storage.stats()["dropped"] == 1
+        restarted = SQLiteStorage(flush_interval=3600)
+        assert await restarted.get_data(_key(1)) == {"ok": 1}
+        assert await restarted.get_data(_key(2)) == {}
+        assert await restarted.get_data(_key(3)) == {"ok": 3}
+    db(scenario)
+
+def test_db_failure_keeps_keys_dirty(db, monkeypatch):
+    async def scenario():
+        storage = SQLiteStorage(flush_interval=3600)
+        await storage.set_data(_key(1), {"ok": 1})
+
+        async def broken(save, delete):
+            raise RuntimeError("database is locked")
+        real = database.save_fsm_states
+        monkeypatch.setattr(database, "save_fsm_states", broken)
+        try:
+            await storage.flush()
+        except RuntimeError:
+            pass
+        assert storage.stats()["dirty"] == 1
+
+        monkeypatch.setattr(database, "save_fsm_states", real)
+        await storage.flush()
+        assert await SQLiteStorage().get_data(_key(1)) == {"ok": 1}
+    db(scenario)
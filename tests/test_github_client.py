@@ -0,0 +1,180 @@
+import asyncio
+
+from aiohttp import web
+
+import github_client
+from github_client import GitHubClient
+from github_ratelimit import BACKGROUND
+
+def test_fresh_contents_revalidates_cached_sha(github):
+    state = {"sha": "a" * 40}
+    conditional = []
+
+    async def handler(request):
+        etag = f'"{state["sha"]}"'
+        conditional.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.json_response({"type": "file", "sha": state["sha"]}, headers={"ETag": etag})
+
+    async def scenario():
+        async with github(handler) as calls:
+            client = GitHubClient("tok")
+            assert (await client.get_contents("o", "r", "a.txt"))["sha"] == "a" * 40
+
+            # Файл поменяли мимо бота: обычное чтение отдает кэш,
+            # а перед записью sha перепроверяется условным запросом
+            state["sha"] = "b" * 40
+            assert (await client.get_contents("o", "r", "a.txt"))["sha"] == "a" * 40
+            assert len(calls) == 1
+            assert (await client.get_contents("o", "r", "a.txt", fresh=True))["sha"] == "b" * 40
+            assert conditional[-1] == f'"{"a" * 40}"'
+
+            # Не изменился — 304, данные из кэша
+            assert (await client.get_contents("o", "r", "a.txt", fresh=True))["sha"] == "b" * 40
+            assert len(calls) == 3
+    asyncio.run(scenario())
+
+def _slow_contents(tokens_ok):
+    async def handler(request):
+        await asyncio.sleep(0.1)
+        if request.headers.get("Authorization") not in tokens_ok:
+            return web.json_response({"message": "Bad credentials"}, status=401)
+        return web.json_response({"type": "file", "sha": "a" * 40})
+    return handler
+
+def test_public_singleflight_shares_success_across_tokens(github):
+    github_client._remember_visibility({"full_name": "o/r", "private": False})
+
+    async def scenario():
+        async with github(_slow_contents({"Bearer t1", "Bearer t2"})) as calls:
+            first, second = await asyncio.gather(
+                GitHubClient("t1").get_contents("o", "r", "a.txt"),
+                GitHubClient("t2").get_contents("o", "r", "a.txt"),
+            )
+            assert first == second == {"type": "file", "sha": "a" * 40}
+            assert len(calls) == 1
+            assert github_client.flight_stats()["coalesced_public"] == 1
+    asyncio.run(scenario())
+
+def test_public_singleflight_does_not_share_failure(github):
+    github_client._remember_visibility({"full_name": "o/r", "private": False})
+
+    async def scenario():
+        async with github(_slow_contents({"Bearer good"})) as calls:
+            leader = asyncio.create_task(GitHubClient("revoked").get_contents("o", "r", "a.txt"))
+            await asyncio.sleep(0.02)
+            follower = await GitHubClient("good").get_contents("o", "r", "a.txt")
+            assert await leader is None
+            # 401 чужого токена не должен превратиться в "нет доступа" у ведомого
+            assert follower == {"type": "file", "sha": "a" * 40}
+            assert len(calls) == 2
+            assert github_client.flight_stats()["public_retries"] == 1
+    asyncio.run(scenario())
+
+def _blob_server(size, content_length=True, delay=0.0):
+    async def handler(request):
+        # Range не поддерживается: отдаем файл целиком
+        resp = web.StreamResponse()
+        if content_length:
+            resp.content_length = size
+        await resp.prepare(request)
+        for offset in range(0, size, 1000):
+            await resp.write(b"x" * min(1000, size - offset))
+            if delay: await asyncio.sleep(delay)
+        await resp.write_eof()
+        return resp
+    return handler
+
+def test_blob_limit_enforced_when_range_ignored(github):
+    async def scenario():
+        async with github(_blob_server(50_000)):
+            raw = await GitHubClient("tok").get_blob_raw("o", "r", "s" * 40, limit=1500)
+            assert raw == b"x" * 1500
+    asyncio.run(scenario())
+
+def test_blob_larger_than_max_is_rejected(github, monkeypatch):
+    monkeypatch.setattr(github_client, "GITHUB_RAW_MAX_BYTES", 4000)
+
+    async def scenario():
+        for content_length in (True, False):
+            async with github(_blob_server(5000, content_length)):
+                assert await GitHubClient("tok").get_blob_raw("o", "r", "s" * 40) is None
+        async with github(_blob_server(4000, content_length=False)):
+            assert len(await GitHubClient("tok").get_blob_raw("o", "r", "s" * 40)) == 4000
+    asyncio.run(scenario())
+
+def test_blob_download_is_not_bound_by_session_total_timeout(github, monkeypatch):
+    monkeypatch.setattr(github_client, "GITHUB_TIMEOUT", 0.3)
+    monkeypatch.setattr(github_client, "_TRANSFER_TIMEOUT",
+                        github_client.aiohttp.ClientTimeout(total=10, sock_read=0.3))
+
+    async def scenario():
+        # Поток идет дольше общего таймаута сессии, но без пауз больше sock_read
+        async with github(_blob_server(6000, delay=0.1)):
+            assert len(await GitHubClient("tok").get_blob_raw("o", "r", "s" * 40)) == 6000
+    asyncio.run(scenario())
+
+def test_interactive_does_not_wait_for_queued_background_leader(github):
+    async def handler(request):
+        return web.json_response({"type": "file", "sha": "a" * 40})
+
+    async def scenario():
+        async with github(handler) as calls:
+            # Фоновые слоты заняты: префетч стоит в очереди лимитера
+            github_client.rate_limiter._background = asyncio.Semaphore(0)
+            background = asyncio.create_task(GitHubClient("tok", BACKGROUND).get_contents("o", "r", "a.txt"))
+            await asyncio.sleep(0.05)
+            data = await asyncio.wait_for(GitHubClient("tok").get_contents("o", "r", "a.txt"), 1)
+            assert data["sha"] == "a" * 40 and len(calls) == 1
+            background.cancel()
+    asyncio.run(scenario())
+
+def test_background_joins_interactive_leader(github):
+    async def handler(request):
+        await asyncio.sleep(0.1)
+        return web.json_response({"type": "file", "sha": "a" * 40})
+
+    async def scenario():
+        async with github(handler) as calls:
+            await asyncio.gather(
+                GitHubClient("tok").get_contents("o", "r", "a.txt"),
+                GitHubClient("tok", BACKGROUND).get_contents("o", "r", "a.txt"),
+            )
+            assert len(calls) == 1
+    asyncio.run(scenario())
+
+def test_blob_of_known_size_skips_range(github):
+    ranges = []
+
+    async def handler(request):
+        ranges.append(request.headers.get("Range"))
+        if request.headers.get("Range"):
+            return web.Response(status=416)
+        return web.Response(body=b"abc")
+
+    async def scenario():
+        async with github(handler) as calls:
+            client = GitHubClient("tok")
+            # Пустой файл (__init__.py, .gitkeep) — без запроса
+            assert await client.get_blob_raw("o", "r", "e" * 40, 1000, size=0) == b""
+            assert calls == []
+            assert await client.get_blob_raw("o", "r", "s" * 40, 1000, size=3) == b"abc"
+            assert ranges == [None]
+    asyncio.run(scenario())
+
+def test_update_file_invalidates_repo_and_own_repo_lists(github):
+    async def handler(request):
+        return web.json_response({"content": {"sha": "b" * 40}, "commit": {"sha": "c" * 40}})
+
+    async def scenario():
+        async with github(handler):
+            client, other = GitHubClient("tok"), GitHubClient("other")
+            github_client._store_entry("contents", {}, 60, (github_client.repo_tag("O", "R"),))
+            github_client._store_entry("my-repos", {}, 60, (client._repos_tag,))
+            github_client._store_entry("their-repos", {}, 60, (other._repos_tag,))
+            assert (await client.update_file("o", "r", "a.txt", "msg", "text", "a" * 40))[0]
+            assert github_client._cache.get("contents") is None
+            assert github_client._cache.get("my-repos") is None
+            assert github_client._cache.get("their-repos") is not None
+    asyncio.run(scenario())
@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import database
+import notifications
+from webhook_queue import WebhookQueue
+
+class FakeScheduler:
+    def __init__(self):
+        self.sent = []
+
+    async def send_many(self, chat_ids, **kwargs):
+        self.sent.append((chat_ids, kwargs["text"], kwargs["reply_markup"]))
+
+def push_body(repo="o/r", ref="refs/heads/main", before="a" * 40, after="b" * 40, message="fix"):
+    return json.dumps({
+        "ref": ref,
+        "before": before,
+        "after": after,
+        "compare": f"https://github.com/{repo}/compare/{before[:12]}...{after[:12]}",
+        "repository": {"full_name": repo, "html_url": f"https://github.com/{repo}"},
+        "pusher": {"name": "bob"},
+        "commits": [{"message": message}],
+    }).encode()
+
+async def _subscribe(repo="o/r"):
+    await database.set_user_data(1, "tok", "alice")
+    await database.add_subscription(1, repo)
+
+async def _wait_for(predicate, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+def _queue(coalescer):
+    async def handler(event_type, body):
+        return await notifications.process_event(coalescer, event_type, body)
+    return WebhookQueue(handler, maxsize=10, workers=1)
+
+def test_delivery_row_kept_until_digest_sent(db):
+    async def scenario():
+        await _subscribe()
+        scheduler = FakeScheduler()
+        coalescer = notifications.PushCoalescer(scheduler, window=0.3, max_wait=1)
+        queue = _queue(coalescer)
+        await queue.start()
+        try:
+            await queue.put("d1", "push", push_body())
+            await _wait_for(lambda: coalescer.events == 1)
+            # Дайджест еще в окне склейки: при падении доставка поднимется из таблицы
+            await asyncio.sleep(0.05)
+            assert await database.count_pending_deliveries() == 1
+            assert scheduler.sent == []
+
+            await _wait_for(lambda: scheduler.sent)
+            await queue.wait_acks()
+            assert await database.count_pending_deliveries() == 0
+        finally:
+            await queue.stop()
+    db(scenario)
+
+def test_shutdown_flushes_pending_digests(db):
+    async def scenario():
+        await _subscribe()
+        scheduler = FakeScheduler()
+        coalescer = notifications.PushCoalescer(scheduler, window=60, max_wait=60)
+        queue = _queue(coalescer)
+        await queue.start()
+        await queue.put("d1", "push", push_body(message="one"))
+        await queue.put("d2", "push", push_body(message="two"))
+        await _wait_for(lambda: coalescer.events == 2)
+
+        await queue.stop()
+        await coalescer.flush_all()
+        await queue.wait_acks()
+
+        assert len(scheduler.sent) == 1
+        assert "one" in scheduler.sent[0][1] and "two" in scheduler.sent[0][1]
+        assert await database.count_pending_deliveries() == 0
+    db(scenario)
+
+def test_unsent_digest_is_restored_after_restart(db):
+    async def scenario():
+        await _subscribe()
+        coalescer = notifications.PushCoalescer(FakeScheduler(), window=60, max_wait=60)
+        queue = _queue(coalescer)
+        await queue.start()
+        await queue.put("d1", "push", push_body())
+        await _wait_for(lambda: coalescer.events == 1)
+        # "Падение": ни flush_all, ни wait_acks
+        await queue.stop()
+        for entry in coalescer._pending.values():
+            entry['task'].cancel()
+
+        scheduler = FakeScheduler()
+        restarted = _queue(notifications.PushCoalescer(scheduler, window=0))
+        await restarted.start()
+        try:
+            await _wait_for(lambda: scheduler.sent)
+            for _ in range(500):
+                if await database.count_pending_deliveries() == 0: break
+                await asyncio.sleep(0.01)
+            assert await database.count_pending_deliveries() == 0
+        finally:
+            await restarted.stop()
+    db(scenario)
+
+def _push(ref="refs/heads/main", before="a" * 40, after="b" * 40, message="m"):
+    from push_parser import parse_push
+    return parse_push(push_body(ref=ref, before=before, after=after, message=message))
+
+def test_digest_compare_spans_the_series():
+    pushes = [_push(before="1" * 40, after="2" * 40), _push(before="2" * 40, after="3" * 40)]
+    _, compare_url, _ = notifications.render_push_digest("o/r", pushes)
+    assert compare_url == f"https://github.com/o/r/compare/{'1' * 12}...{'3' * 12}"
+
+def test_digest_after_branch_creation_uses_last_compare():
+    pushes = [_push(before="0" * 40, after="2" * 40), _push(before="2" * 40, after="3" * 40)]
+    _, compare_url, _ = notifications.render_push_digest("o/r", pushes)
+    assert compare_url == pushes[-1]['compare']
+    assert "000000000000" not in compare_url
+
+def test_pushes_to_different_branches_are_not_merged():
+    async def scenario():
+        scheduler = FakeScheduler()
+        coalescer = notifications.PushCoalescer(scheduler, window=60, max_wait=60)
+        sent = []
+        async def fake_send(repo_full_name, pushes):
+            sent.append((repo_full_name, [p['ref'] for p in pushes]))
+        coalescer._send = fake_send
+        await coalescer.add("o/r", _push(ref="refs/heads/main"))
+        await coalescer.add("o/r", _push(ref="refs/heads/dev"))
+        await coalescer.add("o/r", _push(ref="refs/heads/main"))
+        await coalescer.flush_all()
+        assert sorted(sent) == [("o/r", ["refs/heads/dev"]), ("o/r", ["refs/heads/main", "refs/heads/main"])]
+    asyncio.run(scenario())
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+import prefetch
+import tree_index
+from github_client import GitHubClient
+
+@pytest.fixture(autouse=True)
+def fake_fetch(monkeypatch):
+    monkeypatch.setattr(prefetch, "_tasks", {})
+    monkeypatch.setattr(prefetch, "PREFETCH_ENABLED", True)
+    done = []
+
+    async def get_repo_details(self, owner, repo):
+        await asyncio.sleep(0.1)
+        return {"full_name": f"{owner}/{repo}"}
+
+    async def get_index(client, owner, repo, fresh=False):
+        done.append(repo)
+
+    monkeypatch.setattr(GitHubClient, "get_repo_details", get_repo_details)
+    monkeypatch.setattr(tree_index, "get_index", get_index)
+    return done
+
+def _repos(*names):
+    return [{"owner": {"login": "Owner"}, "name": name} for name in names]
+
+def test_leaving_the_listing_cancels_everything(fake_fetch):
+    async def scenario():
+        prefetch.schedule(1, "tok", _repos("a", "b"))
+        await asyncio.sleep(0.01)
+        prefetch.cancel(1)
+        await asyncio.sleep(0.2)
+        assert fake_fetch == []
+    asyncio.run(scenario())
+
+def test_new_page_replaces_previous_prefetch(fake_fetch):
+    async def scenario():
+        prefetch.schedule(1, "tok", _repos("a"))
+        prefetch.schedule(1, "tok", _repos("x", "y"))
+        await asyncio.sleep(0.2)
+        assert sorted(fake_fetch) == ["x", "y"]
+        await prefetch.shutdown()
+    asyncio.run(scenario())
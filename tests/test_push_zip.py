@@ -0,0 +1,247 @@
+import asyncio
+import base64
+import hashlib
+import json
+import zipfile
+
+import pytest
+from aiohttp import web
+
+import github_client
+from github_client import GitHubClient, repo_tag
+
+def blob_sha(data: bytes):
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+class FakeRepo:
+    """Минимальный Git Data API одного репо o/r с веткой main"""
+    def __init__(self):
+        self.blobs, self.trees, self.commits = {}, {}, {}
+        self.head = None
+        self.blob_posts = 0
+        self.blob_failures = []  # ответы (status, headers, message) на очередные заливки блобов
+        self.blob_delay = 0.0
+        self.truncated = False
+
+    def files(self):
+        return self.trees[self.commits[self.head]]
+
+    def _tree(self, files):
+        sha = hashlib.sha1(json.dumps(sorted(files.items())).encode()).hexdigest()
+        self.trees[sha] = dict(files)
+        return sha
+
+    async def handler(self, request):
+        path, method = request.path, request.method
+        body = await request.json() if method in ("POST", "PUT", "PATCH") else None
+        if path == "/repos/o/r":
+            return web.json_response({"full_name": "o/r", "private": True, "default_branch": "main"})
+        if path == "/repos/o/r/branches/main":
+            if not self.head:
+                return web.json_response({"message": "Branch not found"}, status=404)
+            return web.json_response({"commit": {"sha": self.head, "commit": {"tree": {"sha": self.commits[self.head]}}}})
+        if path.startswith("/repos/o/r/contents/") and method == "PUT":
+            data = base64.b64decode(body["content"])
+            self.blobs[blob_sha(data)] = data
+            tree = self._tree({path[len("/repos/o/r/contents/"):]: ("100644", blob_sha(data))})
+            self.head = hashlib.sha1(b"c" + tree.encode()).hexdigest()
+            self.commits[self.head] = tree
+            return web.json_response({"commit": {"sha": self.head, "tree": {"sha": tree}}}, status=201)
+        if path.startswith("/repos/o/r/git/trees/"):
+            sha = path.rsplit("/", 1)[1]
+            items = [{"path": p, "mode": m, "type": "blob", "sha": s} for p, (m, s) in self.trees[sha].items()]
+            if self.truncated:
+                items = items[:1]
+            return web.json_response({"sha": sha, "truncated": self.truncated, "tree": items})
+        if path == "/repos/o/r/git/blobs":
+            self.blob_posts += 1
+            if self.blob_delay:
+                await asyncio.sleep(self.blob_delay)
+            if self.blob_failures:
+                status, headers, message = self.blob_failures.pop(0)
+                return web.json_response({"message": message}, status=status, headers=headers)
+            data = base64.b64decode(body["content"])
+            self.blobs[blob_sha(data)] = data
+            return web.json_response({"sha": blob_sha(data)}, status=201)
+        if path == "/repos/o/r/git/trees":
+            files = dict(self.trees[body["base_tree"]]) if "base_tree" in body else {}
+            for item in body["tree"]:
+                assert item["sha"] in self.blobs
+                files[item["path"]] = (item["mode"], item["sha"])
+            return web.json_response({"sha": self._tree(files)}, status=201)
+        if path == "/repos/o/r/git/commits":
+            sha = hashlib.sha1(json.dumps(body).encode()).hexdigest()
+            self.commits[sha] = body["tree"]
+            return web.json_response({"sha": sha}, status=201)
+        if path == "/repos/o/r/git/refs/heads/main":
+            self.head = body["sha"]
+            return web.json_response({}, status=200)
+        return web.json_response({"message": "Not Found"}, status=404)
+
+@pytest.fixture
+def make_zip(tmp_path):
+    def make(files, name="a.zip"):
+        path = tmp_path / name
+        with zipfile.ZipFile(path, "w") as zf:
+            for member, data in files.items():
+                zf.writestr(member, data)
+        return str(path)
+    return make
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(github_client, "GITHUB_PUSH_BACKOFF", 0.01)
+
+def test_push_into_empty_repo_then_replace(github, make_zip):
+    repo = FakeRepo()
+    first = make_zip({"a.txt": "A", "src/b.py": "B", "../evil": "x", ".git/config": "x"}, "1.zip")
+    second = make_zip({"a.txt": "A2", "src/b.py": "B"}, "2.zip")
+
+    async def scenario():
+        async with github(repo.handler):
+            client = GitHubClient("tok")
+            ok, res = await client.push_zip("o", "r", first, "init", replace=False)
+            assert ok and res["commit"] == repo.head
+            assert sorted(repo.files()) == ["a.txt", "src/b.py"]
+
+            # Повтор того же архива — нового коммита нет
+            head = repo.head
+            ok, res = await client.push_zip("o", "r", first, "again")
+            assert ok and res["commit"] is None and repo.head == head
+
+            posts = repo.blob_posts
+            ok, res = await client.push_zip("o", "r", second, "v2")
+            assert ok and res["changed"] == 1 and res["uploaded"] == 1
+            assert repo.blob_posts == posts + 1
+            assert repo.blobs[repo.files()["a.txt"][1]] == b"A2"
+    asyncio.run(scenario())
+
+def test_overlay_keeps_existing_files(github, make_zip):
+    repo = FakeRepo()
+
+    async def scenario():
+        async with github(repo.handler):
+            client = GitHubClient("tok")
+            assert (await client.push_zip("o", "r", make_zip({"a.txt": "A"}, "1.zip"), "init"))[0]
+            ok, res = await client.push_zip("o", "r", make_zip({"b.txt": "B"}, "2.zip"), "add", replace=False)
+            assert ok and res["deleted"] == 0
+            assert sorted(repo.files()) == ["a.txt", "b.txt"]
+    asyncio.run(scenario())
+
+def test_noop_push_still_invalidates_cache(github, make_zip):
+    repo = FakeRepo()
+    archive = make_zip({"a.txt": "A"})
+
+    async def scenario():
+        async with github(repo.handler):
+            client = GitHubClient("tok")
+            assert (await client.push_zip("o", "r", archive, "init"))[0]
+            github_client._store_entry("stale", {"sha": "old"}, 60, (repo_tag("o", "r"),))
+            ok, res = await client.push_zip("o", "r", archive, "again")
+            assert ok and res["commit"] is None
+            assert github_client._cache.get("stale") is None
+    asyncio.run(scenario())
+
+def test_blob_upload_retries_on_secondary_rate_limit(github, make_zip):
+    repo = FakeRepo()
+    repo.blob_failures = [
+        (403, {"Retry-After": "0"}, "You have exceeded a secondary rate limit"),
+        (429, {"Retry-After": "0"}, "Too many requests"),
+    ]
+
+    async def scenario():
+        async with github(repo.handler):
+            ok, res = await GitHubClient("tok").push_zip("o", "r", make_zip({"a.txt": "A", "b.txt": "B"}), "init")
+            assert ok, res
+            assert sorted(repo.files()) == ["a.txt", "b.txt"]
+            # Один файл ушел через contents, второй — блобом с двумя повторами
+            assert repo.blob_posts == 3
+    asyncio.run(scenario())
+
+def test_blob_upload_does_not_retry_other_errors(github, make_zip):
+    repo = FakeRepo()
+    repo.blob_failures = [(422, {}, "Invalid request")]
+
+    async def scenario():
+        async with github(repo.handler):
+            ok, res = await GitHubClient("tok").push_zip("o", "r", make_zip({"a.txt": "A", "b.txt": "B"}), "init")
+            assert not ok and "Invalid request" in res
+            assert repo.blob_posts == 1
+    asyncio.run(scenario())
+
+def test_blob_upload_gives_up_when_retry_after_is_too_long(github, make_zip, monkeypatch):
+    monkeypatch.setattr(github_client, "GITHUB_PUSH_MAX_WAIT", 5)
+    repo = FakeRepo()
+    repo.blob_failures = [(403, {"Retry-After": "3600"}, "You have exceeded a secondary rate limit")]
+
+    async def scenario():
+        async with github(repo.handler):
+            ok, res = await asyncio.wait_for(
+                GitHubClient("tok").push_zip("o", "r", make_zip({"a.txt": "A", "b.txt": "B"}), "init"), 3)
+            assert not ok and "secondary rate limit" in res
+            assert repo.blob_posts == 1
+    asyncio.run(scenario())
+
+def test_blob_upload_uses_transfer_timeout(github, make_zip, monkeypatch):
+    monkeypatch.setattr(github_client, "GITHUB_TIMEOUT", 0.2)
+    monkeypatch.setattr(github_client, "_TRANSFER_TIMEOUT",
+                        github_client.aiohttp.ClientTimeout(total=10, sock_read=1))
+    repo = FakeRepo()
+    repo.blob_delay = 0.4
+
+    async def scenario():
+        async with github(repo.handler):
+            ok, res = await GitHubClient("tok").push_zip("o", "r", make_zip({"a.txt": "A", "b.txt": "B"}), "init")
+            assert ok, res
+    asyncio.run(scenario())
+
+def test_replace_without_changes_posts_nothing(github, make_zip):
+    repo = FakeRepo()
+    archive = make_zip({"a.txt": "A", "b.txt": "B"})
+
+    async def scenario():
+        async with github(repo.handler) as calls:
+            client = GitHubClient("tok")
+            assert (await client.push_zip("o", "r", archive, "init"))[0]
+            calls.clear()
+            ok, res = await client.push_zip("o", "r", archive, "again", replace=True)
+            assert ok and res["commit"] is None and res["deleted"] == 0
+            assert [c for c in calls if c[0] == "POST"] == []
+    asyncio.run(scenario())
+
+def test_replace_deletes_missing_files(github, make_zip):
+    repo = FakeRepo()
+
+    async def scenario():
+        async with github(repo.handler):
+            client = GitHubClient("tok")
+            assert (await client.push_zip("o", "r", make_zip({"a.txt": "A", "b.txt": "B"}, "1.zip"), "init"))[0]
+            ok, res = await client.push_zip("o", "r", make_zip({"a.txt": "A"}, "2.zip"), "drop b")
+            assert ok and res["commit"] and res["changed"] == 0 and res["deleted"] == 1
+            assert sorted(repo.files()) == ["a.txt"]
+    asyncio.run(scenario())
+
+def test_truncated_tree_reports_unknown_deletions(github, make_zip):
+    repo = FakeRepo()
+
+    async def scenario():
+        async with github(repo.handler):
+            client = GitHubClient("tok")
+            assert (await client.push_zip("o", "r", make_zip({"a.txt": "A", "b.txt": "B", "c.txt": "C"}, "1.zip"), "init"))[0]
+            repo.truncated = True
+            ok, res = await client.push_zip("o", "r", make_zip({"a.txt": "A2"}, "2.zip"), "v2")
+            assert ok and res["commit"] and res["deleted"] is None
+            assert sorted(repo.files()) == ["a.txt"]
+    asyncio.run(scenario())
+
+def test_failure_after_bootstrap_reports_partial_commit(github, make_zip):
+    repo = FakeRepo()
+    repo.blob_failures = [(422, {}, "Invalid request")]
+
+    async def scenario():
+        async with github(repo.handler):
+            ok, res = await GitHubClient("tok").push_zip("o", "r", make_zip({"a.txt": "A", "b.txt": "B"}), "init")
+            assert not ok
+            assert "Invalid request" in res and "first commit with a.txt" in res
+            assert sorted(repo.files()) == ["a.txt"]
+    asyncio.run(scenario())
@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+import pytest
+
+import github_ratelimit
+from github_ratelimit import BACKGROUND, INTERACTIVE, RateLimitDeferred, RateLimiter, TokenBudget
+
+def _headers(remaining, limit=5000, reset=None, **extra):
+    headers = {"X-RateLimit-Limit": str(limit), "X-RateLimit-Remaining": str(remaining),
+               "X-RateLimit-Reset": str(int(reset or time.time() + 3600))}
+    headers.update(extra)
+    return headers
+
+def test_budget_parses_headers():
+    budget = TokenBudget()
+    budget.update(200, _headers(4200, reset=1700000000))
+    assert (budget.limit, budget.remaining, budget.reset_at) == (5000, 4200, 1700000000.0)
+    assert budget.fraction() == pytest.approx(0.84)
+    assert budget.blocked_until == 0
+
+    # Ответ без заголовков лимита (304 и т.п.) ничего не сбрасывает
+    budget.update(304, {})
+    assert budget.remaining == 4200
+
+def test_budget_blocks_on_limits():
+    reset = time.time() + 600
+    budget = TokenBudget()
+    budget.update(403, _headers(0, reset=reset))
+    assert budget.blocked_until == int(reset)
+
+    # Secondary limit: Retry-After важнее сброса основного лимита
+    budget = TokenBudget()
+    budget.update(403, _headers(100, **{"Retry-After": "30"}))
+    assert budget.blocked_until == pytest.approx(time.time() + 30, abs=1)
+
+    budget = TokenBudget()
+    budget.update(429, {})
+    assert budget.blocked_until == pytest.approx(time.time() + 60, abs=1)
+
+    # 403 без признаков лимита (нет доступа) не блокирует токен
+    budget = TokenBudget()
+    budget.update(403, _headers(100))
+    assert budget.blocked_until == 0
+
+def test_record_uses_resource_header():
+    limiter = RateLimiter()
+    limiter.record("tok", 200, _headers(10, limit=30, **{"X-RateLimit-Resource": "search"}))
+    assert limiter.budget("tok", "search").remaining == 10
+    assert limiter.budget("tok").remaining is None
+
+def test_background_deferred_below_reserve(monkeypatch):
+    monkeypatch.setattr(github_ratelimit, "GITHUB_BUDGET_RESERVE", 100)
+    reset = time.time() + 600
+
+    async def scenario():
+        limiter = RateLimiter()
+        limiter.record("tok", 200, _headers(100, reset=reset))
+        with pytest.raises(RateLimitDeferred) as info:
+            async with limiter.slot("tok", BACKGROUND):
+                pytest.fail("background request ran inside the reserve")
+        assert info.value.retry_at == int(reset)
+
+        # Интерактивные запросы резерв расходуют
+        async with limiter.slot("tok", INTERACTIVE) as budget:
+            assert budget.remaining == 100
+        assert limiter.stats()["deferred"] == 1
+
+        # Выше резерва фоновый проходит
+        limiter.record("tok", 200, _headers(4000, reset=reset))
+        async with limiter.slot("tok", BACKGROUND):
+            pass
+    asyncio.run(scenario())
+
+def test_background_deferred_while_blocked():
+    async def scenario():
+        limiter = RateLimiter()
+        limiter.record("tok", 403, _headers(3000, **{"Retry-After": "30"}))
+        with pytest.raises(RateLimitDeferred) as info:
+            async with limiter.slot("tok", BACKGROUND):
+                pass
+        assert info.value.retry_at == pytest.approx(time.time() + 30, abs=1)
+    asyncio.run(scenario())
+
+def test_interactive_waits_when_exhausted(monkeypatch):
+    monkeypatch.setattr(github_ratelimit, "GITHUB_INTERACTIVE_MAX_WAIT", 0.2)
+
+    async def scenario():
+        limiter = RateLimiter()
+        limiter.record("tok", 403, _headers(0, reset=time.time() + 3600))
+        started = time.monotonic()
+        async with limiter.slot("tok", INTERACTIVE):
+            waited = time.monotonic() - started
+        # Ждет, но не дольше потолка — дальше пусть GitHub ответит ошибкой
+        assert 0.15 <= waited < 1
+        assert limiter.stats()["blocked_waits"] == 1
+
+        # Другой токен не затронут
+        started = time.monotonic()
+        async with limiter.slot("other", INTERACTIVE):
+            assert time.monotonic() - started < 0.1
+    asyncio.run(scenario())
+
+def test_interactive_waits_only_until_unblocked(monkeypatch):
+    monkeypatch.setattr(github_ratelimit, "GITHUB_INTERACTIVE_MAX_WAIT", 5)
+
+    async def scenario():
+        limiter = RateLimiter()
+        limiter.budget("tok").blocked_until = time.time() + 0.2
+        started = time.monotonic()
+        async with limiter.slot("tok", INTERACTIVE):
+            assert 0.15 <= time.monotonic() - started < 1
+    asyncio.run(scenario())
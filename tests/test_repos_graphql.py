@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+from aiohttp import web
+
+import github_client
+from github_client import GitHubClient
+
+def _node(n):
+    return {
+        "name": f"repo{n}", "nameWithOwner": f"alice/repo{n}", "owner": {"login": "alice"},
+        "isPrivate": n % 2 == 0, "isFork": False, "isArchived": False, "description": None,
+        "stargazerCount": n, "forkCount": 0, "url": f"https://github.com/alice/repo{n}",
+        "updatedAt": "2024-01-01T00:00:00Z", "pushedAt": "2024-01-01T00:00:00Z",
+        "defaultBranchRef": {"name": "main"} if n else None,
+    }
+
+class FakeGraphQL:
+    def __init__(self, total=5):
+        self.total = total
+        self.queries = []
+        self.fail = False
+
+    async def handler(self, request):
+        if request.path == "/graphql":
+            body = await request.json()
+            variables = body["variables"]
+            self.queries.append(variables)
+            if self.fail:
+                return web.json_response({"errors": [{"message": "boom"}]})
+            start = int(variables["after"] or 0)
+            end = min(start + variables["first"], self.total)
+            return web.json_response({"data": {"viewer": {"repositories": {
+                "pageInfo": {"hasNextPage": end < self.total, "endCursor": str(end)},
+                "nodes": [_node(n) for n in range(start, end)],
+            }}}})
+        if request.path == "/user/repos":
+            return web.json_response([{"name": "rest", "full_name": "alice/rest", "private": False,
+                                       "owner": {"login": "alice"}}])
+        return web.Response(status=404)
+
+def test_node_maps_to_rest_shape():
+    repo = github_client._repo_from_graphql(_node(2))
+    assert repo == {
+        "name": "repo2", "full_name": "alice/repo2", "owner": {"login": "alice"}, "private": True,
+        "fork": False, "archived": False, "description": None, "stargazers_count": 2, "forks_count": 0,
+        "html_url": "https://github.com/alice/repo2", "updated_at": "2024-01-01T00:00:00Z",
+        "pushed_at": "2024-01-01T00:00:00Z", "default_branch": "main",
+    }
+    # Пустой репо — без ветки по умолчанию
+    assert github_client._repo_from_graphql(_node(0))["default_branch"] is None
+
+def test_pages_follow_cursors(github):
+    fake = FakeGraphQL(total=5)
+
+    async def scenario():
+        async with github(fake.handler) as calls:
+            client = GitHubClient("tok")
+            repos, has_next = await client.get_repos(1, per_page=2)
+            assert [r["name"] for r in repos] == ["repo0", "repo1"] and has_next
+            repos, has_next = await client.get_repos(2, per_page=2)
+            assert [r["name"] for r in repos] == ["repo2", "repo3"] and has_next
+            repos, has_next = await client.get_repos(3, per_page=2)
+            assert [r["name"] for r in repos] == ["repo4"] and not has_next
+            assert [q["after"] for q in fake.queries] == [None, "2", "4"]
+            assert fake.queries[0]["affiliations"] == ["OWNER", "COLLABORATOR", "ORGANIZATION_MEMBER"]
+            # Детали репо уже в кэше — открытие из списка без запроса
+            await client.get_repo_details("alice", "repo1")
+            assert all(path == "/graphql" for _, path in calls)
+    asyncio.run(scenario())
+
+def test_owner_filter(github):
+    fake = FakeGraphQL()
+
+    async def scenario():
+        async with github(fake.handler):
+            await GitHubClient("tok").get_repos(1, per_page=2, filter_mode="owner")
+            assert fake.queries[0]["affiliations"] == ["OWNER"]
+    asyncio.run(scenario())
+
+def test_falls_back_to_rest(github):
+    fake = FakeGraphQL()
+
+    async def scenario():
+        async with github(fake.handler) as calls:
+            client = GitHubClient("tok")
+            # Страница 2 без курсора (кнопка пережила рестарт)
+            repos, _ = await client.get_repos(2, per_page=2)
+            assert repos[0]["name"] == "rest" and fake.queries == []
+
+            fake.fail = True
+            repos, _ = await client.get_repos(1, per_page=3)
+            assert repos[0]["name"] == "rest"
+            assert [p.split("?")[0] for _, p in calls] == ["/user/repos", "/graphql", "/user/repos"]
+    asyncio.run(scenario())
+
+def test_cursors_dropped_with_repo_lists(github):
+    fake = FakeGraphQL()
+
+    async def scenario():
+        async with github(fake.handler) as calls:
+            client = GitHubClient("tok")
+            await client.get_repos(1, per_page=2)
+            # Запись в репо меняет порядок sort=updated: старые курсоры больше не годятся
+            await client._invalidate_cache("alice", "repo3")
+            repos, _ = await client.get_repos(2, per_page=2)
+            assert repos[0]["name"] == "rest"
+    asyncio.run(scenario())
@@ -0,0 +1,102 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+from aiohttp import web
+
+import tree_index
+from github_client import GitHubClient
+from tree_index import TreeIndex
+
+ITEMS = [
+    {"path": "README.md", "type": "blob", "size": 10, "sha": "r1"},
+    {"path": "src", "type": "tree", "sha": "t1"},
+    {"path": "src/main.py", "type": "blob", "size": 20, "sha": "m1"},
+    {"path": "src/app.py", "type": "blob", "size": 5, "sha": "a1"},
+    {"path": "vendor/lib", "type": "commit", "sha": "c1"},
+]
+
+@pytest.fixture(autouse=True)
+def clean_index(monkeypatch):
+    monkeypatch.setattr(tree_index, "_trees", OrderedDict())
+    monkeypatch.setattr(tree_index, "_unindexable", OrderedDict())
+    monkeypatch.setattr(tree_index, "_paths", 0)
+    monkeypatch.setattr(tree_index, "_stats", {'hits': 0, 'loaded': 0, 'fallbacks': 0})
+
+def test_lookup_and_listing():
+    index = TreeIndex("root", ITEMS)
+    assert index.lookup("src/main.py") == {"type": "file", "name": "main.py", "path": "src/main.py", "size": 20, "sha": "m1"}
+    assert index.lookup("/src/")["type"] == "dir"
+    assert index.lookup("missing") is None
+    assert [item["name"] for item in index.listing("src")] == ["app.py", "main.py"]
+    assert [item["name"] for item in index.listing("")] == ["README.md", "src"]
+    assert index.listing("README.md") is None
+    assert index.listing("nope") is None
+    # Сабмодули в индекс не попадают
+    assert index.lookup("vendor/lib") is None
+
+def _fake_repo(state):
+    async def handler(request):
+        path = request.path
+        if path == "/repos/o/r":
+            return web.json_response({"full_name": "o/r", "private": True, "default_branch": "main"})
+        if path == "/repos/o/r/branches/main":
+            etag = f'"{state["head"]}"'
+            if request.headers.get("If-None-Match") == etag:
+                return web.Response(status=304, headers={"ETag": etag})
+            return web.json_response({"commit": {"commit": {"tree": {"sha": state["head"]}}}}, headers={"ETag": etag})
+        if path.startswith("/repos/o/r/git/trees/"):
+            return web.json_response({"sha": path.rsplit("/", 1)[1], "tree": ITEMS, "truncated": state.get("truncated", False)})
+        return web.Response(status=404)
+    return handler
+
+def test_get_index_loads_tree_once_per_head(github):
+    state = {"head": "h1"}
+
+    async def scenario():
+        async with github(_fake_repo(state)) as calls:
+            client = GitHubClient("tok")
+            first = await tree_index.get_index(client, "o", "r")
+            second = await tree_index.get_index(client, "o", "r")
+            assert first is second and first.sha == "h1"
+            assert sum(1 for _, p in calls if "/git/trees/" in p) == 1
+            assert tree_index.stats()["hits"] == 1
+
+            # Новый коммит: обычный вызов видит закэшированную голову, fresh — новую
+            state["head"] = "h2"
+            assert (await tree_index.get_index(client, "o", "r")).sha == "h1"
+            assert (await tree_index.get_index(client, "o", "r", fresh=True)).sha == "h2"
+    asyncio.run(scenario())
+
+def test_truncated_tree_falls_back(github):
+    state = {"head": "h1", "truncated": True}
+
+    async def scenario():
+        async with github(_fake_repo(state)) as calls:
+            client = GitHubClient("tok")
+            assert await tree_index.get_index(client, "o", "r") is None
+            assert await tree_index.get_index(client, "o", "r") is None
+            # Обрезанное дерево второй раз не качаем
+            assert sum(1 for _, p in calls if "/git/trees/" in p) == 1
+            assert tree_index.stats()["fallbacks"] == 2
+    asyncio.run(scenario())
+
+def _tree(sha, paths):
+    return TreeIndex(sha, [{"path": f"f{n}", "type": "blob", "size": 1, "sha": f"{sha}{n}"} for n in range(paths)])
+
+def test_cache_is_bounded_by_total_paths(monkeypatch):
+    monkeypatch.setattr(tree_index, "TREE_INDEX_MAX_PATHS", 250)
+    for sha in ("t1", "t2", "t3"):
+        tree_index._store(_tree(sha, 100))
+    assert list(tree_index._trees) == ["t2", "t3"]
+    assert tree_index.stats()["paths"] == 200
+
+    # Одно дерево больше лимита все равно держим — иначе индекс бесполезен
+    tree_index._store(_tree("big", 400))
+    assert list(tree_index._trees) == ["big"] and tree_index.stats()["paths"] == 400
+
+def test_unindexable_set_is_bounded(monkeypatch):
+    monkeypatch.setattr(tree_index, "_UNINDEXABLE_MAX", 2)
+    for sha in ("a", "b", "c"):
+        tree_index._mark_unindexable(sha)
+    assert list(tree_index._unindexable) == ["b", "c"]
@@ -0,0 +1,32 @@
+from webhook_dedup import DeliveryDeduplicator
+
+def test_duplicate_detected_from_memory_and_database(db):
+    async def scenario():
+        dedup = DeliveryDeduplicator(maxsize=1)
+        assert not await dedup.is_duplicate("a")
+        assert await dedup.is_duplicate("a")
+        assert not await dedup.is_duplicate("b")
+        # "a" вытеснен из LRU, но остался в webhook_seen
+        assert await dedup.is_duplicate("a")
+        assert dedup.stats()["memory_hits"] == 1 and dedup.stats()["db_hits"] == 1
+
+        # После рестарта память пуста — спасает таблица
+        assert await DeliveryDeduplicator().is_duplicate("b")
+    db(scenario)
+
+def test_forget_allows_redelivery(db):
+    async def scenario():
+        dedup = DeliveryDeduplicator()
+        assert not await dedup.is_duplicate("a")
+        await dedup.forget("a")
+        assert not await dedup.is_duplicate("a")
+        assert not await dedup.is_duplicate(None)
+        assert not await dedup.is_duplicate(None)
+    db(scenario)
+
+def test_expired_ids_are_accepted_again(db):
+    async def scenario():
+        dedup = DeliveryDeduplicator(ttl=0)
+        assert not await dedup.is_duplicate("a")
+        assert not await DeliveryDeduplicator(ttl=0).is_duplicate("a")
+    db(scenario)
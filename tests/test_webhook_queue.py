@@ -0,0 +1,62 @@
+import asyncio
+
+import database
+from webhook_queue import WebhookQueue
+
+async def _wait_for(predicate, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+def test_restore_drains_backlog_larger_than_queue(db):
+    async def scenario():
+        for n in range(7):
+            await database.enqueue_delivery(f"d{n}", "push", f"{n}".encode(), 0.0)
+
+        seen = []
+        async def handler(event_type, body):
+            seen.append(body)
+        queue = WebhookQueue(handler, maxsize=2, workers=1)
+        await queue.start()
+        try:
+            await _wait_for(lambda: len(seen) == 7)
+            await _wait_for(lambda: queue.queue.qsize() == 0)
+            await asyncio.sleep(0.05)
+        finally:
+            await queue.stop()
+        assert seen == [f"{n}".encode() for n in range(7)]
+        assert await database.count_pending_deliveries() == 0
+    db(scenario)
+
+def test_restore_does_not_replay_deliveries_accepted_after_start(db):
+    async def scenario():
+        for n in range(3):
+            await database.enqueue_delivery(f"old{n}", "push", b"old", 0.0)
+
+        seen = []
+        gate = asyncio.Event()
+        async def handler(event_type, body):
+            await gate.wait()
+            seen.append(body)
+        queue = WebhookQueue(handler, maxsize=10, workers=1)
+        await queue.start()
+        try:
+            assert await queue.put("new", "push", b"new")
+            gate.set()
+            await _wait_for(lambda: len(seen) == 4)
+            await asyncio.sleep(0.1)
+        finally:
+            await queue.stop()
+        assert sorted(seen) == [b"new", b"old", b"old", b"old"]
+    db(scenario)
+
+def test_put_rejects_when_full(db):
+    async def scenario():
+        queue = WebhookQueue(lambda *a: None, maxsize=1, workers=0)
+        queue.local = True
+        assert await queue.put("a", "push", b"1")
+        assert not await queue.put("b", "push", b"2")
+        # Отклоненная доставка не должна остаться в таблице
+        assert await database.count_pending_deliveries() == 1
+    db(scenario)
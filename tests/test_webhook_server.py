@@ -0,0 +1,113 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import main
+
+async def _client():
+    client = TestClient(TestServer(main.create_app()))
+    await client.start_server()
+    return client
+
+def test_stats_localhost_only_without_token(monkeypatch):
+    monkeypatch.setattr(main, "WEBHOOK_STATS_TOKEN", None)
+
+    async def scenario():
+        client = await _client()
+        try:
+            resp = await client.get("/webhook-stats")
+            assert resp.status == 200
+            assert "queue" in await resp.json()
+            # Запрос через обратный прокси приходит тоже с localhost
+            resp = await client.get("/webhook-stats", headers={"X-Forwarded-For": "203.0.113.7"})
+            assert resp.status == 403
+        finally:
+            await client.close()
+    asyncio.run(scenario())
+
+def test_stats_requires_token(monkeypatch):
+    monkeypatch.setattr(main, "WEBHOOK_STATS_TOKEN", "s3cret")
+
+    async def scenario():
+        client = await _client()
+        try:
+            assert (await client.get("/webhook-stats")).status == 403
+            resp = await client.get("/webhook-stats", headers={"Authorization": "Bearer wrong"})
+            assert resp.status == 403
+            resp = await client.get("/webhook-stats", headers={"Authorization": "Bearer s3cret"})
+            assert resp.status == 200
+        finally:
+            await client.close()
+    asyncio.run(scenario())
+
+def test_failed_enqueue_allows_redelivery(db, monkeypatch):
+    monkeypatch.setattr(main, "WEBHOOK_SECRET", None)
+    monkeypatch.setattr(main, "webhook_dedup", main.DeliveryDeduplicator())
+    accepted = []
+
+    async def broken_put(delivery_id, event_type, body):
+        raise RuntimeError("disk I/O error")
+
+    async def put(delivery_id, event_type, body):
+        accepted.append(delivery_id)
+        return True
+
+    async def scenario():
+        client = await _client()
+        headers = {"X-GitHub-Event": "push", "X-GitHub-Delivery": "d-1"}
+        try:
+            monkeypatch.setattr(main.webhook_queue, "put", broken_put)
+            resp = await client.post("/github-webhook", data=b"{}", headers=headers)
+            assert resp.status == 500
+
+            # GitHub повторяет доставку — она не должна считаться дубликатом
+            monkeypatch.setattr(main.webhook_queue, "put", put)
+            resp = await client.post("/github-webhook", data=b"{}", headers=headers)
+            assert resp.status == 202
+            assert accepted == ["d-1"]
+
+            resp = await client.post("/github-webhook", data=b"{}", headers=headers)
+            assert await resp.text() == "Duplicate"
+        finally:
+            await client.close()
+    db(scenario)
+
+def test_full_queue_allows_redelivery(db, monkeypatch):
+    monkeypatch.setattr(main, "WEBHOOK_SECRET", None)
+    monkeypatch.setattr(main, "webhook_dedup", main.DeliveryDeduplicator())
+    results = [False, True]
+
+    async def put(delivery_id, event_type, body):
+        return results.pop(0)
+
+    async def scenario():
+        monkeypatch.setattr(main.webhook_queue, "put", put)
+        client = await _client()
+        headers = {"X-GitHub-Event": "push", "X-GitHub-Delivery": "d-2"}
+        try:
+            assert (await client.post("/github-webhook", data=b"{}", headers=headers)).status == 503
+            assert (await client.post("/github-webhook", data=b"{}", headers=headers)).status == 202
+        finally:
+            await client.close()
+    db(scenario)
+
+def test_run_web_stops_dedup_purge(db, monkeypatch):
+    dedup = main.DeliveryDeduplicator()
+    monkeypatch.setattr(main, "webhook_dedup", dedup)
+    started = asyncio.Event()
+
+    async def start_webhook_server(reuse_port=False):
+        started.set()
+    monkeypatch.setattr(main, "start_webhook_server", start_webhook_server)
+
+    async def scenario():
+        worker = asyncio.create_task(main.run_web())
+        await started.wait()
+        purge = dedup._purge_task
+        assert purge is not None and not purge.done()
+
+        # Остановка воркера (SIGTERM / Ctrl+C)
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+        assert purge.done() and dedup._purge_task is None
+    db(scenario)
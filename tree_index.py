@@ -0,0 +1,122 @@
+import logging
+import os
+from collections import OrderedDict
+
+from github_ratelimit import RateLimitDeferred
+
+# Сколько деревьев (коммитов) держим в памяти
+TREE_INDEX_SIZE = int(os.getenv("TREE_INDEX_SIZE", 50))
+# ...и сколько путей во всех них вместе: память съедают пути, а не число деревьев
+TREE_INDEX_MAX_PATHS = int(os.getenv("TREE_INDEX_MAX_PATHS", 500000))
+# Больше этого числа путей не индексируем (огромные монорепо — по-старому через contents)
+TREE_INDEX_MAX_ENTRIES = int(os.getenv("TREE_INDEX_MAX_ENTRIES", 100000))
+_UNINDEXABLE_MAX = 1000
+
+_trees = OrderedDict()
+_paths = 0
+# SHA деревьев, которые индексировать не стали (обрезаны или слишком большие), LRU
+_unindexable = OrderedDict()
+_stats = {'hits': 0, 'loaded': 0, 'fallbacks': 0}
+
+class TreeIndex:
+    """
+    Индекс путей одного дерева (git/trees/{sha}?recursive=1).
+    entries: path -> (is_dir, size, blob_sha); children: папка -> [имена].
+    Дерево по SHA неизменно, поэтому индекс не устаревает.
+    """
+    __slots__ = ('sha', 'entries', 'children')
+
+    def __init__(self, sha: str, items: list):
+        self.sha = sha
+        self.entries = {}
+        self.children = {"": []}
+        for item in items:
+            if item['type'] == 'commit':
+                continue  # сабмодули в браузере не показываем
+            path = item['path']
+            is_dir = item['type'] == 'tree'
+            self.entries[path] = (is_dir, item.get('size', 0), item['sha'])
+            parent, _, name = path.rpartition('/')
+            self.children.setdefault(parent, []).append(name)
+            if is_dir:
+                self.children.setdefault(path, [])
+        for names in self.children.values():
+            names.sort()
+
+    def lookup(self, path: str):
+        """Метаданные файла/папки в форме ответа contents (без content) или None"""
+        path = path.strip('/')
+        if path == "":
+            return {"type": "dir", "name": "", "path": "", "size": 0, "sha": self.sha}
+        entry = self.entries.get(path)
+        if entry is None: return None
+        is_dir, size, sha = entry
+        return {"type": "dir" if is_dir else "file", "name": path.rpartition('/')[2], "path": path, "size": size, "sha": sha}
+
+    def listing(self, path: str):
+        """Содержимое папки как список из contents API или None, если такой папки нет"""
+        path = path.strip('/')
+        names = self.children.get(path)
+        if names is None: return None
+        prefix = f"{path}/" if path else ""
+        return [self.lookup(prefix + name) for name in names]
+
+async def get_index(client, owner: str, repo: str, fresh: bool = False):
+    """
+    Индекс дерева текущей ветки по умолчанию. Голова ветки перепроверяется
+    через кэш клиента (ETag), само дерево качается один раз на коммит.
+    fresh — перепроверить голову, даже если она в кэше свежая (sha пойдут в запись).
+    None — индекса нет (пустой репо, ошибка, слишком большое дерево): нужен fallback.
+    """
+    try:
+        tree_sha = await client.get_head_tree_sha(owner, repo, fresh)
+        if not tree_sha or tree_sha in _unindexable:
+            if tree_sha: _unindexable.move_to_end(tree_sha)
+            _stats['fallbacks'] += 1
+            return None
+
+        index = _trees.get(tree_sha)
+        if index is not None:
+            _trees.move_to_end(tree_sha)
+            _stats['hits'] += 1
+            return index
+
+        tree = await client.get_tree(owner, repo, tree_sha)
+        if not tree or tree.get('truncated') or len(tree.get('tree', [])) > TREE_INDEX_MAX_ENTRIES:
+            if tree: _mark_unindexable(tree_sha)
+            _stats['fallbacks'] += 1
+            return None
+    except RateLimitDeferred:
+        # Фоновый запрос отложен лимитером — пусть решает вызывающий (префетч)
+        raise
+    except Exception as e:
+        logging.error(f"Tree index for {owner}/{repo} failed: {e}")
+        _stats['fallbacks'] += 1
+        return None
+
+    index = _trees.get(tree_sha)
+    if index is None:
+        # Пока качали дерево, его мог добавить параллельный вызов
+        index = _store(TreeIndex(tree_sha, tree['tree']))
+    _trees.move_to_end(tree_sha)
+    _stats['loaded'] += 1
+    return index
+
+def _store(index: TreeIndex):
+    global _paths
+    _trees[index.sha] = index
+    _paths += len(index.entries)
+    # Только что загруженное дерево оставляем, даже если оно одно больше лимита
+    while len(_trees) > 1 and (len(_trees) > TREE_INDEX_SIZE or _paths > TREE_INDEX_MAX_PATHS):
+        _, evicted = _trees.popitem(last=False)
+        _paths -= len(evicted.entries)
+    return index
+
+def _mark_unindexable(tree_sha: str):
+    _unindexable[tree_sha] = True
+    _unindexable.move_to_end(tree_sha)
+    while len(_unindexable) > _UNINDEXABLE_MAX:
+        _unindexable.popitem(last=False)
+
+def stats():
+    return {**_stats, 'trees': len(_trees), 'paths': _paths, 'unindexable': len(_unindexable)}
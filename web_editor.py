@@ -281,6 +281,10 @@ EDITOR_TEMPLATE = """
                     status.innerText = "✅ Sent to Telegram!";
                     status.style.color = "#2ea043";
                     btn.innerText = "Check your Bot";
+                } else if (resp.status === 410) {
+                    status.innerText = "⌛ Link expired, open the file in the bot again";
+                    status.style.color = "#f85149";
+                    btn.innerText = "Expired";
                 } else {
                     status.innerText = "❌ Error saving";
                     status.style.color = "#f85149";
@@ -309,21 +313,24 @@ EDITOR_TEMPLATE = """
 
 async def editor_handler(request):
     uuid = request.match_info['uuid']
-    session = await database.get_editor_session(uuid)
+    session = await database.get_editor_session(uuid, with_expired=True)
     
     if not session:
         return web.Response(text="Link expired or invalid.", status=404)
+    if session['expired']:
+        return web.Response(text="Link expired. Open the file in the bot again.", status=410)
     
     user = await database.get_user(session['user_id'])
     client = GitHubClient(user['github_token'])
     
-    # Получаем контент
-    file_data = await client.get_contents(session['owner'], session['repo'], session['path'])
-    if not file_data or 'content' not in file_data:
+    # Получаем контент той версии, от которой будет коммит (raw, без base64 и лимита 1 MB)
+    raw = await client.get_blob_raw(session['owner'], session['repo'], session['original_sha'])
+    if raw is None:
         return web.Response(text="Failed to fetch file from GitHub", status=500)
-    
-    import base64
-    content = base64.b64decode(file_data['content']).decode('utf-8')
+    try:
+        content = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return web.Response(text="Binary file cannot be edited.", status=415)
     
     # Lang detection
     ext = session['path'].split('.')[-1]
@@ -355,19 +362,22 @@ async def editor_handler(request):
 
 async def editor_save_handler(request):
     uuid = request.match_info['uuid']
+    session = await database.get_editor_session(uuid, with_expired=True)
+    if not session:
+        return web.Response(text="Link expired or invalid.", status=404)
+    if session['expired']:
+        return web.Response(text="Link expired. Open the file in the bot again.", status=410)
+
     content = await request.text()
-    
     await database.update_editor_content(uuid, content)
     
     bot = request.app['bot']
-    session = await database.get_editor_session(uuid)
-    if session:
-        import keyboards
-        await bot.send_message(
-            chat_id=session['user_id'],
-            text=f"✍️ <b>Web Editor:</b> Получены изменения для <code>{session['path']}</code>.\nСохранить в репозиторий?",
-            parse_mode="HTML",
-            reply_markup=keyboards.web_edit_confirm_kb(uuid)
-        )
+    import keyboards
+    await bot.send_message(
+        chat_id=session['user_id'],
+        text=f"✍️ <b>Web Editor:</b> Получены изменения для <code>{session['path']}</code>.\nСохранить в репозиторий?",
+        parse_mode="HTML",
+        reply_markup=keyboards.web_edit_confirm_kb(uuid)
+    )
 
     return web.Response(text="OK")
\ No newline at end of file
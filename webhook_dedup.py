@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import database
+
+WEBHOOK_DEDUP_SIZE = int(os.getenv("WEBHOOK_DEDUP_SIZE", 10000))
+WEBHOOK_DEDUP_TTL = int(os.getenv("WEBHOOK_DEDUP_TTL", 3 * 24 * 3600))
+WEBHOOK_DEDUP_PURGE_INTERVAL = int(os.getenv("WEBHOOK_DEDUP_PURGE_INTERVAL", 3600))
+
+class DeliveryDeduplicator:
+    """
+    Отсев повторных доставок GitHub по заголовку X-GitHub-Delivery.
+    Горячие id держим в LRU, все остальные — в таблице webhook_seen с TTL.
+    """
+    def __init__(self, maxsize: int = WEBHOOK_DEDUP_SIZE, ttl: int = WEBHOOK_DEDUP_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._seen = OrderedDict()
+        self._purge_task = None
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _remember(self, delivery_id: str, seen_at: float):
+        self._seen[delivery_id] = seen_at
+        self._seen.move_to_end(delivery_id)
+        while len(self._seen) > self.maxsize:
+            self._seen.popitem(last=False)
+
+    async def is_duplicate(self, delivery_id: str) -> bool:
+        """Проверяет id и сразу помечает его как увиденный"""
+        if not delivery_id:
+            return False
+
+        now = time.time()
+        seen_at = self._seen.get(delivery_id)
+        if seen_at is not None and now - seen_at < self.ttl:
+            self._seen.move_to_end(delivery_id)
+            self.memory_hits += 1
+            return True
+
+        is_new = await database.mark_delivery_seen(delivery_id, now, now - self.ttl)
+        self._remember(delivery_id, now)
+        if not is_new:
+            self.db_hits += 1
+            return True
+
+        self.misses += 1
+        return False
+
+    async def forget(self, delivery_id: str):
+        """Снимает отметку (доставку не приняли, GitHub должен иметь возможность повторить)"""
+        if not delivery_id: return
+        self._seen.pop(delivery_id, None)
+        await database.unmark_delivery_seen(delivery_id)
+
+    async def start(self):
+        self._purge_task = asyncio.create_task(self._purge_loop())
+
+    async def stop(self):
+        # Дожидаемся отмены: очистка не должна писать в БД, которую сейчас закроют
+        if self._purge_task:
+            self._purge_task.cancel()
+            await asyncio.gather(self._purge_task, return_exceptions=True)
+            self._purge_task = None
+
+    async def _purge_loop(self):
+        while True:
+            try:
+                removed = await database.purge_seen_deliveries(time.time() - self.ttl)
+                if removed:
+                    logging.info(f"🧹 Purged {removed} old webhook delivery ids")
+            except Exception as e:
+                logging.error(f"Dedup purge failed: {e}")
+            await asyncio.sleep(WEBHOOK_DEDUP_PURGE_INTERVAL)
+
+    def stats(self):
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "cached_ids": len(self._seen),
+        }
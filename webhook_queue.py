@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+import database
+
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 4))
+# Порог, после которого этап считается медленным и пишется в лог
+WEBHOOK_SLOW_STAGE_MS = float(os.getenv("WEBHOOK_SLOW_STAGE_MS", 2000))
+# Как часто процесс бота забирает доставки, записанные веб-воркерами (RUN_MODE=split)
+WEBHOOK_POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", 0.2))
+
+class StageStats:
+    """Латентность одного этапа обработки (скользящее окно последних замеров)"""
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples = deque(maxlen=window)
+
+    def add(self, ms: float):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.samples.append(ms)
+
+    def percentile(self, p: float):
+        if not self.samples: return 0.0
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(len(ordered) * p))
+        return ordered[idx]
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.50), 2),
+            "p95_ms": round(self.percentile(0.95), 2),
+            "max_ms": round(self.max_ms, 2),
+        }
+
+class WebhookQueue:
+    """
+    Ограниченная очередь вебхуков. Каждая доставка сначала пишется в SQLite
+    (webhook_deliveries), а потом обрабатывается пулом воркеров.
+    handler: async def handler(event_type: str, body: bytes). Если он вернул awaitable
+    (отложенная обработка, например склейка пушей), строка удаляется только после него.
+
+    Если start() в этом процессе не вызывался, put() только пишет в таблицу —
+    её разбирает процесс бота, запущенный со start(poll=True).
+    """
+    def __init__(self, handler, maxsize: int = WEBHOOK_QUEUE_SIZE, workers: int = WEBHOOK_WORKERS):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize)
+        self._reserved = 0
+        self._tasks = []
+        self._acks = set()
+        self.local = False
+        self._shared_depth = (0, 0.0)
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.stages = {}
+
+    def record(self, stage: str, ms: float):
+        self.stages.setdefault(stage, StageStats()).add(ms)
+        if ms > WEBHOOK_SLOW_STAGE_MS:
+            logging.warning(f"🐢 Webhook stage '{stage}' took {ms:.0f} ms")
+
+    async def start(self, poll: bool = False):
+        """poll=True — доставки приходят из других процессов через таблицу"""
+        self.local = True
+        if poll:
+            self._tasks.append(asyncio.create_task(self._feeder()))
+        else:
+            # Поднимаем то, что не успели обработать до рестарта. Новые доставки put()
+            # сам кладет в очередь, поэтому берем только строки до текущего максимума
+            last_id = await database.last_delivery_id()
+            if last_id:
+                self._tasks.append(asyncio.create_task(self._restore(last_id)))
+
+        for n in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(n)))
+        logging.info(f"📮 Webhook queue started: {self.workers} workers, depth {self.maxsize}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def put(self, delivery_id: str, event_type: str, body: bytes) -> bool:
+        """Сохраняет доставку и ставит её в очередь. False, если очередь заполнена."""
+        if not self.local:
+            return await self._put_shared(delivery_id, event_type, body)
+
+        if self.queue.qsize() + self._reserved >= self.maxsize:
+            self.rejected += 1
+            return False
+
+        self._reserved += 1
+        try:
+            started = time.monotonic()
+            received_at = time.time()
+            row_id = await database.enqueue_delivery(delivery_id, event_type, body, received_at)
+            self.record("persist", (time.monotonic() - started) * 1000)
+        finally:
+            self._reserved -= 1
+
+        self.queue.put_nowait((row_id, event_type, body, received_at))
+        self.accepted += 1
+        return True
+
+    async def _put_shared(self, delivery_id: str, event_type: str, body: bytes) -> bool:
+        # Глубину общей очереди перечитываем не чаще раза в секунду
+        now = time.monotonic()
+        depth, checked_at = self._shared_depth
+        if now - checked_at > 1:
+            depth, checked_at = await database.count_pending_deliveries(), now
+        if depth >= self.maxsize:
+            self._shared_depth = (depth, checked_at)
+            self.rejected += 1
+            return False
+        self._shared_depth = (depth + 1, checked_at)
+
+        started = time.monotonic()
+        await database.enqueue_delivery(delivery_id, event_type, body, time.time())
+        self.record("persist", (time.monotonic() - started) * 1000)
+        self.accepted += 1
+        return True
+
+    async def _restore(self, up_to_id: int):
+        """Дочитывает бэклог из таблицы пачками, пока он не кончится, по мере освобождения очереди"""
+        after_id, restored = 0, 0
+        while True:
+            rows = await database.get_pending_deliveries(self.maxsize, after_id=after_id, up_to_id=up_to_id)
+            if not rows: break
+            for row in rows:
+                # Места, зарезервированные put(), не занимаем
+                while self.queue.qsize() + self._reserved >= self.maxsize:
+                    await asyncio.sleep(WEBHOOK_POLL_INTERVAL)
+                self.queue.put_nowait((row['id'], row['event_type'], row['body'], row['received_at']))
+                after_id = row['id']
+            restored += len(rows)
+        if restored:
+            logging.info(f"📥 Restored {restored} pending webhook deliveries")
+
+    async def _feeder(self):
+        """Забирает из таблицы доставки, записанные веб-воркерами"""
+        last_id = 0
+        while True:
+            try:
+                free = self.maxsize - self.queue.qsize()
+                if free > 0:
+                    rows = await database.get_pending_deliveries(free, after_id=last_id)
+                    for row in rows:
+                        self.queue.put_nowait((row['id'], row['event_type'], row['body'], row['received_at']))
+                        last_id = row['id']
+            except Exception as e:
+                logging.error(f"Webhook feeder: {e}")
+            await asyncio.sleep(WEBHOOK_POLL_INTERVAL)
+
+    async def _worker(self, n: int):
+        while True:
+            row_id, event_type, body, received_at = await self.queue.get()
+            try:
+                self.record("queue_wait", (time.time() - received_at) * 1000)
+                started = time.monotonic()
+                ack = None
+                try:
+                    ack = await self.handler(event_type, body)
+                    self.processed += 1
+                except Exception as e:
+                    self.failed += 1
+                    logging.error(f"Webhook worker {n} failed on delivery {row_id}: {e}")
+                self.record("process", (time.monotonic() - started) * 1000)
+                self.record("total", (time.time() - received_at) * 1000)
+                if ack is None:
+                    await database.delete_delivery(row_id)
+                else:
+                    # Воркер не ждет: строка остается в таблице, пока обработка не завершится
+                    task = asyncio.ensure_future(self._delete_after(row_id, ack))
+                    self._acks.add(task)
+                    task.add_done_callback(self._acks.discard)
+            except Exception as e:
+                logging.error(f"Webhook worker {n}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _delete_after(self, row_id: int, ack):
+        try:
+            await ack
+        except Exception as e:
+            logging.error(f"Deferred processing of delivery {row_id} failed: {e}")
+        await database.delete_delivery(row_id)
+
+    async def wait_acks(self):
+        """Дождаться удаления строк с отложенной обработкой (при остановке)"""
+        if self._acks:
+            await asyncio.gather(*self._acks, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "queue": {
+                "depth": self.queue.qsize(),
+                "awaiting_ack": len(self._acks),
+                "maxsize": self.maxsize,
+                "workers": self.workers,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "failed": self.failed,
+            },
+            "stages": {name: s.as_dict() for name, s in self.stages.items()},
+        }